@@ -1,96 +1,181 @@
-from diagrams import Diagram, Cluster
-from diagrams.aws.general import User
-from diagrams.onprem.compute import Server
-from diagrams.aws.network import InternetGateway, ELB, RouteTable
-from diagrams.aws.compute import EC2
-from diagrams.aws.storage import S3, EFS
-from diagrams.generic.blank import Blank
-from diagrams.custom import Custom
-
-with Diagram("Arq AWS", show=False, direction="BT", 
-             graph_attr={"splines": "ortho", "nodesep": "0.25", "ranksep": "3"}, node_attr={"fontsize": "17"}):
-
-    with Cluster(""):
-        usuario = User("Usuário")
-        admin = User("Admin\nSSH")
-
-    internet = Custom("Internet", "./internet.jpg", width="2", height="2", imagescale="true", fixedsize="true")
-
-    with Cluster("AWS", graph_attr={"bgcolor": "#FCF1E3", "color": "#F7981F", "fontsize": "25"}):
-
-        igw = InternetGateway("Internet Gateway", )
-
-        with Cluster("VPC", graph_attr={"bgcolor":"#dbe7f0", "fontsize": "25"}):
-            lb = ELB("Load Balancer")
-            
-            rt = Custom("Route Table", "./route_table.png")
-
-            with Cluster("Zona de Disponibilidade 1a", graph_attr={"fontsize": "17"}):
-                filler = Blank("", width="0.01", height="0.1")
-
-                with Cluster("Sub-rede Pública", graph_attr={"bgcolor":"#c6e9b3", "fontsize": "17"}):
-                    filler = Blank("", width="0.01", height="0.1")
-                    security_group = Custom("", "./security_group.png", width="0.7", height="0.7", imagescale="true", fixedsize="true")
-                    ec2_pub1 = Custom("", "./ec2.png")
-                    ebs = Custom("", "./EBS.png", width="1", height="1", imagescale="true", fixedsize="true")
-                    filler = Blank("", width="0.01")
-
-                with Cluster("Sub-rede Privada", graph_attr={"bgcolor":"#a3dcdd", "fontsize": "17"}):
-                    filler = Blank("", width="0.01", height="0.1")
-                    security = Custom("", "./security_group.png", width="0.7", height="0.7", imagescale="true", fixedsize="true")    
-                    ec2_priv1 = Custom("", "./ec2.png")
-                    ebs = Custom("", "./EBS.png", width="1", height="1", imagescale="true", fixedsize="true")
-                    filler = Blank("", width="0.01", height="0.1")
-
-            efs = EFS("EFS")
-
-            with Cluster("Zona de Disponibilidade 1c", graph_attr={"fontsize": "17"}):
-                filler = Blank("", width="0.01", height="0.1")
-
-                with Cluster("Sub-rede Pública", graph_attr={"bgcolor":"#c6e9b3", "fontsize": "17"}):
-                    filler = Blank("", width="0.01", height="0.1")
-                    security_group = Custom("", "./security_group.png", width="0.7", height="0.7", imagescale="true", fixedsize="true")
-                    ec2_pub2 = Custom("", "./ec2.png")
-                    ebs = Custom("", "./EBS.png", width="1", height="1", imagescale="true", fixedsize="true")
-                    filler = Blank("", width="0.01", height="0.1")
-
-                with Cluster("Sub-rede Privada", graph_attr={"bgcolor":"#a3dcdd", "fontsize": "17"}):
-                    filler = Blank("", width="0.01", height="0.1")
-                    security_group = Custom("", "./security_group.png", width="0.7", height="0.7", imagescale="true", fixedsize="true")
-                    ec2_priv2 = Custom("", "./ec2.png")
-                    ebs = Custom("", "./EBS.png", width="1", height="1", imagescale="true", fixedsize="true")
-                    filler = Blank("", width="0.01", height="0.1")
-
-            
-            with Cluster("Zona de Disponibilidade 1d", graph_attr={"fontsize": "17"}):
-                filler = Blank("", width="0.01", height="0.1")
-                with Cluster("Sub-rede Privada", graph_attr={"bgcolor":"#a3dcdd", "fontsize": "17"}):
-                    filler = Blank("", width="0.01", height="0.1")
-                    security_group = Custom("", "./security_group.png", width="0.7", height="0.7", imagescale="true", fixedsize="true")
-                    ec2_priv3 = Custom("", "./ec2.png")
-                    bd = Custom("", "./mysql.png", width="1.5", height="1.5", imagescale="true", fixedsize="true")
-                    filler = Blank("", width="0.01", height="0.1")
-
-        with Cluster("S3 Data Lake", graph_attr={"fontsize": "19"}):
-            raw = S3("Raw")
-            trusted = S3("Trusted")
-            curated = S3("Curated")                
-
-    usuario >> internet >> igw
-    admin >> internet >> igw 
-
-    igw >> lb
-
-    lb >> [ec2_pub1, ec2_pub2]
-
-    # ec2_pub1 >> efs
-    # ec2_pub2 >> efs
-
-    rt >> [ec2_pub1, ec2_pub2]
-
-    efs >> [ec2_pub1, ec2_pub2]
-
-    ec2_priv1 >> ec2_priv3
-    ec2_priv2 >> ec2_priv3     
-
-    ec2_pub1 >> raw
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import grafo_terraform
+
+# Diagramas da arquitetura gerados a partir do Terraform (IaC/main.tf e
+# Infra Dados/main_terraform/*.tf): o completo e um por subsistema (rede,
+# data lake, Lambdas e Glue), renderizados em paralelo. Cada diagrama só
+# passa pelo Graphviz quando o hash do que ele desenha muda; o cache fica em
+# .cache_diagramas.json. Mudanças só de comentário ou de formatação nos .tf,
+# ou em recursos de outro subsistema, não renderizam o diagrama de novo.
+#
+#   python arq.py                      # todos os diagramas
+#   python arq.py rede data_lake       # só os subsistemas pedidos
+#   python arq.py --forcar             # renderiza mesmo sem mudança
+
+diretorio_dac = os.path.dirname(os.path.abspath(__file__))
+arquivo_cache = os.path.join(diretorio_dac, '.cache_diagramas.json')
+formato_saida = 'png'
+
+atributos_diagrama = {
+    'direction': 'BT',
+    'graph_attr': {'splines': 'ortho', 'nodesep': '0.25', 'ranksep': '3'},
+    'node_attr': {'fontsize': '17'}
+}
+
+estilos_cluster = {
+    'aws': {'bgcolor': '#FCF1E3', 'color': '#F7981F', 'fontsize': '25'},
+    'vpc': {'bgcolor': '#dbe7f0', 'fontsize': '25'},
+    'az': {'fontsize': '17'},
+    'publica': {'bgcolor': '#c6e9b3', 'fontsize': '17'},
+    'privada': {'bgcolor': '#a3dcdd', 'fontsize': '17'},
+    'grupo': {'fontsize': '19'}
+}
+
+def imagem_local(icone):
+
+    return icone.endswith(('.png', '.jpg'))
+
+def hash_diagrama(descricao):
+    """
+    Hash do que o diagrama desenha: a descrição montada do Terraform, este
+    script (estilos e desenho) e as imagens usadas
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps(descricao, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    h.update(formato_saida.encode('utf-8'))
+    with open(os.path.abspath(__file__), 'rb') as f:
+        h.update(f.read())
+    for icone in sorted({no['icone'] for no in descricao['nos'] if imagem_local(no['icone'])}):
+        with open(os.path.join(diretorio_dac, icone), 'rb') as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+def ler_cache():
+
+    try:
+        with open(arquivo_cache, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def gravar_cache(cache):
+    """
+    Grava o cache de uma vez, para um processo interrompido não deixar o
+    arquivo pela metade
+    """
+    temporario = f"{arquivo_cache}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(temporario, arquivo_cache)
+
+def criar_no(no):
+
+    if imagem_local(no['icone']):
+        from diagrams.custom import Custom
+        return Custom(no['rotulo'], os.path.join(diretorio_dac, no['icone']), **no['atributos'])
+    modulo, classe = no['icone'].rsplit('.', 1)
+    return getattr(importlib.import_module(modulo), classe)(no['rotulo'], **no['atributos'])
+
+def renderizar(descricao, diretorio_saida):
+    """
+    Desenha um diagrama a partir da descrição. Cada thread tem o próprio
+    contexto do diagrams, então vários podem ser renderizados ao mesmo tempo.
+    """
+    from diagrams import Cluster, Diagram
+
+    filhos = {}
+    for chave, cluster in descricao['clusters'].items():
+        filhos.setdefault(cluster['pai'], []).append(chave)
+    nos_por_cluster = {}
+    for no in descricao['nos']:
+        nos_por_cluster.setdefault(no['cluster'], []).append(no)
+    criados = {}
+
+    def desenhar(chave):
+        for no in nos_por_cluster.get(chave, []):
+            criados[no['id']] = criar_no(no)
+        for filho in sorted(filhos.get(chave, [])):
+            cluster = descricao['clusters'][filho]
+            with Cluster(cluster['rotulo'], graph_attr=estilos_cluster[cluster['estilo']]):
+                desenhar(filho)
+
+    inicio = time.perf_counter()
+    with Diagram(
+        descricao['titulo'],
+        filename=os.path.join(diretorio_saida, descricao['arquivo']),
+        outformat=formato_saida,
+        show=False,
+        **atributos_diagrama
+    ):
+        desenhar(None)
+        for origem, destino in descricao['arestas']:
+            criados[origem] >> criados[destino]
+    return time.perf_counter() - inicio
+
+def gerar_diagramas(nomes=None, diretorio_saida=diretorio_dac, forcar=False, paralelismo=4):
+    """
+    Renderiza os diagramas pedidos que mudaram desde a última execução.
+    Retorna {nome: segundos de render, ou None se veio do cache}.
+    """
+    nomes = nomes or list(grafo_terraform.subsistemas)
+    grafo = grafo_terraform.montar_grafo()
+    cache = ler_cache()
+
+    pendentes = {}
+    resultado = {}
+    for nome in nomes:
+        descricao = grafo_terraform.descrever_subsistema(grafo, nome)
+        saida = os.path.join(diretorio_saida, f"{descricao['arquivo']}.{formato_saida}")
+        chave_cache = os.path.relpath(saida, diretorio_dac)
+        hash_atual = hash_diagrama(descricao)
+        if not forcar and cache.get(chave_cache) == hash_atual and os.path.exists(saida):
+            print(f"{nome}: sem mudanças, {os.path.basename(saida)} mantido")
+            resultado[nome] = None
+        else:
+            pendentes[nome] = (descricao, saida, chave_cache, hash_atual)
+
+    erros = []
+    with ThreadPoolExecutor(max_workers=max(1, paralelismo)) as executor:
+        futuros = {
+            nome: executor.submit(renderizar, descricao, diretorio_saida)
+            for nome, (descricao, _, _, _) in pendentes.items()
+        }
+        for nome, futuro in futuros.items():
+            descricao, saida, chave_cache, hash_atual = pendentes[nome]
+            try:
+                resultado[nome] = futuro.result()
+                cache[chave_cache] = hash_atual
+                print(f"{nome}: {os.path.basename(saida)} renderizado em {resultado[nome]:.2f}s "
+                      f"({len(descricao['nos'])} nós, {len(descricao['arestas'])} arestas)")
+            except Exception as e:
+                erros.append(f"{nome}: {e}")
+
+    # Os diagramas que deram certo ficam no cache mesmo se outro falhou
+    if pendentes:
+        gravar_cache(cache)
+    if erros:
+        error_msg = f"Erro ao renderizar os diagramas: {'; '.join(erros)}"
+        print(error_msg)
+        raise Exception(error_msg)
+    return resultado
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera os diagramas da arquitetura a partir do Terraform")
+    parser.add_argument('subsistemas', nargs='*',
+                        help=f"Diagramas a gerar, entre {', '.join(grafo_terraform.subsistemas)} (padrão: todos)")
+    parser.add_argument('--forcar', action='store_true', help="Renderiza mesmo sem mudança no Terraform")
+    parser.add_argument('--saida', default=diretorio_dac, help="Diretório das imagens")
+    parser.add_argument('--paralelismo', type=int, default=4, help="Diagramas renderizados ao mesmo tempo")
+    args = parser.parse_args()
+    desconhecidos = [nome for nome in args.subsistemas if nome not in grafo_terraform.subsistemas]
+    if desconhecidos:
+        parser.error(f"subsistemas desconhecidos: {', '.join(desconhecidos)}")
+
+    gerar_diagramas(args.subsistemas, args.saida, args.forcar, args.paralelismo)
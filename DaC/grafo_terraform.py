@@ -0,0 +1,565 @@
+import glob
+import os
+import re
+
+# Grafo de recursos lido dos arquivos Terraform do projeto, usado pelo arq.py
+# para montar os diagramas. Cada recurso (ou cada instância de um for_each
+# com chaves conhecidas) vira um nó, e as referências entre eles (tipo.nome,
+# nomes de bucket citados em ARNs e caminhos s3://) viram arestas. O parser
+# cobre só o que os .tf do projeto usam: blocos resource/data/variable,
+# atributos de texto simples e referências; não depende do diagrams.
+
+diretorio_raiz = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Cada raiz Terraform é um projeto separado: as referências só valem dentro dele
+arquivos_terraform = {
+    'IaC': [os.path.join(diretorio_raiz, 'IaC', 'main.tf')],
+    'Infra Dados': sorted(glob.glob(os.path.join(diretorio_raiz, 'Infra Dados', 'main_terraform', '*.tf')))
+}
+
+# Tipos desenhados e o ícone de cada um: classe do diagrams ou imagem do DaC
+icones = {
+    'aws_internet_gateway': 'diagrams.aws.network.InternetGateway',
+    'aws_nat_gateway': 'diagrams.aws.network.NATGateway',
+    'aws_route_table': 'route_table.png',
+    'aws_instance': 'ec2.png',
+    'aws_ecs_service': 'diagrams.aws.compute.ElasticContainerServiceService',
+    'aws_s3_bucket': 'diagrams.aws.storage.S3',
+    'aws_sqs_queue': 'diagrams.aws.integration.SQS',
+    'aws_lambda_function': 'diagrams.aws.compute.Lambda',
+    'aws_glue_catalog_database': 'diagrams.aws.analytics.GlueDataCatalog',
+    'aws_glue_catalog_table': 'diagrams.aws.analytics.Glue',
+    'aws_athena_workgroup': 'diagrams.aws.analytics.Athena'
+}
+
+# Sentido das arestas entre tipos diferentes: do tipo que vem antes nesta
+# lista para o que vem depois (por onde o tráfego ou os dados passam)
+ordem_fluxo = [
+    'aws_internet_gateway',
+    'aws_route_table',
+    'aws_nat_gateway',
+    'aws_instance',
+    'aws_ecs_service',
+    'aws_s3_bucket',
+    'aws_sqs_queue',
+    'aws_lambda_function',
+    'aws_glue_catalog_database',
+    'aws_glue_catalog_table',
+    'aws_athena_workgroup'
+]
+
+# Recursos que não aparecem no diagrama, só ligam os que aparecem
+# (o gatilho de um bucket liga o bucket à Lambda, por exemplo)
+conectores = {
+    'aws_s3_bucket_notification',
+    'aws_lambda_event_source_mapping',
+    'aws_lambda_permission',
+    'aws_route_table_association'
+}
+
+# Ícones extras desenhados ao lado de uma instância conforme o compose que ela sobe
+servicos_instancia = {
+    'Docker/Database/': ('mysql.png', {'width': '1.5', 'height': '1.5', 'imagescale': 'true', 'fixedsize': 'true'})
+}
+
+# Diagramas gerados: o completo e um por subsistema. tipos=None desenha todos.
+subsistemas = {
+    'completo': {
+        'titulo': 'Arq AWS',
+        'arquivo': 'arq_aws',
+        'tipos': None
+    },
+    'rede': {
+        'titulo': 'Arq AWS - Rede',
+        'arquivo': 'arq_aws_rede',
+        'tipos': {'aws_internet_gateway', 'aws_nat_gateway', 'aws_route_table', 'aws_instance', 'aws_ecs_service'}
+    },
+    'data_lake': {
+        'titulo': 'Arq AWS - Data Lake',
+        'arquivo': 'arq_aws_data_lake',
+        'tipos': {'aws_s3_bucket', 'aws_glue_catalog_database', 'aws_athena_workgroup'}
+    },
+    'processamento': {
+        'titulo': 'Arq AWS - Lambdas e Glue',
+        'arquivo': 'arq_aws_processamento',
+        'tipos': {'aws_s3_bucket', 'aws_sqs_queue', 'aws_lambda_function', 'aws_glue_catalog_database', 'aws_glue_catalog_table'}
+    }
+}
+
+cabecalho_bloco = re.compile(r'^(resource|data|variable)\s+((?:"[^"]*"\s*)+)\{', re.M)
+referencia = re.compile(r'\b(data\.)?(aws_\w+)\.(\w+)(?:\[\s*("?)([^\]"]*)\4\s*\])?')
+
+def remover_comentarios(texto):
+    """
+    Troca os comentários (#, // e /* */) por espaços, preservando as
+    strings e as quebras de linha
+    """
+    saida = []
+    i = 0
+    em_string = False
+    while i < len(texto):
+        c = texto[i]
+        if em_string:
+            if c == '\\':
+                saida.append(texto[i:i + 2])
+                i += 2
+                continue
+            em_string = c != '"'
+            saida.append(c)
+            i += 1
+        elif c == '"':
+            em_string = True
+            saida.append(c)
+            i += 1
+        elif c == '#' or texto.startswith('//', i) or texto.startswith('/*', i):
+            if c == '/' and texto.startswith('/*', i):
+                fim = texto.find('*/', i + 2)
+                fim = len(texto) if fim < 0 else fim + 2
+            else:
+                fim = texto.find('\n', i)
+                fim = len(texto) if fim < 0 else fim
+            saida.append(re.sub(r'[^\n]', ' ', texto[i:fim]))
+            i = fim
+        else:
+            saida.append(c)
+            i += 1
+    return ''.join(saida)
+
+def fim_do_bloco(texto, inicio):
+    """
+    Posição logo depois da chave que fecha a aberta em `inicio`
+    """
+    profundidade = 0
+    em_string = False
+    i = inicio
+    while i < len(texto):
+        c = texto[i]
+        if em_string:
+            if c == '\\':
+                i += 1
+            elif c == '"':
+                em_string = False
+        elif c == '"':
+            em_string = True
+        elif c == '{':
+            profundidade += 1
+        elif c == '}':
+            profundidade -= 1
+            if profundidade == 0:
+                return i + 1
+        i += 1
+    return -1
+
+def blocos_terraform(texto, arquivo):
+    """
+    Blocos resource, data e variable de topo de um .tf já sem comentários
+    """
+    blocos = []
+    for m in cabecalho_bloco.finditer(texto):
+        rotulos = re.findall(r'"([^"]*)"', m.group(2))
+        fim = fim_do_bloco(texto, m.end() - 1)
+        if fim < 0:
+            raise ValueError(f"Bloco {m.group(1)} {rotulos} sem fechamento em {arquivo}")
+        blocos.append({
+            'categoria': m.group(1),
+            'tipo': rotulos[0] if m.group(1) != 'variable' else None,
+            'nome': rotulos[-1],
+            'corpo': texto[m.end():fim - 1],
+            'arquivo': arquivo
+        })
+    return blocos
+
+def atributos_topo(corpo):
+    """
+    Atributos do primeiro nível do bloco -> expressão (só a primeira linha)
+    """
+    nivel = []
+    profundidade = 0
+    em_string = False
+    for c in corpo:
+        if em_string:
+            em_string = c != '"'
+        elif c == '"':
+            em_string = True
+        elif c == '{':
+            profundidade += 1
+        elif c == '}':
+            profundidade -= 1
+        if profundidade == 0 or (c == '{' and profundidade == 1):
+            nivel.append(c)
+    return dict(re.findall(r'^\s*(\w+)\s*=\s*(.*?)\s*$', ''.join(nivel), re.M))
+
+def valor_texto(expressao, variaveis):
+    """
+    Valor de uma expressão que é um texto literal ou var.<nome> com padrão
+    em texto; None para o resto
+    """
+    if expressao is None:
+        return None
+    m = re.fullmatch(r'"([^"$]*)"', expressao)
+    if m:
+        return m.group(1)
+    m = re.fullmatch(r'var\.(\w+)', expressao)
+    if m and isinstance(variaveis.get(m.group(1)), str):
+        return variaveis[m.group(1)]
+    return None
+
+def valor_padrao(corpo):
+    """
+    Padrão de uma variável: lista de textos, texto ou None
+    """
+    m = re.search(r'^\s*default\s*=\s*\[([^\]]*)\]', corpo, re.M)
+    if m:
+        return re.findall(r'"([^"]*)"', m.group(1))
+    return valor_texto(atributos_topo(corpo).get('default'), {})
+
+def chaves_for_each(expressao, variaveis):
+    """
+    Chaves de um for_each sobre uma lista literal ou uma variável com
+    padrão; None quando só se sabem no plan (locals, fileset, ...)
+    """
+    if expressao is None:
+        return None
+    m = re.fullmatch(r'toset\((.*)\)', expressao)
+    expressao = m.group(1).strip() if m else expressao
+    if expressao.startswith('['):
+        return re.findall(r'"([^"]*)"', expressao)
+    m = re.fullmatch(r'var\.(\w+)', expressao)
+    if m and isinstance(variaveis.get(m.group(1)), list):
+        return variaveis[m.group(1)]
+    return None
+
+def substituir_each(corpo, chave):
+
+    corpo = corpo.replace('${each.key}', chave).replace('${each.value}', chave)
+    return re.sub(r'\beach\.(key|value)\b', f'"{chave}"', corpo)
+
+def novo_recurso(projeto, bloco, chave, corpo, variaveis):
+
+    endereco = f"{'data.' if bloco['categoria'] == 'data' else ''}{bloco['tipo']}.{bloco['nome']}"
+    atributos = atributos_topo(corpo)
+    tag_nome = re.search(r'\btags\s*=\s*\{[^{}]*?\bName\s*=\s*"([^"$]*)"', corpo)
+    nome_aws = next(
+        (valor for valor in (valor_texto(atributos.get(a), variaveis) for a in ('name', 'function_name', 'bucket')) if valor),
+        None
+    )
+    return {
+        'id': f"{projeto}:{endereco}" + (f'["{chave}"]' if chave is not None else ''),
+        'projeto': projeto,
+        'endereco': endereco,
+        'categoria': bloco['categoria'],
+        'tipo': bloco['tipo'],
+        'nome': bloco['nome'],
+        'chave': chave,
+        'arquivo': bloco['arquivo'],
+        'corpo': corpo,
+        'textos': {a: valor_texto(e, variaveis) for a, e in atributos.items()},
+        'rotulo': tag_nome.group(1) if tag_nome else nome_aws or (chave if chave is not None else bloco['nome'])
+    }
+
+def ler_projeto(projeto, arquivos):
+    """
+    Recursos de uma raiz Terraform, com os for_each de chaves conhecidas
+    expandidos em uma instância por chave
+    """
+    blocos = []
+    for arquivo in arquivos:
+        with open(arquivo, encoding='utf-8') as f:
+            blocos.extend(blocos_terraform(remover_comentarios(f.read()), arquivo))
+
+    variaveis = {b['nome']: valor_padrao(b['corpo']) for b in blocos if b['categoria'] == 'variable'}
+    recursos = []
+    for bloco in blocos:
+        if bloco['categoria'] == 'variable':
+            continue
+        chaves = chaves_for_each(atributos_topo(bloco['corpo']).get('for_each'), variaveis)
+        if chaves is None:
+            recursos.append(novo_recurso(projeto, bloco, None, bloco['corpo'], variaveis))
+        else:
+            recursos.extend(
+                novo_recurso(projeto, bloco, chave, substituir_each(bloco['corpo'], chave), variaveis)
+                for chave in chaves
+            )
+    return recursos
+
+def resolver_referencias(recurso, enderecos, buckets):
+    """
+    Preenche refs (o que o recurso usa) e dependencias (o depends_on)
+    com os ids dos recursos citados
+    """
+    def alvos(texto):
+        ids = set()
+        for m in referencia.finditer(texto):
+            candidatos = enderecos.get((recurso['projeto'], f"{m.group(1) or ''}{m.group(2)}.{m.group(3)}"), [])
+            chave = m.group(5)
+            por_chave = [i for i in candidatos if chave and i.endswith(f'["{chave}"]')]
+            ids.update(por_chave or candidatos)
+        ids.discard(recurso['id'])
+        return ids
+
+    depends_on = re.search(r'^\s*depends_on\s*=\s*\[([^\]]*)\]', recurso['corpo'], re.M)
+    corpo = recurso['corpo']
+    if depends_on:
+        corpo = corpo[:depends_on.start()] + corpo[depends_on.end():]
+    recurso['dependencias'] = alvos(depends_on.group(1)) if depends_on else set()
+    recurso['refs'] = alvos(corpo) | {
+        id_bucket for nome, id_bucket in buckets.items()
+        if id_bucket != recurso['id'] and re.search(rf'(?<![\w.-]){re.escape(nome)}(?![\w.-])', corpo)
+    }
+
+def montar_grafo(arquivos=None):
+    """
+    Todos os recursos dos projetos, indexados pelo id
+    (<projeto>:<tipo>.<nome>[<chave>]), com as referências resolvidas
+    """
+    grafo = {}
+    for projeto, lista in (arquivos or arquivos_terraform).items():
+        for recurso in ler_projeto(projeto, lista):
+            grafo[recurso['id']] = recurso
+
+    enderecos = {}
+    for recurso in grafo.values():
+        enderecos.setdefault((recurso['projeto'], recurso['endereco']), []).append(recurso['id'])
+    buckets = {
+        recurso['textos']['bucket']: recurso['id'] for recurso in grafo.values()
+        if recurso['tipo'] == 'aws_s3_bucket' and recurso['textos'].get('bucket')
+    }
+    for recurso in grafo.values():
+        resolver_referencias(recurso, enderecos, buckets)
+    return grafo
+
+def referencias_do_tipo(grafo, recurso, tipo):
+
+    return sorted(i for i in recurso['refs'] if grafo[i]['tipo'] == tipo)
+
+def vpc_de(grafo, recurso):
+    """
+    VPC do recurso, direto ou pela sub-rede / security group que ele usa
+    """
+    for i in [recurso['id']] + sorted(recurso['refs']):
+        vpcs = referencias_do_tipo(grafo, grafo[i], 'aws_vpc')
+        if vpcs:
+            return vpcs[0]
+    return None
+
+def subrede_publica(grafo, id_subrede):
+    """
+    Sub-rede associada a uma route table com rota para o Internet Gateway
+    """
+    for recurso in grafo.values():
+        if recurso['tipo'] != 'aws_route_table_association' or id_subrede not in recurso['refs']:
+            continue
+        for id_tabela in referencias_do_tipo(grafo, recurso, 'aws_route_table'):
+            if referencias_do_tipo(grafo, grafo[id_tabela], 'aws_internet_gateway'):
+                return True
+    return False
+
+class Clusters:
+    """
+    Árvore de clusters do diagrama: chave -> rótulo, estilo e cluster pai
+    """
+
+    def __init__(self, grafo):
+        self.grafo = grafo
+        self.clusters = {}
+
+    def adicionar(self, chave, rotulo, estilo, pai):
+        self.clusters.setdefault(chave, {'rotulo': rotulo, 'estilo': estilo, 'pai': pai})
+        return chave
+
+    def aws(self):
+        return self.adicionar('aws', 'AWS', 'aws', None)
+
+    def vpc(self, id_vpc):
+        if id_vpc is None:
+            return self.aws()
+        return self.adicionar(id_vpc, f"VPC {self.grafo[id_vpc]['rotulo']}", 'vpc', self.aws())
+
+    def subrede(self, id_subrede):
+        subrede = self.grafo[id_subrede]
+        id_vpc = vpc_de(self.grafo, subrede)
+        zona = subrede['textos'].get('availability_zone')
+        chave_zona = self.adicionar(
+            f"{id_vpc}|{zona or ''}",
+            f"Zona de Disponibilidade {zona or 'padrão'}",
+            'az',
+            self.vpc(id_vpc)
+        )
+        publica = subrede_publica(self.grafo, id_subrede)
+        return self.adicionar(
+            id_subrede,
+            f"Sub-rede {'Pública' if publica else 'Privada'}\n{subrede['rotulo']}",
+            'publica' if publica else 'privada',
+            chave_zona
+        )
+
+    def de(self, recurso):
+        """
+        Cluster em que o recurso é desenhado
+        """
+        grafo = self.grafo
+        tipo = recurso['tipo']
+        if tipo in ('aws_instance', 'aws_nat_gateway'):
+            subredes = referencias_do_tipo(grafo, recurso, 'aws_subnet')
+            return self.subrede(subredes[0]) if subredes else self.vpc(vpc_de(grafo, recurso))
+        if tipo == 'aws_route_table':
+            return self.vpc(vpc_de(grafo, recurso))
+        if tipo == 'aws_ecs_service':
+            pai = self.vpc(vpc_de(grafo, recurso))
+            ecs = referencias_do_tipo(grafo, recurso, 'aws_ecs_cluster')
+            return self.adicionar(ecs[0], f"ECS {grafo[ecs[0]]['rotulo']}", 'grupo', pai) if ecs else pai
+        if tipo == 'aws_s3_bucket':
+            return self.adicionar('aws|s3', 'S3', 'grupo', self.aws())
+        if tipo in ('aws_glue_catalog_database', 'aws_glue_catalog_table'):
+            bancos = [recurso['id']] if tipo == 'aws_glue_catalog_database' else \
+                referencias_do_tipo(grafo, recurso, 'aws_glue_catalog_database')
+            if bancos:
+                return self.adicionar(bancos[0], f"Glue Data Catalog\n{grafo[bancos[0]]['rotulo']}", 'grupo', self.aws())
+        return self.aws()
+
+def no_pai(grafo, recurso):
+    """
+    Nó que representa o recurso quando o tipo dele não é desenhado
+    (a tabela do Glue vira o banco dela no diagrama do data lake)
+    """
+    if recurso['tipo'] == 'aws_glue_catalog_table':
+        bancos = referencias_do_tipo(grafo, recurso, 'aws_glue_catalog_database')
+        return bancos[0] if bancos else None
+    return None
+
+def orientar(grafo, origem, destino):
+    """
+    Aresta no sentido de ordem_fluxo; entre recursos do mesmo tipo, de quem
+    referencia para quem é referenciado
+    """
+    posicao_origem = ordem_fluxo.index(grafo[origem]['tipo'])
+    posicao_destino = ordem_fluxo.index(grafo[destino]['tipo'])
+    return (destino, origem) if posicao_destino < posicao_origem else (origem, destino)
+
+def arestas_do_grafo(grafo, visiveis, clusters):
+    """
+    Arestas entre os recursos desenhados: referências diretas e as ligações
+    feitas pelos conectores. Um conector que cita uma sub-rede liga os
+    recursos dentro dela.
+    """
+    membros = {}
+    for id_recurso in visiveis:
+        chave = clusters.de(grafo[id_recurso])
+        while chave is not None:
+            membros.setdefault(chave, set()).add(id_recurso)
+            chave = clusters.clusters[chave]['pai']
+
+    arestas = set()
+    for recurso in grafo.values():
+        if recurso['tipo'] in conectores:
+            diretos = sorted(i for i in recurso['refs'] if i in visiveis)
+            dentro = sorted(set().union(*(membros.get(i, set()) for i in recurso['refs'])) - set(diretos))
+            pares = [(a, b) for n, a in enumerate(diretos) for b in diretos[n + 1:]]
+            pares += [(a, b) for a in diretos for b in dentro]
+        elif recurso['id'] in visiveis:
+            pai = no_pai(grafo, recurso)
+            pares = [
+                (recurso['id'], alvo) for alvo in sorted(recurso['refs'] | recurso['dependencias'])
+                if alvo in visiveis and alvo != pai
+            ]
+        else:
+            continue
+        arestas.update(orientar(grafo, a, b) for a, b in pares)
+    return arestas
+
+def nos_anexos(grafo, recurso, cluster):
+    """
+    Ícones desenhados junto de uma instância: security groups, o volume EBS
+    e o serviço que ela sobe
+    """
+    anexos = [
+        {
+            'id': f"{id_sg}#{recurso['id']}",
+            'rotulo': '',
+            'icone': 'security_group.png',
+            'cluster': cluster,
+            'atributos': {'width': '0.7', 'height': '0.7', 'imagescale': 'true', 'fixedsize': 'true'}
+        }
+        for id_sg in referencias_do_tipo(grafo, recurso, 'aws_security_group')
+    ]
+    anexos.append({
+        'id': f"{recurso['id']}#ebs",
+        'rotulo': '',
+        'icone': 'EBS.png',
+        'cluster': cluster,
+        'atributos': {'width': '1', 'height': '1', 'imagescale': 'true', 'fixedsize': 'true'}
+    })
+    for trecho, (icone, atributos) in servicos_instancia.items():
+        if trecho in recurso['corpo']:
+            anexos.append({
+                'id': f"{recurso['id']}#{icone}",
+                'rotulo': '',
+                'icone': icone,
+                'cluster': cluster,
+                'atributos': atributos
+            })
+    return anexos
+
+def nos_externos(arestas, id_igw):
+    """
+    Usuários e a Internet chegando ao Internet Gateway, que não estão no Terraform
+    """
+    nos = [
+        {'id': 'externo#usuario', 'rotulo': 'Usuário', 'icone': 'diagrams.aws.general.User', 'cluster': 'externo#usuarios', 'atributos': {}},
+        {'id': 'externo#admin', 'rotulo': 'Admin\nSSH', 'icone': 'diagrams.aws.general.User', 'cluster': 'externo#usuarios', 'atributos': {}},
+        {
+            'id': 'externo#internet',
+            'rotulo': 'Internet',
+            'icone': 'internet.jpg',
+            'cluster': None,
+            'atributos': {'width': '2', 'height': '2', 'imagescale': 'true', 'fixedsize': 'true'}
+        }
+    ]
+    arestas.update({('externo#usuario', 'externo#internet'), ('externo#admin', 'externo#internet'), ('externo#internet', id_igw)})
+    return nos
+
+def descrever_subsistema(grafo, nome):
+    """
+    Descrição do diagrama de um subsistema (clusters, nós e arestas) em
+    estruturas simples e ordenadas, que o arq.py desenha e usa no hash
+    """
+    subsistema = subsistemas[nome]
+    clusters = Clusters(grafo)
+    visiveis = {i for i, recurso in grafo.items() if recurso['tipo'] in icones and recurso['categoria'] == 'resource'}
+    arestas_todas = arestas_do_grafo(grafo, visiveis, clusters)
+
+    # Um recurso de tipo fora do subsistema aparece pelo nó pai, se houver
+    incluidos = {i for i in visiveis if subsistema['tipos'] is None or grafo[i]['tipo'] in subsistema['tipos']}
+    def representante(id_recurso):
+        while id_recurso is not None and id_recurso not in incluidos:
+            id_recurso = no_pai(grafo, grafo[id_recurso])
+        return id_recurso
+
+    arestas = set()
+    for origem, destino in arestas_todas:
+        origem, destino = representante(origem), representante(destino)
+        if origem is not None and destino is not None and origem != destino:
+            arestas.add((origem, destino))
+
+    clusters = Clusters(grafo)
+    nos = []
+    for id_recurso in sorted(incluidos):
+        recurso = grafo[id_recurso]
+        cluster = clusters.de(recurso)
+        nos.append({'id': id_recurso, 'rotulo': recurso['rotulo'], 'icone': icones[recurso['tipo']], 'cluster': cluster, 'atributos': {}})
+        if recurso['tipo'] == 'aws_instance':
+            nos.extend(nos_anexos(grafo, recurso, cluster))
+        if recurso['tipo'] == 'aws_internet_gateway':
+            externos = nos_externos(arestas, id_recurso)
+            if 'externo#usuarios' not in clusters.clusters:
+                clusters.adicionar('externo#usuarios', '', 'grupo', None)
+                nos.extend(externos)
+
+    return {
+        'nome': nome,
+        'titulo': subsistema['titulo'],
+        'arquivo': subsistema['arquivo'],
+        'clusters': clusters.clusters,
+        'nos': sorted(nos, key=lambda no: no['id']),
+        'arestas': sorted([origem, destino] for origem, destino in arestas)
+    }
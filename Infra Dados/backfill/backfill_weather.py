@@ -0,0 +1,297 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda_python'))
+
+import comum_lambdas as comum
+import tratamento_base as tb
+import tratamento_para_client as client
+
+# Arquivos em andamento ao mesmo tempo (download, transformação e upload).
+# Limita também a memória: cada arquivo em andamento fica inteiro em memória.
+concorrencia_padrao = int(os.environ.get('BACKFILL_CONCORRENCIA', str(os.cpu_count() or 2)))
+processos_padrao = int(os.environ.get('BACKFILL_PROCESSOS', str(os.cpu_count() or 2)))
+
+# Threads em que as mensagens das funções das Lambdas são descartadas
+_silencio = threading.local()
+
+class SaidaPorThread(io.TextIOBase):
+    """
+    stdout que descarta o que as threads em modo silencioso escrevem. As
+    funções das Lambdas imprimem o andamento de cada arquivo; no backfill
+    só as linhas de status e o relatório da thread principal aparecem.
+    Diferente do redirect_stdout, não troca o stdout de outras threads.
+    """
+    def __init__(self, saida):
+        self.saida = saida
+
+    def write(self, texto):
+        if getattr(_silencio, 'ativo', False):
+            return len(texto)
+        return self.saida.write(texto)
+
+    def flush(self):
+        self.saida.flush()
+
+def instalar_saida():
+
+    if not isinstance(sys.stdout, SaidaPorThread):
+        sys.stdout = SaidaPorThread(sys.stdout)
+
+@contextlib.contextmanager
+def silencioso():
+    """
+    Descarta as mensagens impressas pela thread atual dentro do bloco
+    """
+    anterior = getattr(_silencio, 'ativo', False)
+    _silencio.ativo = True
+    try:
+        yield
+    finally:
+        _silencio.ativo = anterior
+
+def iniciar_worker(estacoes, formato_saida):
+    """
+    Cada processo do pool usa as mesmas estações e formato do processo principal
+    """
+    instalar_saida()
+    tb.estacoes = estacoes
+    tb.formato_saida = formato_saida
+
+def listar_arquivos_raw(bucket, prefixos):
+    """
+    Keys .csv do bucket raw sob cada prefixo, sem repetir e em ordem
+    """
+    paginator = tb.s3_client.get_paginator('list_objects_v2')
+    chaves = set()
+    for prefixo in prefixos:
+        for pagina in paginator.paginate(Bucket=bucket, Prefix=prefixo):
+            for obj in pagina.get('Contents', []):
+                if obj['Key'].lower().endswith('.csv'):
+                    chaves.add(obj['Key'])
+    return sorted(chaves)
+
+def baixar_objeto(bucket, key):
+    with silencioso():
+        response = tb.obter_objeto_s3(bucket, key)
+    return response['Body'].read()
+
+def transformar_arquivo(conteudo):
+    """
+    Parte CPU do processamento de um arquivo, executada no pool de processos.
+    Usa as mesmas funções da Lambda trusted e devolve o conteúdo pronto para
+    gravar, a agregação parcial do client e a validação de qualidade. Sem
+    nenhuma linha válida das estações, devolve só a validação (linhas = 0).
+    """
+    with silencioso():
+        df = tb.ler_csv_raw(io.BytesIO(conteudo))
+        # No modo enxuto o transformar_dados consome o DataFrame lido
+        resultado = {'linhas_raw': len(df)}
+        qualidade = tb.nova_qualidade()
+        final_df, temp_df = tb.transformar_dados(df, qualidade)
+        resultado.update({'linhas': len(final_df), 'qualidade': qualidade})
+        if final_df.empty:
+            return resultado
+
+        resultado['colunas'] = len(final_df.columns)
+        resultado['parcial'] = tb.agregar_para_client(temp_df)
+        if tb.formato_saida == 'parquet':
+            resultado['parquet'] = tb.preparar_dados_parquet(temp_df)
+        else:
+            buffer = io.BytesIO()
+            texto = io.TextIOWrapper(buffer, encoding='utf-8', newline='')
+            final_df.to_csv(texto, **tb.opcoes_csv_trusted())
+            texto.flush()
+            texto.detach()
+            resultado['csv'] = buffer.getvalue()
+    return resultado
+
+def gravar_trusted(key, resultado):
+    """
+    Grava o trusted no mesmo formato, key e metadata da Lambda trusted,
+    com as linhas rejeitadas na quarentena
+    """
+    with silencioso():
+        tb.salvar_quarentena_s3(resultado['qualidade'], key)
+        if resultado['linhas'] == 0:
+            return
+        if tb.formato_saida == 'parquet':
+            nome_base = comum.nome_base_arquivo(key)
+            tb.limpar_particoes_s3(tb.nome_bucket_trusted, tb.prefixo_parquet, nome_base)
+            tb.salvar_parquet_particionado_s3(
+                resultado['parquet'],
+                tb.nome_bucket_trusted,
+                tb.prefixo_parquet,
+                nome_base,
+                tb.colunas_particao
+            )
+            tb.marcar_conclusao_s3(tb.nome_bucket_trusted, tb.prefixo_parquet, nome_base)
+            return
+
+        escritor = comum.EscritorMultipartS3(
+            tb.s3_client,
+            tb.medidor,
+            tb.nome_bucket_trusted,
+            key,
+            metadata={
+                'rows': str(resultado['linhas']),
+                'columns': str(resultado['colunas']),
+                'processed-date': datetime.now().isoformat()
+            }
+        )
+        try:
+            dados = memoryview(resultado['csv'])
+            for inicio in range(0, len(dados), comum.tamanho_parte_upload):
+                escritor.write(dados[inicio:inicio + comum.tamanho_parte_upload])
+            escritor.finalizar()
+        except Exception:
+            escritor.abort()
+            raise
+
+def gravar_client(key, parcial):
+    """
+    Client de um único arquivo, igual ao gerado pela Lambda client para ele
+    """
+    with silencioso():
+        client.publicar_medias_de_parcial(parcial, tb.nome_bucket_trusted, tb.chave_trusted_para_client(key))
+
+def gravar_client_incremental(parciais):
+    """
+    No modo com estado, mescla todos os arquivos do backfill no estado de
+    uma vez: uma leitura e regravação do estado inteiro, em vez de uma por
+    arquivo disputando a escrita condicional
+    """
+    with silencioso():
+        return client.publicar_medias_de_parciais(parciais)
+
+async def processar_arquivo(bucket, key, semaforo, pool, executor_io, gerar_client, parciais):
+    """
+    Baixa, transforma e grava um arquivo. Downloads e uploads rodam em
+    threads e a transformação no pool de processos, então o I/O de um
+    arquivo acontece enquanto outros estão sendo transformados.
+    """
+    loop = asyncio.get_running_loop()
+    async with semaforo:
+        inicio = time.perf_counter()
+        try:
+            conteudo = await loop.run_in_executor(executor_io, baixar_objeto, bucket, key)
+            resultado = await loop.run_in_executor(pool, transformar_arquivo, conteudo)
+            del conteudo
+
+            await loop.run_in_executor(executor_io, gravar_trusted, key, resultado)
+            qualidade = tb.resumo_qualidade(resultado['qualidade'])
+            if resultado['linhas'] == 0:
+                print(f"{key}: nenhuma linha válida das estações selecionadas")
+                return {'key': key, 'status': 'vazio', 'linhas_raw': resultado['linhas_raw'], 'linhas': 0,
+                        'qualidade': qualidade, 'segundos': round(time.perf_counter() - inicio, 3)}
+
+            if gerar_client:
+                if client.modo_incremental:
+                    parciais[(tb.nome_bucket_trusted, tb.chave_trusted_para_client(key))] = resultado['parcial']
+                else:
+                    await loop.run_in_executor(executor_io, gravar_client, key, resultado['parcial'])
+
+            segundos = time.perf_counter() - inicio
+            print(f"{key}: {resultado['linhas_raw']} linhas lidas, {resultado['linhas']} gravadas, "
+                  f"{qualidade['linhas_rejeitadas']} rejeitadas em {segundos:.2f} segundos")
+            return {'key': key, 'status': 'ok', 'linhas_raw': resultado['linhas_raw'],
+                    'linhas': resultado['linhas'], 'qualidade': qualidade, 'segundos': round(segundos, 3)}
+
+        except Exception as e:
+            print(f"{key}: erro durante o processamento: {e}")
+            return {'key': key, 'status': 'erro', 'erro': str(e), 'linhas_raw': 0, 'linhas': 0,
+                    'segundos': round(time.perf_counter() - inicio, 3)}
+
+async def executar_backfill(prefixos, estacoes=None, bucket=None, concorrencia=None, processos=None, gerar_client=False):
+    """
+    Processa todos os arquivos raw dos prefixos com no máximo `concorrencia`
+    arquivos em andamento e `processos` transformações em paralelo. Por
+    padrão só grava o trusted: o gatilho do bucket trusted aciona a Lambda
+    client para cada arquivo. `gerar_client` é para quando esse gatilho não
+    está implantado; com ele ativo, os dois gravariam o mesmo _client.csv e
+    o mesmo estado do client ao mesmo tempo.
+    """
+    bucket = bucket or tb.nome_bucket_raw
+    estacoes = [estacao.strip().upper() for estacao in (estacoes or tb.estacoes)]
+    concorrencia = concorrencia or concorrencia_padrao
+    processos = processos or processos_padrao
+    tb.estacoes = estacoes
+    instalar_saida()
+
+    chaves = listar_arquivos_raw(bucket, prefixos)
+    print(f"{len(chaves)} arquivos encontrados em s3://{bucket} para os prefixos {prefixos}")
+    print(f"Estações: {', '.join(estacoes)} | concorrência: {concorrencia} | processos: {processos}")
+
+    semaforo = asyncio.Semaphore(concorrencia)
+    parciais = {}
+    # spawn: os workers não herdam as threads de I/O já em execução
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processos, mp_context=contexto,
+                             initializer=iniciar_worker, initargs=(estacoes, tb.formato_saida)) as pool, \
+            ThreadPoolExecutor(max_workers=concorrencia * 2) as executor_io:
+        resultados = await asyncio.gather(*[
+            processar_arquivo(bucket, key, semaforo, pool, executor_io, gerar_client, parciais)
+            for key in chaves
+        ])
+
+        if parciais:
+            print(f"\nMesclando {len(parciais)} arquivos no estado do client...")
+            await asyncio.get_running_loop().run_in_executor(executor_io, gravar_client_incremental, parciais)
+
+    return resultados
+
+def imprimir_relatorio(resultados, segundos):
+
+    print("\n=== Relatório do backfill ===")
+    for status in ['ok', 'vazio', 'erro']:
+        quantidade = sum(1 for r in resultados if r['status'] == status)
+        print(f"Arquivos {status}: {quantidade}")
+    linhas = sum(r['linhas_raw'] for r in resultados)
+    print(f"Linhas raw processadas: {linhas}")
+    qualidade = tb.somar_qualidade(r['qualidade'] for r in resultados if 'qualidade' in r)
+    print(f"Linhas rejeitadas na validação: {qualidade['linhas_rejeitadas']} {qualidade['violacoes']}")
+    print(f"Tempo total: {segundos:.2f} segundos ({linhas / segundos if segundos else 0:.0f} linhas/s)")
+    for r in resultados:
+        if r['status'] == 'erro':
+            print(f"  {r['key']}: {r['erro']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill dos arquivos raw para as camadas trusted e client")
+    parser.add_argument('prefixos', nargs='+', help="Prefixos do bucket raw (ex.: inmet/2023/)")
+    parser.add_argument('--estacoes', nargs='+', help="Estações mantidas (padrão: variável ESTACOES)")
+    parser.add_argument('--bucket', default=tb.nome_bucket_raw)
+    parser.add_argument('--concorrencia', type=int, default=concorrencia_padrao)
+    parser.add_argument('--processos', type=int, default=processos_padrao)
+    parser.add_argument('--com-client', action='store_true',
+                        help="Gera também o client. Só sem o gatilho do trusted implantado: com ele, "
+                             "a Lambda client já processa cada arquivo e as duas gravações concorrem "
+                             "no mesmo _client.csv e no estado do client")
+    parser.add_argument('--relatorio', help="Salva o resultado por arquivo em JSON")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    resultados = asyncio.run(executar_backfill(
+        args.prefixos,
+        estacoes=args.estacoes,
+        bucket=args.bucket,
+        concorrencia=args.concorrencia,
+        processos=args.processos,
+        gerar_client=args.com_client
+    ))
+    imprimir_relatorio(resultados, time.perf_counter() - inicio)
+
+    if args.relatorio:
+        with open(args.relatorio, 'w') as arquivo:
+            json.dump(resultados, arquivo, indent=2, ensure_ascii=False)
+
+    sys.exit(1 if any(r['status'] == 'erro' for r in resultados) else 0)
@@ -0,0 +1,327 @@
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+import pickle
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+diretorio_benchmark = os.path.dirname(os.path.abspath(__file__))
+diretorio_lambdas = os.path.join(diretorio_benchmark, '..', 'lambda_python')
+arquivo_resultados = os.path.join(diretorio_benchmark, 'resultados', 'benchmark.jsonl')
+diretorio_cache = os.path.join(tempfile.gettempdir(), 'benchmark_lambdas_grupo3')
+
+# Funções de cada Lambda cronometradas como etapas (acumulam quando chamadas por chunk)
+etapas_base = {
+    'obter_objeto_s3': 's3_get',
+    'ler_csv_raw': 'parse',
+    'transformar_dados': 'transformacao',
+    # Chamada dentro do transformar_dados: o tempo também entra em transformacao
+    'validar_qualidade': 'validacao',
+    'salvar_quarentena_s3': 'quarentena',
+    'transformar_leve': 'transformacao_leve',
+    'salvar_arquivo_s3': 'serializacao_put',
+    'salvar_parquet_particionado_s3': 'serializacao_put',
+    'gerar_client_fundido': 'client_fundido'
+}
+etapas_client = {
+    'ler_dados_trusted': 'leitura',
+    'agregar_parcial': 'agregacao',
+    'mesclar_estado': 'estado',
+    'formatar_medias_mensais': 'formatacao',
+    'rollup': 'rollup',
+    'salvar_medias_mensais': 'serializacao_put',
+    'salvar_rollups': 'serializacao_put'
+}
+
+def rss_pico_mb():
+    """
+    Pico de memória residente do processo (ru_maxrss é KB no Linux e bytes no macOS)
+    """
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        pico /= 1024
+    return round(pico / 1024, 1)
+
+def cronometrar_etapas(modulo, etapas, tempos):
+
+    for funcao, etapa in etapas.items():
+        original = getattr(modulo, funcao, None)
+        if original is None:
+            continue
+
+        @functools.wraps(original)
+        def cronometrada(*args, _original=original, _etapa=etapa, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return _original(*args, **kwargs)
+            finally:
+                tempos[_etapa] = tempos.get(_etapa, 0.0) + time.perf_counter() - inicio
+
+        setattr(modulo, funcao, cronometrada)
+
+def contar_linhas_csv(dados):
+    return max(dados.count(b'\n') - 1, 0)
+
+def contar_linhas_trusted(objetos, arquivo_csv):
+    """
+    Linhas do trusted lidas pelo client, no CSV único ou somando os Parquet particionados
+    """
+    if arquivo_csv in objetos:
+        return contar_linhas_csv(objetos[arquivo_csv])
+    partes = [dados for key, dados in objetos.items() if key.endswith('.parquet')]
+    if not partes:
+        return None
+    import pyarrow.parquet as pq
+    return sum(pq.read_metadata(io.BytesIO(dados)).num_rows for dados in partes)
+
+def executar_cenario(nome_lambda, arquivo_entrada, arquivo_trusted):
+    """
+    Roda um handler em um processo próprio contra o S3 local, para que o
+    pico de RSS medido seja só deste cenário
+    """
+    sys.path.insert(0, diretorio_lambdas)
+    sys.path.insert(0, diretorio_benchmark)
+    from s3_local import S3Local
+    import tratamento_base
+    import tratamento_para_client
+
+    s3 = S3Local()
+    tratamento_base.s3_client = s3
+    tratamento_para_client.s3_client = s3
+
+    if nome_lambda == 'base':
+        modulo, etapas = tratamento_base, etapas_base
+        with open(arquivo_entrada, 'rb') as arquivo:
+            dados = arquivo.read()
+        s3.colocar(tratamento_base.nome_bucket_raw, tratamento_base.arquivo_weather, dados)
+        linhas_entrada = contar_linhas_csv(dados)
+        del dados
+    else:
+        modulo, etapas = tratamento_para_client, etapas_client
+        with open(arquivo_trusted, 'rb') as arquivo:
+            objetos_trusted = pickle.load(arquivo)
+        for key, dados in objetos_trusted.items():
+            s3.colocar(tratamento_para_client.nome_bucket_trusted, key, dados)
+        linhas_entrada = contar_linhas_trusted(objetos_trusted, tratamento_para_client.arquivo_entrada)
+        del objetos_trusted
+
+    # Imports adiados feitos antes, como em um container já aquecido;
+    # o custo de cold start aparece em 'timings' na resposta dos handlers
+    tratamento_base.pd.DataFrame, tratamento_base.np.ndarray, tratamento_para_client.pd.DataFrame
+
+    tempos = {}
+    cronometrar_etapas(modulo, etapas, tempos)
+    rss_antes = rss_pico_mb()
+
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        resposta = modulo.lambda_handler({}, None)
+    segundos = time.perf_counter() - inicio
+
+    if nome_lambda == 'base':
+        objetos_trusted = {
+            key: dados for (bucket, key), dados in s3.objetos.items()
+            if bucket == tratamento_base.nome_bucket_trusted
+        }
+        with open(arquivo_trusted, 'wb') as arquivo:
+            pickle.dump(objetos_trusted, arquivo)
+
+    tempos['outros'] = max(segundos - sum(tempos.values()), 0.0)
+    return {
+        'status_code': resposta['statusCode'],
+        'linhas_entrada': linhas_entrada,
+        'segundos_total': round(segundos, 4),
+        'linhas_por_segundo': round(linhas_entrada / segundos) if linhas_entrada and segundos else None,
+        'etapas_segundos': {etapa: round(valor, 4) for etapa, valor in sorted(tempos.items())},
+        # Etapas medidas pelos próprios handlers (S3, parse, limpeza, filtro, formatação, ...)
+        'etapas_handler': json.loads(resposta['body']).get('stages'),
+        'rss_antes_handler_mb': rss_antes,
+        'rss_pico_mb': rss_pico_mb(),
+        'bytes_lidos_s3': s3.bytes_lidos,
+        'bytes_escritos_s3': s3.bytes_escritos
+    }
+
+def versao_codigo():
+    """
+    Commit atual, marcado como -sujo se há mudanças nas Lambdas não commitadas
+    """
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=diretorio_benchmark, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        mudancas = subprocess.run(
+            ['git', 'status', '--porcelain', '--', diretorio_lambdas],
+            cwd=diretorio_benchmark, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        return f"{commit}-sujo" if mudancas else commit
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconhecido'
+
+def arquivo_raw(linhas, estacoes, semente):
+    """
+    Gera (ou reaproveita do cache) o CSV raw sintético do cenário
+    """
+    from gerar_dados_sinteticos import gerar_csv_raw
+
+    os.makedirs(diretorio_cache, exist_ok=True)
+    caminho = os.path.join(diretorio_cache, f"raw_{linhas}_{estacoes}_{semente}.csv")
+    if not os.path.exists(caminho):
+        print(f"Gerando {linhas} linhas sintéticas com {estacoes} estações...")
+        temporario = caminho + '.tmp'
+        with open(temporario, 'w', newline='') as arquivo:
+            gerar_csv_raw(arquivo, linhas, estacoes, semente)
+        os.replace(temporario, caminho)
+    return caminho
+
+def rodar_subprocesso(nome_lambda, entrada, trusted, variaveis):
+
+    ambiente = dict(os.environ, **variaveis)
+    processo = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--cenario', nome_lambda,
+         '--entrada', entrada, '--trusted', trusted],
+        env=ambiente, capture_output=True, text=True
+    )
+    if processo.returncode != 0:
+        raise Exception(f"Cenário {nome_lambda} falhou:\n{processo.stderr}")
+    return json.loads(processo.stdout.strip().splitlines()[-1])
+
+def rodar_benchmark(args):
+
+    variaveis = dict(item.split('=', 1) for item in args.env)
+    lambdas = ['base', 'client'] if args.lambda_alvo == 'ambos' else [args.lambda_alvo]
+    versao = versao_codigo()
+    resultados = []
+    # Com --referencia, cada cenário roda também sem as variáveis de --env
+    ambientes = [{}, variaveis] if args.referencia and variaveis else [variaveis]
+
+    for linhas in args.linhas:
+        entrada = arquivo_raw(linhas, args.estacoes, args.semente)
+        trusted = os.path.join(diretorio_cache, f"trusted_{linhas}_{args.estacoes}_{args.semente}_{os.getpid()}.pkl")
+        try:
+            for repeticao, ambiente in ((r, a) for r in range(args.repeticoes) for a in ambientes):
+                # O client sempre precisa do trusted gerado pela Lambda base
+                for nome_lambda in ['base', 'client'] if 'client' in lambdas else lambdas:
+                    metricas = rodar_subprocesso(nome_lambda, entrada, trusted, ambiente)
+                    if nome_lambda not in lambdas:
+                        continue
+                    resultado = {
+                        'commit': versao,
+                        'data': datetime.now().isoformat(timespec='seconds'),
+                        'lambda': nome_lambda,
+                        'linhas_raw': linhas,
+                        'estacoes': args.estacoes,
+                        'semente': args.semente,
+                        'repeticao': repeticao,
+                        'env': ambiente,
+                        'python': platform.python_version(),
+                        **metricas
+                    }
+                    resultados.append(resultado)
+                    print(f"{nome_lambda:6} {linhas:>10} linhas{' (referência)' if ambiente != variaveis else '':13}: "
+                          f"{metricas['segundos_total']:8.3f} s, "
+                          f"{metricas['linhas_por_segundo'] or 0:>10} linhas/s, "
+                          f"pico RSS {metricas['rss_pico_mb']} MB, status {metricas['status_code']}")
+        finally:
+            if os.path.exists(trusted):
+                os.remove(trusted)
+
+    if len(ambientes) > 1:
+        comparar_com_referencia(resultados, variaveis)
+
+    if not args.sem_salvar:
+        os.makedirs(os.path.dirname(args.saida), exist_ok=True)
+        with open(args.saida, 'a') as arquivo:
+            for resultado in resultados:
+                arquivo.write(json.dumps(resultado, ensure_ascii=False) + '\n')
+        print(f"\n{len(resultados)} resultados adicionados em {args.saida}")
+    return resultados
+
+def comparar_com_referencia(resultados, variaveis):
+    """
+    Tempo e pico de memória com as variáveis de --env contra a execução sem
+    elas, no mesmo commit e na mesma entrada (melhor repetição de cada).
+    O acréscimo de RSS no handler desconta o que já estava residente antes
+    dele (imports e objetos do S3 local).
+    """
+    melhores = {}
+    for resultado in resultados:
+        chave = (resultado['lambda'], resultado['linhas_raw'], resultado['env'] == variaveis)
+        atual = melhores.get(chave)
+        if atual is None or resultado['rss_pico_mb'] < atual['rss_pico_mb']:
+            melhores[chave] = resultado
+
+    print(f"\nComparação com a referência (env {json.dumps(variaveis)} x sem env)")
+    for (nome_lambda, linhas, com_env), resultado in sorted(melhores.items()):
+        referencia = melhores.get((nome_lambda, linhas, False))
+        if not com_env or referencia is None:
+            continue
+        handler = resultado['rss_pico_mb'] - resultado['rss_antes_handler_mb']
+        handler_referencia = referencia['rss_pico_mb'] - referencia['rss_antes_handler_mb']
+        print(f"  {nome_lambda:6} {linhas:>10} linhas: "
+              f"pico RSS {referencia['rss_pico_mb']} -> {resultado['rss_pico_mb']} MB "
+              f"({(resultado['rss_pico_mb'] / referencia['rss_pico_mb'] - 1) * 100:+.1f}%), "
+              f"no handler +{handler_referencia:.1f} -> +{handler:.1f} MB, "
+              f"tempo {referencia['segundos_total']:.3f} -> {resultado['segundos_total']:.3f} s")
+
+def comparar_resultados(caminho):
+    """
+    Mostra a melhor execução de cada commit por cenário, na ordem em que os commits apareceram
+    """
+    melhores = {}
+    with open(caminho) as arquivo:
+        for linha in arquivo:
+            resultado = json.loads(linha)
+            cenario = (
+                resultado['lambda'], resultado['linhas_raw'], resultado['estacoes'],
+                json.dumps(resultado['env'], sort_keys=True)
+            )
+            por_commit = melhores.setdefault(cenario, {})
+            atual = por_commit.get(resultado['commit'])
+            if atual is None or resultado['segundos_total'] < atual['segundos_total']:
+                por_commit[resultado['commit']] = resultado
+
+    for (nome_lambda, linhas, estacoes, env), por_commit in sorted(melhores.items()):
+        print(f"\n{nome_lambda} | {linhas} linhas | {estacoes} estações | env {env}")
+        referencia = None
+        for commit, resultado in por_commit.items():
+            referencia = referencia or resultado['segundos_total']
+            print(f"  {commit:14} {resultado['segundos_total']:8.3f} s  "
+                  f"{resultado['linhas_por_segundo'] or 0:>10} linhas/s  "
+                  f"pico RSS {resultado['rss_pico_mb']:>8} MB  "
+                  f"x{referencia / resultado['segundos_total']:.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark offline das Lambdas de tratamento meteorológico")
+    parser.add_argument('--linhas', type=int, nargs='+', default=[730, 100000, 1000000])
+    parser.add_argument('--estacoes', type=int, default=2)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--lambda', dest='lambda_alvo', choices=['base', 'client', 'ambos'], default='ambos')
+    parser.add_argument('--repeticoes', type=int, default=1)
+    parser.add_argument('--env', action='append', default=[], help="Variável das Lambdas, ex.: MODO_STREAMING=true")
+    parser.add_argument('--saida', default=arquivo_resultados)
+    parser.add_argument('--sem-salvar', action='store_true')
+    parser.add_argument('--comparar', action='store_true', help="Compara os resultados salvos entre commits")
+    parser.add_argument('--referencia', action='store_true',
+                        help="Roda também sem as variáveis de --env e compara tempo e pico de RSS")
+    # Uso interno: execução de um cenário no processo filho
+    parser.add_argument('--cenario', choices=['base', 'client'], help=argparse.SUPPRESS)
+    parser.add_argument('--entrada', help=argparse.SUPPRESS)
+    parser.add_argument('--trusted', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cenario:
+        print(json.dumps(executar_cenario(args.cenario, args.entrada, args.trusted)))
+    elif args.comparar:
+        comparar_resultados(args.saida)
+    else:
+        sys.path.insert(0, diretorio_benchmark)
+        rodar_benchmark(args)
@@ -0,0 +1,102 @@
+import json
+import uuid
+from urllib.parse import quote_plus
+
+class FilaLocal:
+    """
+    Substituto em memória da fila SQS entre o gatilho do bucket e a Lambda.
+    Acumula as notificações e entrega lotes no formato do evento SQS, como o
+    event source mapping com batch_size e maximum_batching_window_in_seconds.
+    O tempo é simulado (avancar), para testar a janela sem esperar.
+    """
+
+    def __init__(self, nome, janela_segundos=20, tamanho_lote=100, max_recebimentos=5):
+        self.nome = nome
+        self.janela_segundos = janela_segundos
+        self.tamanho_lote = tamanho_lote
+        self.max_recebimentos = max_recebimentos
+        self.agora = 0.0
+        self.mensagens = []
+        self.dlq = []
+        self.enviadas = 0
+        self.lotes_entregues = 0
+        self._em_voo = []
+
+    def avancar(self, segundos):
+        self.agora += segundos
+
+    def send_message(self, MessageBody, **kwargs):
+        message_id = str(uuid.uuid4())
+        self.mensagens.append({
+            'messageId': message_id,
+            'body': MessageBody,
+            'enviada_em': self.agora,
+            'recebimentos': 0
+        })
+        self.enviadas += 1
+        return {'MessageId': message_id}
+
+    def notificar_s3(self, bucket, key, tamanho):
+        """
+        Notificação de ObjectCreated no mesmo formato enviado pelo S3
+        """
+        corpo = {'Records': [{
+            'eventSource': 'aws:s3',
+            'eventName': 'ObjectCreated:Put',
+            's3': {
+                'bucket': {'name': bucket},
+                'object': {'key': quote_plus(key), 'size': tamanho}
+            }
+        }]}
+        return self.send_message(json.dumps(corpo))
+
+    def lote_pronto(self):
+        """
+        Há um lote para entregar: atingiu o tamanho máximo ou a mensagem mais
+        antiga já esperou a janela inteira
+        """
+        if not self.mensagens:
+            return False
+        return len(self.mensagens) >= self.tamanho_lote or \
+            self.agora - self.mensagens[0]['enviada_em'] >= self.janela_segundos
+
+    def receber_lote(self, forcar=False):
+        """
+        Evento SQS com até tamanho_lote mensagens, ou None se a janela ainda
+        não terminou. Com forcar=True, entrega o que houver (fim da simulação).
+        """
+        if not self.mensagens or not (forcar or self.lote_pronto()):
+            return None
+        lote, self.mensagens = self.mensagens[:self.tamanho_lote], self.mensagens[self.tamanho_lote:]
+        self.lotes_entregues += 1
+        self._em_voo = lote
+        records = []
+        for mensagem in lote:
+            mensagem['recebimentos'] += 1
+            records.append({
+                'messageId': mensagem['messageId'],
+                'receiptHandle': mensagem['messageId'],
+                'body': mensagem['body'],
+                'attributes': {'ApproximateReceiveCount': str(mensagem['recebimentos'])},
+                'eventSource': 'aws:sqs',
+                'eventSourceARN': f"arn:aws:sqs:us-east-1:000000000000:{self.nome}"
+            })
+        return {'Records': records}
+
+    def confirmar(self, resposta):
+        """
+        Trata a resposta do handler como o event source mapping com
+        ReportBatchItemFailures: as mensagens listadas voltam para a fila
+        (ou para a DLQ após max_recebimentos) e as demais são removidas
+        """
+        falhas = {item['itemIdentifier'] for item in (resposta or {}).get('batchItemFailures', [])}
+        for mensagem in self._em_voo:
+            if mensagem['messageId'] not in falhas:
+                continue
+            if mensagem['recebimentos'] >= self.max_recebimentos:
+                self.dlq.append(mensagem)
+            else:
+                mensagem['enviada_em'] = self.agora
+                self.mensagens.append(mensagem)
+        self._em_voo = []
+        return len(falhas)
@@ -0,0 +1,99 @@
+import argparse
+import io
+
+import numpy as np
+import pandas as pd
+
+# Colunas no mesmo formato do arquivo raw do INMET lido pelas Lambdas
+colunas_raw = [
+    'ESTACAO', 'DATA (YYYY-MM-DD)', 'temp_avg', 'temp_max', 'temp_min',
+    'rain_max', 'rad_max', 'hum_max', 'hum_min', 'wind_max', 'wind_avg'
+]
+
+# Estações processadas pela Lambda trusted; as demais são filtradas
+estacoes_padrao = ['A771', 'A701']
+
+tamanho_bloco = 500000
+
+def lista_estacoes(quantidade):
+    """
+    Estações reais primeiro, completadas com códigos sintéticos no padrão do INMET
+    """
+    estacoes = estacoes_padrao[:quantidade]
+    numero = 800
+    while len(estacoes) < quantidade:
+        estacoes.append(f"A{numero}")
+        numero += 1
+    return estacoes
+
+def gerar_bloco(gerador, linhas, estacoes, data_inicial):
+    """
+    Gera um bloco de linhas raw com nulos, estações em caixa/espaço
+    diferentes e linhas totalmente vazias, como no arquivo real
+    """
+    dias = gerador.integers(0, 365 * 3, linhas)
+    datas = (pd.Timestamp(data_inicial) + pd.to_timedelta(dias, unit='D')).strftime('%Y-%m-%d')
+    temp_avg = gerador.normal(22, 4, linhas)
+
+    df = pd.DataFrame({
+        'ESTACAO': gerador.choice(estacoes, linhas),
+        'DATA (YYYY-MM-DD)': datas,
+        'temp_avg': temp_avg.round(3),
+        'temp_max': (temp_avg + gerador.uniform(2, 8, linhas)).round(3),
+        'temp_min': (temp_avg - gerador.uniform(2, 8, linhas)).round(3),
+        'rain_max': gerador.exponential(2, linhas).round(3),
+        'rad_max': gerador.normal(2500, 300, linhas).round(2),
+        'hum_max': gerador.uniform(40, 100, linhas).round(1),
+        'hum_min': gerador.uniform(10, 40, linhas).round(1),
+        'wind_max': gerador.uniform(0, 15, linhas).round(2),
+        'wind_avg': gerador.uniform(0, 5, linhas).round(2)
+    }, columns=colunas_raw)
+
+    # ~5% de nulos por coluna medida e ~1% de linhas sem nenhuma medição
+    for coluna in ['temp_avg', 'rain_max', 'rad_max', 'hum_max', 'wind_max']:
+        df.loc[gerador.random(linhas) < 0.05, coluna] = np.nan
+    df.loc[gerador.random(linhas) < 0.01, ['temp_avg', 'rain_max', 'rad_max', 'hum_max', 'wind_max']] = np.nan
+
+    # ~0,2% de leituras com o -9999 que o INMET usa para sensor sem leitura,
+    # rejeitadas pela validação de qualidade da Lambda trusted
+    for coluna in ['temp_avg', 'hum_max']:
+        df.loc[gerador.random(linhas) < 0.001, coluna] = -9999
+
+    # ~1% das estações com espaços e minúsculas, corrigidas pela limpeza
+    sujas = gerador.random(linhas) < 0.01
+    df.loc[sujas, 'ESTACAO'] = ' ' + df.loc[sujas, 'ESTACAO'].str.lower() + ' '
+    return df
+
+def gerar_csv_raw(destino, linhas, estacoes=2, semente=42, data_inicial='2023-01-01'):
+    """
+    Escreve um CSV raw sintético com o número de linhas pedido em blocos,
+    para gerar dezenas de milhões de linhas sem montar tudo em memória
+    """
+    gerador = np.random.default_rng(semente)
+    codigos = lista_estacoes(estacoes)
+    restantes = linhas
+    cabecalho = True
+    while restantes > 0 or cabecalho:
+        bloco = min(restantes, tamanho_bloco)
+        df = gerar_bloco(gerador, bloco, codigos, data_inicial)
+        df.to_csv(destino, index=False, header=cabecalho)
+        cabecalho = False
+        restantes -= bloco
+
+def gerar_bytes_raw(linhas, estacoes=2, semente=42):
+
+    buffer = io.StringIO()
+    gerar_csv_raw(buffer, linhas, estacoes, semente)
+    return buffer.getvalue().encode('utf-8')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera um arquivo raw sintético no formato do INMET")
+    parser.add_argument('arquivo', help="Caminho do CSV de saída")
+    parser.add_argument('--linhas', type=int, default=730)
+    parser.add_argument('--estacoes', type=int, default=2)
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+
+    with open(args.arquivo, 'w', newline='') as arquivo:
+        gerar_csv_raw(arquivo, args.linhas, args.estacoes, args.semente)
+    print(f"Arquivo {args.arquivo} gerado com {args.linhas} linhas e {args.estacoes} estações")
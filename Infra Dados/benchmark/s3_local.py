@@ -0,0 +1,26 @@
+from armazenamento import ArmazenamentoMemoria
+
+class S3Local(ArmazenamentoMemoria):
+    """
+    Backend em memória das Lambdas com os gatilhos do bucket simulados,
+    para rodar os handlers sem rede e sem buckets reais
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.puts = {}
+        self.notificacoes = []
+
+    def notificar(self, bucket, fila, prefixo='', sufixo=''):
+        """
+        Envia para a fila uma notificação de ObjectCreated a cada objeto
+        gravado no bucket com o prefixo e sufixo, como o gatilho do bucket
+        """
+        self.notificacoes.append((bucket, fila, prefixo, sufixo))
+
+    def colocar(self, bucket, key, dados):
+        super().colocar(bucket, key, dados)
+        self.puts[(bucket, key)] = self.puts.get((bucket, key), 0) + 1
+        for bucket_notificado, fila, prefixo, sufixo in self.notificacoes:
+            if bucket_notificado == bucket and key.startswith(prefixo) and key.endswith(sufixo):
+                fila.notificar_s3(bucket, key, len(dados))
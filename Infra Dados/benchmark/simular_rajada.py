@@ -0,0 +1,137 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+diretorio_benchmark = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(diretorio_benchmark, '..', 'lambda_python'))
+sys.path.insert(0, diretorio_benchmark)
+
+import tratamento_base as tb
+import tratamento_para_client as client
+from fila_local import FilaLocal
+from gerar_dados_sinteticos import gerar_bytes_raw
+from s3_local import S3Local
+
+# Simula uploads em rajada no bucket raw e compara a invocação por objeto
+# (sem fila) com as filas coalescendo as notificações pela janela. A saída
+# final do client precisa ser a mesma nos dois casos.
+
+def uploads_rajada(arquivos, duplicadas, linhas):
+    """
+    Sequência de (key, dados): cada arquivo uma vez, mais `duplicadas`
+    reenvios do mesmo conteúdo, como um processo de carga que repete uploads
+    """
+    conteudos = {
+        f"inmet/rajada/arquivo_{numero:03d}.csv": gerar_bytes_raw(linhas, semente=numero)
+        for numero in range(arquivos)
+    }
+    chaves = list(conteudos)
+    sequencia = list(conteudos.items())
+    for numero in range(duplicadas):
+        key = chaves[(numero * 7) % len(chaves)]
+        sequencia.insert(min(len(sequencia), (numero + 1) * 3), (key, conteudos[key]))
+    return sequencia
+
+def drenar(fila, handler, contagem, forcar=False):
+    """
+    Entrega à Lambda os lotes prontos da fila e trata a resposta
+    """
+    while True:
+        evento = fila.receber_lote(forcar)
+        if evento is None:
+            return
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            resposta = handler(evento, None)
+        contagem['segundos'] += time.perf_counter() - inicio
+        contagem['invocacoes'] += 1
+        contagem['objetos'] += len(json.loads(resposta['body']).get('objects', []))
+        contagem['falhas'] += fila.confirmar(resposta)
+
+def simular(sequencia, janela, tamanho_lote, intervalo):
+    """
+    Roda a rajada contra o S3 local. janela=0 e tamanho_lote=1 equivalem
+    à notificação direta do S3 para a Lambda, um objeto por invocação.
+    """
+    s3 = S3Local()
+    tb.s3_client = s3
+    client.s3_client = s3
+    fila_raw = FilaLocal('fila-notificacoes-raw', janela, tamanho_lote)
+    fila_trusted = FilaLocal('fila-notificacoes-trusted', janela, tamanho_lote)
+    s3.notificar(tb.nome_bucket_raw, fila_raw)
+    if not tb.modo_fundido:
+        s3.notificar(tb.nome_bucket_trusted, fila_trusted, sufixo='.csv')
+        s3.notificar(tb.nome_bucket_trusted, fila_trusted, prefixo=f"{tb.prefixo_parquet}_SUCCESS/", sufixo='.success')
+
+    contagens = {
+        nome: {'invocacoes': 0, 'objetos': 0, 'falhas': 0, 'segundos': 0.0}
+        for nome in ['trusted', 'client']
+    }
+    for key, dados in sequencia:
+        s3.colocar(tb.nome_bucket_raw, key, dados)
+        for fila in (fila_raw, fila_trusted):
+            fila.avancar(intervalo)
+        drenar(fila_raw, tb.lambda_handler, contagens['trusted'])
+        drenar(fila_trusted, client.lambda_handler, contagens['client'])
+
+    while fila_raw.mensagens or fila_trusted.mensagens:
+        for fila in (fila_raw, fila_trusted):
+            fila.avancar(janela)
+        drenar(fila_raw, tb.lambda_handler, contagens['trusted'], forcar=True)
+        drenar(fila_trusted, client.lambda_handler, contagens['client'], forcar=True)
+
+    # O estado do client guarda as origens na ordem em que foram mescladas;
+    # compara só o conteúdo, independente da ordem das linhas
+    saida_client = {
+        key: sorted(dados.splitlines()) if key == client.arquivo_estado else dados
+        for (bucket, key), dados in s3.objetos.items()
+        if bucket == client.nome_bucket_client
+    }
+    escritas_client = sum(
+        quantidade for (bucket, key), quantidade in s3.puts.items()
+        if bucket == client.nome_bucket_client
+    )
+    return {
+        'lambdas': {nome: {**c, 'segundos': round(c['segundos'], 3)} for nome, c in contagens.items()},
+        'escritas_client': escritas_client,
+        'mensagens_dlq': len(fila_raw.dlq) + len(fila_trusted.dlq),
+        'saida_client': saida_client
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simula uploads em rajada com e sem coalescência das notificações")
+    parser.add_argument('--arquivos', type=int, default=20)
+    parser.add_argument('--duplicadas', type=int, default=5, help="Reenvios de arquivos já enviados")
+    parser.add_argument('--linhas', type=int, default=5000)
+    parser.add_argument('--intervalo', type=float, default=0.5, help="Segundos entre uploads")
+    parser.add_argument('--janela', type=float, default=20)
+    parser.add_argument('--lote', type=int, default=25)
+    parser.add_argument('--incremental', action='store_true', help="Client pelo estado (MODO_INCREMENTAL)")
+    parser.add_argument('--fundido', action='store_true', help="Lambda trusted também gera o client")
+    args = parser.parse_args()
+
+    tb.modo_fundido = args.fundido
+    client.modo_incremental = args.incremental
+    sequencia = uploads_rajada(args.arquivos, args.duplicadas, args.linhas)
+    print(f"{len(sequencia)} uploads ({args.arquivos} arquivos, {args.duplicadas} reenvios) "
+          f"a cada {args.intervalo} s | incremental: {args.incremental} | fundido: {args.fundido}\n")
+
+    cenarios = {
+        'direto': simular(sequencia, 0, 1, args.intervalo),
+        'fila': simular(sequencia, args.janela, args.lote, args.intervalo)
+    }
+    for nome, resultado in cenarios.items():
+        print(f"{nome}:")
+        for nome_lambda, c in resultado['lambdas'].items():
+            print(f"  Lambda {nome_lambda:8} {c['invocacoes']:4} invocações, {c['objetos']:4} objetos, "
+                  f"{c['falhas']} falhas, {c['segundos']:.2f} s")
+        print(f"  Escritas no bucket client: {resultado['escritas_client']}")
+        print(f"  Mensagens na DLQ: {resultado['mensagens_dlq']}")
+
+    iguais = cenarios['direto']['saida_client'] == cenarios['fila']['saida_client']
+    print(f"\nSaída do client igual nos dois cenários: {iguais}")
+    sys.exit(0 if iguais else 1)
@@ -0,0 +1,500 @@
+import argparse
+import bisect
+import calendar
+import csv
+import hashlib
+import io
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda_python'))
+
+import armazenamento
+import comum_lambdas as comum
+import esquema_weather as esquema
+import tratamento_para_client as client
+
+# Serviço HTTP/JSON somente leitura sobre os agregados do bucket client
+# (médias mensais e cubo diário/semanal/mensal/anual). Os datasets ficam em
+# memória, indexados por estação e período; as respostas prontas ficam num
+# cache com validade e descarte LRU. Os ETags dos objetos são conferidos de
+# tempos em tempos: quando a Lambda client grava uma nova versão, o dataset
+# é recarregado e o cache dele é descartado. Para rodar contra um diretório
+# local (mesmo layout do bucket, ver armazenamento.py):
+#
+#   ARMAZENAMENTO=local DIRETORIO_ARMAZENAMENTO=dados_locais \
+#       python consulta_client/servico_consulta.py --porta 8080
+#
+#   curl 'localhost:8080/consulta/mensal?estacao=A701&inicio=2025-01&fim=2025-06'
+
+host_padrao = os.environ.get('CONSULTA_HOST', '127.0.0.1')
+porta_padrao = int(os.environ.get('CONSULTA_PORTA', '8080'))
+
+# Validade de uma resposta no cache e máximo de respostas guardadas
+ttl_cache = float(os.environ.get('CONSULTA_TTL_SEGUNDOS', '300'))
+tamanho_cache = int(os.environ.get('CONSULTA_CACHE_MAXIMO', '1024'))
+
+# Intervalo mínimo entre duas conferências dos ETags de um dataset
+intervalo_verificacao = float(os.environ.get('CONSULTA_VERIFICACAO_SEGUNDOS', '30'))
+
+# Pastas do bucket client com arquivos estáticos, que não são saídas da
+# Lambda client (weather/csv_client.csv é enviado pelo exportar_mysql.py)
+prefixos_estaticos = ('weather/',)
+
+class ErroConsulta(Exception):
+    """
+    Consulta inválida, respondida com o status HTTP informado
+    """
+
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+def conjuntos_client():
+    """
+    Datasets servidos: nome -> esquema, coluna do período, onde estão no
+    bucket client (prefixo e sufixo das keys) e como juntar o mesmo período
+    vindo de origens diferentes. As médias mensais em CSV são um arquivo
+    por origem (csv_client.csv e <key>_client.csv), em qualquer pasta do
+    bucket. No modo com estado (MODO_INCREMENTAL) só as saídas dele valem:
+    elas já cobrem todas as origens.
+    """
+    parquet = client.formato_saida == 'parquet'
+    saida_estado = comum.nome_base_arquivo(client.arquivo_saida)
+    conjuntos = {
+        'medias_mensais': {
+            'esquema': esquema.esquema_client,
+            'periodo': 'data',
+            'prefixo': client.prefixo_parquet_client if parquet else '',
+            'sufixo': '.parquet' if parquet else client.sufixo_saida_client,
+            'origens': {saida_estado if parquet else client.arquivo_saida},
+            # Sem somas e contagens: vale a origem gravada por último
+            'somar': False
+        }
+    }
+    for granularidade in client.granularidades_rollup:
+        prefixo = client.prefixo_rollup_parquet if parquet else client.prefixo_rollup
+        conjuntos[granularidade] = {
+            'esquema': esquema.esquema_rollup,
+            'periodo': 'periodo',
+            'prefixo': f"{prefixo}{granularidade}/",
+            'sufixo': '.parquet' if parquet else '.csv',
+            'origens': {saida_estado if parquet else f"{prefixo}{granularidade}/{saida_estado}.csv"},
+            'somar': True
+        }
+    if not client.modo_incremental:
+        for conjunto in conjuntos.values():
+            conjunto['origens'] = None
+    return conjuntos
+
+def origem_objeto(key):
+    """
+    Origem de um objeto do client: a própria key no CSV (um arquivo por
+    origem) ou o nome do arquivo no parquet (o mesmo em todas as partições)
+    """
+    if key.endswith('.parquet'):
+        return key.rsplit('/', 1)[-1][:-len('.parquet')]
+    return key
+
+def _arredondar(valor):
+    """
+    Arredonda em 2 casas como o round do pandas na Lambda client
+    """
+    return round(valor * 100) / 100
+
+def combinar_linhas_rollup(primeira, segunda):
+    """
+    Junta duas linhas do cubo com a mesma estação e período vindas de
+    origens diferentes: somas e contagens se somam, mínimos e máximos se
+    combinam e a média é recalculada, como no rollup da Lambda client
+    """
+    linha = dict(primeira)
+    for metrica in client.metricas_rollup:
+        soma = (primeira[f"{metrica}_soma"] or 0) + (segunda[f"{metrica}_soma"] or 0)
+        contagem = (primeira[f"{metrica}_contagem"] or 0) + (segunda[f"{metrica}_contagem"] or 0)
+        for estatistica, combinar in (('minimo', min), ('maximo', max)):
+            valores = [l[f"{metrica}_{estatistica}"] for l in (primeira, segunda) if l[f"{metrica}_{estatistica}"] is not None]
+            linha[f"{metrica}_{estatistica}"] = combinar(valores) if valores else None
+        linha[f"{metrica}_soma"] = _arredondar(soma)
+        linha[f"{metrica}_contagem"] = contagem
+        linha[f"{metrica}_media"] = _arredondar(soma / contagem) if contagem else None
+    return linha
+
+def _conversor(tipo):
+    """
+    Converte o texto de uma célula do CSV para o valor do JSON
+    """
+    if tipo == 'float64':
+        return lambda valor: float(valor) if valor not in ('', 'N/A') else None
+    if tipo.startswith('int'):
+        return lambda valor: int(valor) if valor else None
+    if tipo.startswith('datetime'):
+        # Períodos são datas; o texto ISO ordena como a data
+        return lambda valor: valor[:10] if valor else None
+    return lambda valor: valor
+
+def _valor_json(valor):
+
+    if valor is None:
+        return None
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()[:10]
+    if hasattr(valor, 'item'):
+        valor = valor.item()
+    if isinstance(valor, float) and math.isnan(valor):
+        return None
+    return valor
+
+class IndiceAgregados:
+    """
+    Linhas de um dataset agrupadas por estação e ordenadas pelo período,
+    para consultas de intervalo com busca binária
+    """
+
+    def __init__(self, linhas, coluna_periodo, versao):
+        self.versao = versao
+        self.linhas = len(linhas)
+        self.estacoes = {}
+        por_estacao = {}
+        for linha in linhas:
+            por_estacao.setdefault(linha['estacao'], []).append(linha)
+        for estacao, lista in por_estacao.items():
+            lista.sort(key=lambda linha: linha[coluna_periodo])
+            self.estacoes[estacao] = ([linha[coluna_periodo] for linha in lista], lista)
+
+    def limites(self):
+        """
+        Primeiro e último período do dataset
+        """
+        periodos = [periodos for periodos, _ in self.estacoes.values() if periodos]
+        if not periodos:
+            return None, None
+        return min(p[0] for p in periodos), max(p[-1] for p in periodos)
+
+    def consultar(self, estacoes=None, inicio=None, fim=None):
+        resultado = []
+        for estacao in sorted(estacoes or self.estacoes):
+            periodos, linhas = self.estacoes.get(estacao, ([], []))
+            primeiro = bisect.bisect_left(periodos, inicio) if inicio else 0
+            ultimo = bisect.bisect_right(periodos, fim) if fim else len(periodos)
+            resultado.extend(linhas[primeiro:ultimo])
+        return resultado
+
+class CacheConsultas:
+    """
+    Respostas prontas das consultas, com validade (TTL) e descarte das
+    menos usadas (LRU) quando passa do máximo de entradas
+    """
+
+    def __init__(self, maximo, ttl):
+        self.maximo = maximo
+        self.ttl = ttl
+        self.entradas = OrderedDict()
+        self.acertos = 0
+        self.falhas = 0
+        self._trava = threading.Lock()
+
+    def obter(self, chave):
+        with self._trava:
+            entrada = self.entradas.get(chave)
+            if entrada is None or entrada[0] <= time.monotonic():
+                if entrada is not None:
+                    del self.entradas[chave]
+                self.falhas += 1
+                return None
+            self.entradas.move_to_end(chave)
+            self.acertos += 1
+            return entrada[1]
+
+    def guardar(self, chave, valor):
+        with self._trava:
+            self.entradas[chave] = (time.monotonic() + self.ttl, valor)
+            self.entradas.move_to_end(chave)
+            while len(self.entradas) > self.maximo:
+                self.entradas.popitem(last=False)
+
+    def invalidar(self, conjunto):
+        """
+        Descarta as respostas de um dataset (a chave começa pelo nome dele)
+        """
+        with self._trava:
+            for chave in [chave for chave in self.entradas if chave[0] == conjunto]:
+                del self.entradas[chave]
+
+    def resumo(self):
+        with self._trava:
+            return {'entradas': len(self.entradas), 'acertos': self.acertos, 'falhas': self.falhas}
+
+class ServicoConsulta:
+    """
+    Índices em memória dos datasets do client, recarregados quando o ETag
+    de algum objeto do dataset muda
+    """
+
+    def __init__(self, ttl=None, maximo=None, intervalo=None):
+        self.conjuntos = conjuntos_client()
+        self.intervalo = intervalo_verificacao if intervalo is None else intervalo
+        self.cache = CacheConsultas(tamanho_cache if maximo is None else maximo, ttl_cache if ttl is None else ttl)
+        self.indices = {}
+        self.verificado_em = {}
+        self._travas = {nome: threading.Lock() for nome in self.conjuntos}
+
+    def versao_atual(self, nome):
+        """
+        (key, ETag, data de modificação) de cada objeto do dataset, em ordem;
+        a listagem já traz os ETags e as datas, sem ler os objetos
+        """
+        conjunto = self.conjuntos[nome]
+        paginator = client.s3_client.get_paginator('list_objects_v2')
+        return tuple(sorted(
+            (obj['Key'], obj['ETag'], obj['LastModified'].isoformat())
+            for pagina in paginator.paginate(Bucket=client.nome_bucket_client, Prefix=conjunto['prefixo'])
+            for obj in pagina.get('Contents', [])
+            if obj['Key'].endswith(conjunto['sufixo'])
+            and not obj['Key'].startswith(prefixos_estaticos)
+            and (conjunto['origens'] is None or origem_objeto(obj['Key']) in conjunto['origens'])
+        ))
+
+    def ler_linhas_csv(self, key, esquema_conjunto):
+        """
+        Linhas de um CSV do client, com o cabeçalho validado contra o esquema
+        """
+        response = client.s3_client.get_object(Bucket=client.nome_bucket_client, Key=key)
+        texto = armazenamento.fonte_leitura(response).read().decode('utf-8-sig')
+        leitor = csv.reader(io.StringIO(texto), delimiter=';')
+        cabecalho = next(leitor, [])
+        esquema.validar_colunas(cabecalho, esquema_conjunto, key)
+        conversores = [(coluna, _conversor(esquema_conjunto[coluna])) for coluna in esquema_conjunto]
+        posicoes = [cabecalho.index(coluna) for coluna in esquema_conjunto]
+        return [
+            {coluna: converter(celulas[posicao]) for (coluna, converter), posicao in zip(conversores, posicoes)}
+            for celulas in leitor if celulas
+        ]
+
+    def ler_linhas_parquet(self, conjunto, chaves):
+        """
+        Linhas das partições parquet de uma origem, pelo leitor da Lambda client
+        """
+        df = client.ler_parquet_particionado_s3(
+            client.nome_bucket_client,
+            conjunto['prefixo'],
+            list(conjunto['esquema']),
+            chaves=chaves
+        )
+        # Colunas de partição voltam do caminho como texto
+        inteiras = {coluna: 'int64' for coluna, tipo in conjunto['esquema'].items() if tipo.startswith('int')}
+        return [
+            {coluna: _valor_json(valor) for coluna, valor in linha.items()}
+            for linha in df.astype({'estacao': str, **inteiras}).to_dict('records')
+        ]
+
+    def carregar(self, nome, versao):
+        """
+        Lê as origens da mais antiga para a mais recente (data de modificação
+        e, no empate, o nome). O mesmo período em mais de uma origem é
+        somado no cubo; nas médias mensais, que não guardam somas, fica o
+        da origem mais recente. O resultado não depende do nome das keys.
+        """
+        conjunto = self.conjuntos[nome]
+        origens = {}
+        for key, _, modificado in versao:
+            chaves, recente = origens.get(origem_objeto(key), ([], ''))
+            origens[origem_objeto(key)] = (chaves + [key], max(recente, modificado))
+
+        unicas = {}
+        for origem in sorted(origens, key=lambda origem: (origens[origem][1], origem)):
+            chaves = origens[origem][0]
+            if client.formato_saida == 'parquet':
+                linhas = self.ler_linhas_parquet(conjunto, chaves)
+            else:
+                linhas = [linha for key in chaves for linha in self.ler_linhas_csv(key, conjunto['esquema'])]
+            for linha in linhas:
+                chave = (linha['estacao'], linha[conjunto['periodo']])
+                anterior = unicas.get(chave)
+                if anterior is not None and conjunto['somar']:
+                    linha = combinar_linhas_rollup(anterior, linha)
+                unicas[chave] = linha
+        linhas = list(unicas.values())
+        print(f"Dataset {nome} carregado: {len(linhas)} linhas de {len(versao)} arquivos")
+        return IndiceAgregados(linhas, conjunto['periodo'], versao)
+
+    def indice(self, nome):
+        """
+        Índice do dataset, conferindo os ETags no máximo a cada `intervalo`
+        segundos e recarregando se algum objeto mudou
+        """
+        if nome not in self.conjuntos:
+            raise ErroConsulta(404, f"Dataset desconhecido: {nome} (disponíveis: {', '.join(self.conjuntos)})")
+        with self._travas[nome]:
+            indice = self.indices.get(nome)
+            agora = time.monotonic()
+            if indice is None or agora - self.verificado_em.get(nome, 0) >= self.intervalo:
+                versao = self.versao_atual(nome)
+                self.verificado_em[nome] = agora
+                if indice is None or versao != indice.versao:
+                    indice = self.carregar(nome, versao)
+                    self.indices[nome] = indice
+                    self.cache.invalidar(nome)
+            return indice
+
+    def listar_conjuntos(self):
+
+        conjuntos = []
+        for nome, conjunto in self.conjuntos.items():
+            indice = self.indice(nome)
+            inicio, fim = indice.limites()
+            conjuntos.append({
+                'nome': nome,
+                'linhas': indice.linhas,
+                'estacoes': sorted(indice.estacoes),
+                'inicio': inicio,
+                'fim': fim,
+                'colunas': list(conjunto['esquema'])
+            })
+        return conjuntos
+
+    def consultar(self, nome, estacoes=None, inicio=None, fim=None, campos=None):
+        """
+        Resposta JSON (bytes) e ETag da consulta. A chave do cache inclui a
+        versão do dataset, então uma nova versão nunca devolve resposta velha.
+        """
+        indice = self.indice(nome)
+        colunas = list(self.conjuntos[nome]['esquema'])
+        if campos:
+            desconhecidos = [campo for campo in campos if campo not in colunas]
+            if desconhecidos:
+                raise ErroConsulta(400, f"Campos desconhecidos: {desconhecidos} (colunas: {colunas})")
+
+        chave = (nome, indice.versao, estacoes, inicio, fim, campos)
+        etag = '"' + hashlib.sha1(repr(chave).encode('utf-8')).hexdigest()[:20] + '"'
+        corpo = self.cache.obter(chave)
+        if corpo is None:
+            linhas = indice.consultar(estacoes, inicio, fim)
+            if campos:
+                linhas = [{campo: linha[campo] for campo in campos} for linha in linhas]
+            corpo = json.dumps(
+                {'conjunto': nome, 'total': len(linhas), 'linhas': linhas},
+                ensure_ascii=False, separators=(',', ':')
+            ).encode('utf-8')
+            self.cache.guardar(chave, corpo)
+        return corpo, etag
+
+def normalizar_periodo(texto, final=False):
+    """
+    'AAAA', 'AAAA-MM' ou 'AAAA-MM-DD' -> data ISO; no fim do intervalo, o
+    último dia do ano ou do mês
+    """
+    if not texto:
+        return None
+    try:
+        partes = [int(parte) for parte in texto.split('-')]
+        if len(partes) == 1:
+            partes += [12 if final else 1]
+        if len(partes) == 2:
+            partes += [calendar.monthrange(partes[0], partes[1])[1] if final else 1]
+        ano, mes, dia = partes
+        calendar.weekday(ano, mes, dia)  # valida a data
+    except ValueError:
+        raise ErroConsulta(400, f"Período inválido: {texto} (use AAAA, AAAA-MM ou AAAA-MM-DD)")
+    return f"{ano:04d}-{mes:02d}-{dia:02d}"
+
+def lista_parametro(parametros, nome, maiusculas=False):
+    """
+    Valores de um parâmetro repetido ou separado por vírgula, sem repetir
+    """
+    valores = [
+        valor.strip().upper() if maiusculas else valor.strip()
+        for texto in parametros.get(nome, [])
+        for valor in texto.split(',')
+        if valor.strip()
+    ]
+    return tuple(dict.fromkeys(valores)) or None
+
+class ManipuladorConsultas(BaseHTTPRequestHandler):
+    """
+    GET /saude, /conjuntos e /consulta/<dataset>?estacao=&inicio=&fim=&campos=
+    """
+    servico = None
+    server_version = 'ConsultaClient/1.0'
+
+    def responder(self, status, corpo, etag=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', f"max-age={int(self.servico.intervalo)}")
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        partes = [parte for parte in url.path.split('/') if parte]
+        parametros = parse_qs(url.query)
+        etag = None
+        try:
+            if partes == ['saude']:
+                corpo = json.dumps({'status': 'ok', 'cache': self.servico.cache.resumo()}).encode('utf-8')
+            elif partes == ['conjuntos']:
+                corpo = json.dumps(self.servico.listar_conjuntos(), ensure_ascii=False).encode('utf-8')
+            elif len(partes) == 2 and partes[0] == 'consulta':
+                corpo, etag = self.servico.consultar(
+                    partes[1],
+                    estacoes=lista_parametro(parametros, 'estacao', maiusculas=True),
+                    inicio=normalizar_periodo(parametros.get('inicio', [''])[0]),
+                    fim=normalizar_periodo(parametros.get('fim', [''])[0], final=True),
+                    campos=lista_parametro(parametros, 'campos')
+                )
+                if etag in [valor.strip() for valor in self.headers.get('If-None-Match', '').split(',')]:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+            else:
+                raise ErroConsulta(404, f"Caminho desconhecido: {url.path}")
+            self.responder(200, corpo, etag)
+        except ErroConsulta as e:
+            self.responder(e.status, json.dumps({'erro': str(e)}, ensure_ascii=False).encode('utf-8'))
+        except Exception as e:
+            print(f"Erro ao responder {self.path}: {e}")
+            self.responder(500, json.dumps({'erro': f"Erro: {str(e)}"}, ensure_ascii=False).encode('utf-8'))
+
+    def log_message(self, formato, *args):
+        print(f"{self.address_string()} {formato % args}")
+
+def criar_servidor(host=None, porta=None, servico=None):
+    """
+    Servidor HTTP com uma thread por requisição, ainda sem atender
+    (serve_forever); porta 0 escolhe uma porta livre
+    """
+    manipulador = type('Manipulador', (ManipuladorConsultas,), {'servico': servico or ServicoConsulta()})
+    return ThreadingHTTPServer((host or host_padrao, porta_padrao if porta is None else porta), manipulador)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serviço de consulta aos agregados da camada client")
+    parser.add_argument('--host', default=host_padrao)
+    parser.add_argument('--porta', type=int, default=porta_padrao)
+    parser.add_argument('--sem-aquecer', action='store_true', help="Não carrega os datasets antes da primeira consulta")
+    args = parser.parse_args()
+
+    servico = ServicoConsulta()
+    if not args.sem_aquecer:
+        for conjunto in servico.listar_conjuntos():
+            print(f"{conjunto['nome']}: {conjunto['linhas']} linhas, estações {conjunto['estacoes']}, "
+                  f"{conjunto['inicio']} a {conjunto['fim']}")
+
+    servidor = criar_servidor(args.host, args.porta, servico)
+    print(f"Servindo em http://{args.host}:{servidor.server_port}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
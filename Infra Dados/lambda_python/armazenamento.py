@@ -0,0 +1,514 @@
+import hashlib
+import io
+import json
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+# Backends de armazenamento das Lambdas, escolhidos pela variável
+# ARMAZENAMENTO: 's3' (padrão, boto3), 'local' (um diretório por bucket) ou
+# 'memoria'. Os três expõem o subconjunto da API do cliente S3 usado pelo
+# pipeline (get/put/head/list/delete, escrita condicional e multipart), então
+# o resto do código é o mesmo em qualquer backend. Com o local, o pipeline
+# inteiro roda numa máquina sem credenciais da AWS, por exemplo:
+#
+#   ARMAZENAMENTO=local DIRETORIO_ARMAZENAMENTO=/dados \
+#       python backfill/backfill_weather.py inmet/
+
+backend_padrao = os.environ.get('ARMAZENAMENTO', 's3').lower()
+diretorio_padrao = os.environ.get('DIRETORIO_ARMAZENAMENTO', 'dados_locais')
+
+# Um cliente por configuração no processo: as duas Lambdas importadas juntas
+# (pipeline fundido, backfill) enxergam os mesmos objetos no backend em memória
+_clientes = {}
+_trava_clientes = threading.Lock()
+
+# Bloco da cópia de cada intervalo baixado para o buffer de destino
+bloco_copia = 1024 * 1024
+
+class _Excecoes:
+    """
+    Espelha s3_client.exceptions, usado pelas Lambdas para NoSuchKey
+    """
+
+    class NoSuchKey(Exception):
+        pass
+
+def _para_bytes(corpo):
+
+    if hasattr(corpo, 'read'):
+        corpo = corpo.read()
+    if isinstance(corpo, str):
+        corpo = corpo.encode('utf-8')
+    return bytes(corpo)
+
+def _intervalo(range_http, tamanho):
+    """
+    Converte o cabeçalho Range ('bytes=inicio-fim', fim inclusivo) em fatia
+    """
+    inicio, fim = range_http.split('=', 1)[1].split('-')
+    return int(inicio), min(int(fim) + 1 if fim else tamanho, tamanho)
+
+def _precondicao_falhou(operacao):
+
+    return ClientError({'Error': {'Code': 'PreconditionFailed'}}, operacao)
+
+class _Paginador:
+    """
+    Paginador de list_objects_v2: os backends locais devolvem tudo numa página
+    """
+
+    def __init__(self, cliente, operacao):
+        self.cliente = cliente
+        self.operacao = operacao
+
+    def paginate(self, **kwargs):
+        yield getattr(self.cliente, self.operacao)(**kwargs)
+
+class ArmazenamentoMemoria:
+    """
+    Objetos num dicionário do processo, para testes e simulações
+    """
+
+    def __init__(self):
+        self.objetos = {}
+        self.metadados = {}
+        self.modificados = {}
+        self.tags = {}
+        self.uploads = {}
+        self.bytes_lidos = 0
+        self.bytes_escritos = 0
+        self.exceptions = _Excecoes()
+        self._trava = threading.Lock()
+
+    def _etag(self, dados):
+        return f'"{hashlib.md5(dados).hexdigest()}"'
+
+    def _obter(self, bucket, key):
+        if (bucket, key) not in self.objetos:
+            raise self.exceptions.NoSuchKey(f"{bucket}/{key}")
+        return self.objetos[(bucket, key)]
+
+    def colocar(self, bucket, key, dados):
+        self.objetos[(bucket, key)] = bytes(dados)
+        self.modificados[(bucket, key)] = datetime.now(timezone.utc)
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, **kwargs):
+        dados = self._obter(Bucket, Key)
+        etag = self._etag(dados)
+        if IfMatch and IfMatch != etag:
+            raise _precondicao_falhou('GetObject')
+        if Range:
+            inicio, fim = _intervalo(Range, len(dados))
+            dados = dados[inicio:fim]
+        with self._trava:
+            self.bytes_lidos += len(dados)
+        return {
+            'Body': io.BytesIO(dados),
+            'ContentLength': len(dados),
+            'ETag': etag,
+            'Metadata': self.metadados.get((Bucket, Key), {})
+        }
+
+    def head_object(self, Bucket, Key, **kwargs):
+        dados = self._obter(Bucket, Key)
+        return {
+            'ContentLength': len(dados),
+            'ETag': self._etag(dados),
+            'Metadata': self.metadados.get((Bucket, Key), {})
+        }
+
+    def put_object(self, Bucket, Key, Body=b'', Metadata=None, IfMatch=None, IfNoneMatch=None, **kwargs):
+        dados = _para_bytes(Body)
+        with self._trava:
+            atual = self.objetos.get((Bucket, Key))
+            if (IfNoneMatch == '*' and atual is not None) or \
+                    (IfMatch and (atual is None or self._etag(atual) != IfMatch)):
+                raise _precondicao_falhou('PutObject')
+            self.colocar(Bucket, Key, dados)
+            self.metadados[(Bucket, Key)] = Metadata or {}
+        self.bytes_escritos += len(dados)
+        return {'ETag': self._etag(dados)}
+
+    def create_multipart_upload(self, Bucket, Key, Metadata=None, **kwargs):
+        with self._trava:
+            upload_id = str(len(self.uploads) + 1)
+            while upload_id in self.uploads:
+                upload_id = str(int(upload_id) + 1)
+            self.uploads[upload_id] = {'partes': {}, 'metadata': Metadata or {}}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        dados = bytes(Body)
+        self.uploads[UploadId]['partes'][PartNumber] = dados
+        self.bytes_escritos += len(dados)
+        return {'ETag': self._etag(dados)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        upload = self.uploads.pop(UploadId)
+        partes = upload['partes']
+        self.colocar(Bucket, Key, b''.join(partes[parte['PartNumber']] for parte in MultipartUpload['Parts']))
+        self.metadados[(Bucket, Key)] = upload['metadata']
+        return {'ETag': self._etag(self.objetos[(Bucket, Key)])}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self.uploads.pop(UploadId, None)
+
+    def put_object_tagging(self, Bucket, Key, Tagging, **kwargs):
+        self.tags[(Bucket, Key)] = Tagging
+
+    def list_objects_v2(self, Bucket, Prefix='', **kwargs):
+        chaves = sorted(k for b, k in self.objetos if b == Bucket and k.startswith(Prefix))
+        return {
+            'Contents': [
+                {
+                    'Key': k,
+                    'Size': len(self.objetos[(Bucket, k)]),
+                    'ETag': self._etag(self.objetos[(Bucket, k)]),
+                    'LastModified': self.modificados[(Bucket, k)]
+                }
+                for k in chaves
+            ],
+            'KeyCount': len(chaves),
+            'IsTruncated': False
+        }
+
+    def get_paginator(self, operacao):
+        return _Paginador(self, operacao)
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self.objetos.pop((Bucket, Key), None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        for objeto in Delete['Objects']:
+            self.objetos.pop((Bucket, objeto['Key']), None)
+        return {'Deleted': Delete['Objects']}
+
+class ArmazenamentoLocal:
+    """
+    Cada bucket é um subdiretório da raiz e cada key um arquivo. As leituras
+    devolvem o arquivo mapeado em memória (mmap) como Body: o parse lê direto
+    das páginas do arquivo, sem copiar o objeto para a memória do processo.
+    Metadata e tags ficam em .metadados/, as escritas passam por .tmp/ e
+    entram com os.replace, então um leitor nunca vê um arquivo pela metade.
+    """
+
+    pasta_metadados = '.metadados'
+    pasta_temporaria = '.tmp'
+
+    def __init__(self, raiz):
+        self.raiz = os.path.abspath(raiz)
+        self.exceptions = _Excecoes()
+        self.bytes_lidos = 0
+        self.bytes_escritos = 0
+        self._trava = threading.Lock()
+        os.makedirs(os.path.join(self.raiz, self.pasta_temporaria), exist_ok=True)
+
+    def _caminho(self, bucket, key, base=None):
+        pasta = os.path.join(self.raiz, base, bucket) if base else os.path.join(self.raiz, bucket)
+        caminho = os.path.abspath(os.path.join(pasta, *key.split('/')))
+        if not caminho.startswith(pasta + os.sep):
+            raise ValueError(f"Key fora do bucket: {key}")
+        return caminho
+
+    def _caminho_metadados(self, bucket, key):
+        return self._caminho(bucket, key, self.pasta_metadados) + '.json'
+
+    def _etag(self, caminho):
+        """
+        ETag pela data de modificação e tamanho, sem ler o arquivo: muda a
+        cada gravação, o que basta para a escrita condicional
+        """
+        try:
+            estado = os.stat(caminho)
+        except FileNotFoundError:
+            return None
+        return f'"{estado.st_mtime_ns:x}-{estado.st_size:x}"'
+
+    def _ler_metadados(self, bucket, key):
+        try:
+            with open(self._caminho_metadados(bucket, key), encoding='utf-8') as arquivo:
+                return json.load(arquivo)
+        except FileNotFoundError:
+            return {}
+
+    def _gravar_metadados(self, bucket, key, **campos):
+        caminho = self._caminho_metadados(bucket, key)
+        dados = {**self._ler_metadados(bucket, key), **campos}
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        with open(caminho, 'w', encoding='utf-8') as arquivo:
+            json.dump(dados, arquivo)
+
+    def _arquivo_temporario(self):
+        return tempfile.NamedTemporaryFile(dir=os.path.join(self.raiz, self.pasta_temporaria), delete=False)
+
+    def _publicar(self, temporario, bucket, key, metadata, if_match=None, if_none_match=None):
+        """
+        Move o arquivo temporário para a key, conferindo a pré-condição
+        """
+        destino = self._caminho(bucket, key)
+        with self._trava:
+            atual = self._etag(destino)
+            if (if_none_match == '*' and atual is not None) or (if_match and atual != if_match):
+                os.unlink(temporario)
+                raise _precondicao_falhou('PutObject')
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            os.replace(temporario, destino)
+            self._gravar_metadados(bucket, key, Metadata=metadata or {})
+            return self._etag(destino)
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, **kwargs):
+        caminho = self._caminho(Bucket, Key)
+        try:
+            arquivo = open(caminho, 'rb')
+        except FileNotFoundError:
+            raise self.exceptions.NoSuchKey(f"{Bucket}/{Key}")
+        with arquivo:
+            tamanho = os.fstat(arquivo.fileno()).st_size
+            etag = self._etag(caminho)
+            if IfMatch and IfMatch != etag:
+                raise _precondicao_falhou('GetObject')
+            if Range:
+                inicio, fim = _intervalo(Range, tamanho)
+                arquivo.seek(inicio)
+                corpo = io.BytesIO(arquivo.read(fim - inicio))
+                tamanho = fim - inicio
+            elif tamanho == 0:
+                # mmap não aceita arquivo vazio
+                corpo = io.BytesIO(b'')
+            else:
+                corpo = mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+        with self._trava:
+            self.bytes_lidos += tamanho
+        return {
+            'Body': corpo,
+            'ContentLength': tamanho,
+            'ETag': etag,
+            'Metadata': self._ler_metadados(Bucket, Key).get('Metadata', {})
+        }
+
+    def head_object(self, Bucket, Key, **kwargs):
+        caminho = self._caminho(Bucket, Key)
+        etag = self._etag(caminho)
+        if etag is None:
+            raise self.exceptions.NoSuchKey(f"{Bucket}/{Key}")
+        return {
+            'ContentLength': os.path.getsize(caminho),
+            'ETag': etag,
+            'Metadata': self._ler_metadados(Bucket, Key).get('Metadata', {})
+        }
+
+    def put_object(self, Bucket, Key, Body=b'', Metadata=None, IfMatch=None, IfNoneMatch=None, **kwargs):
+        dados = _para_bytes(Body)
+        with self._arquivo_temporario() as temporario:
+            temporario.write(dados)
+        etag = self._publicar(temporario.name, Bucket, Key, Metadata, IfMatch, IfNoneMatch)
+        self.bytes_escritos += len(dados)
+        return {'ETag': etag}
+
+    def create_multipart_upload(self, Bucket, Key, Metadata=None, **kwargs):
+        pasta = tempfile.mkdtemp(dir=os.path.join(self.raiz, self.pasta_temporaria))
+        with open(os.path.join(pasta, 'metadata.json'), 'w', encoding='utf-8') as arquivo:
+            json.dump(Metadata or {}, arquivo)
+        return {'UploadId': os.path.basename(pasta)}
+
+    def _pasta_upload(self, upload_id):
+        return os.path.join(self.raiz, self.pasta_temporaria, os.path.basename(upload_id))
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        dados = bytes(Body)
+        with open(os.path.join(self._pasta_upload(UploadId), f"{PartNumber:05d}.parte"), 'wb') as arquivo:
+            arquivo.write(dados)
+        self.bytes_escritos += len(dados)
+        return {'ETag': f'"{hashlib.md5(dados).hexdigest()}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        pasta = self._pasta_upload(UploadId)
+        with open(os.path.join(pasta, 'metadata.json'), encoding='utf-8') as arquivo:
+            metadata = json.load(arquivo)
+        with self._arquivo_temporario() as temporario:
+            for parte in MultipartUpload['Parts']:
+                with open(os.path.join(pasta, f"{parte['PartNumber']:05d}.parte"), 'rb') as arquivo:
+                    shutil.copyfileobj(arquivo, temporario)
+        etag = self._publicar(temporario.name, Bucket, Key, metadata)
+        shutil.rmtree(pasta, ignore_errors=True)
+        return {'ETag': etag}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        shutil.rmtree(self._pasta_upload(UploadId), ignore_errors=True)
+
+    def put_object_tagging(self, Bucket, Key, Tagging, **kwargs):
+        self._gravar_metadados(Bucket, Key, Tagging=Tagging)
+
+    def list_objects_v2(self, Bucket, Prefix='', **kwargs):
+        pasta_bucket = os.path.join(self.raiz, Bucket)
+        # Só desce no diretório do prefixo, não no bucket inteiro
+        pasta_prefixo = os.path.join(pasta_bucket, *Prefix.split('/')[:-1])
+        objetos = []
+        for pasta, _, arquivos in os.walk(pasta_prefixo):
+            for nome in arquivos:
+                caminho = os.path.join(pasta, nome)
+                key = os.path.relpath(caminho, pasta_bucket).replace(os.sep, '/')
+                if key.startswith(Prefix):
+                    estado = os.stat(caminho)
+                    objetos.append({
+                        'Key': key,
+                        'Size': estado.st_size,
+                        'ETag': self._etag(caminho),
+                        'LastModified': datetime.fromtimestamp(estado.st_mtime, timezone.utc)
+                    })
+        objetos.sort(key=lambda objeto: objeto['Key'])
+        return {'Contents': objetos, 'KeyCount': len(objetos), 'IsTruncated': False}
+
+    def get_paginator(self, operacao):
+        return _Paginador(self, operacao)
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        for caminho in (self._caminho(Bucket, Key), self._caminho_metadados(Bucket, Key)):
+            try:
+                os.unlink(caminho)
+            except FileNotFoundError:
+                pass
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        for objeto in Delete['Objects']:
+            self.delete_object(Bucket, objeto['Key'])
+        return {'Deleted': Delete['Objects']}
+
+def fonte_leitura(response):
+    """
+    Fonte para o parse do corpo de um get_object: o próprio arquivo mapeado
+    no backend local (sem cópia) ou o corpo lido para um BytesIO. As duas
+    aceitam read e seek, para ler o cabeçalho e voltar ao início.
+    """
+    corpo = response['Body']
+    if isinstance(corpo, mmap.mmap):
+        return corpo
+    return io.BytesIO(corpo.read())
+
+def intervalos(tamanho, tamanho_intervalo):
+    """
+    Fatias (inicio, fim) que cobrem um objeto de `tamanho` bytes, fim exclusivo
+    """
+    return [(inicio, min(inicio + tamanho_intervalo, tamanho)) for inicio in range(0, tamanho, tamanho_intervalo)]
+
+def _baixar_intervalo(cliente, bucket, key, inicio, fim, etag, destino=None):
+    """
+    GET de um intervalo do objeto, preso à versão do ETag: se o objeto for
+    regravado no meio do download, o GET falha em vez de misturar versões.
+    Com `destino`, copia em blocos direto para a mesma posição do buffer.
+    """
+    corpo = cliente.get_object(Bucket=bucket, Key=key, Range=f"bytes={inicio}-{fim - 1}", IfMatch=etag)['Body']
+    if destino is None:
+        dados = corpo.read()
+        posicao = inicio + len(dados)
+    else:
+        posicao = inicio
+        while posicao < fim:
+            bloco = corpo.read(min(bloco_copia, fim - posicao))
+            if not bloco:
+                break
+            destino[posicao:posicao + len(bloco)] = bloco
+            posicao += len(bloco)
+    if posicao != fim:
+        raise IOError(f"Intervalo {inicio}-{fim - 1} de {bucket}/{key} incompleto: "
+                      f"{posicao - inicio} de {fim - inicio} bytes")
+    return None if destino is not None else dados
+
+def baixar_intervalos(cliente, bucket, key, tamanho, etag, tamanho_intervalo, concorrencia):
+    """
+    Baixa o objeto em intervalos simultâneos para um buffer pré-alocado do
+    tamanho do objeto (mmap anônimo, que o parse lê como o do backend local)
+    """
+    buffer = mmap.mmap(-1, tamanho)
+    executor = ThreadPoolExecutor(max_workers=concorrencia)
+    try:
+        futuros = [
+            executor.submit(_baixar_intervalo, cliente, bucket, key, inicio, fim, etag, buffer)
+            for inicio, fim in intervalos(tamanho, tamanho_intervalo)
+        ]
+        for futuro in futuros:
+            futuro.result()
+    except BaseException:
+        executor.shutdown(wait=True, cancel_futures=True)
+        buffer.close()
+        raise
+    executor.shutdown(wait=True)
+    return buffer
+
+class LeitorIntervalos(io.RawIOBase):
+    """
+    Arquivo somente leitura que entrega o objeto em ordem enquanto os
+    próximos intervalos são baixados em paralelo. Mantém no máximo
+    `concorrencia` intervalos em voo além do que está sendo lido, então a
+    memória fica limitada mesmo para objetos de vários GB (para o parse em
+    chunks).
+    """
+
+    def __init__(self, cliente, bucket, key, tamanho, etag, tamanho_intervalo, concorrencia):
+        super().__init__()
+        self._baixar = lambda inicio, fim: _baixar_intervalo(cliente, bucket, key, inicio, fim, etag)
+        self._proximos = iter(intervalos(tamanho, tamanho_intervalo))
+        self._pendentes = deque()
+        self._atual = memoryview(b'')
+        self._executor = ThreadPoolExecutor(max_workers=concorrencia)
+        for _ in range(concorrencia):
+            self._agendar()
+
+    def _agendar(self):
+        intervalo = next(self._proximos, None)
+        if intervalo:
+            self._pendentes.append(self._executor.submit(self._baixar, *intervalo))
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        while not self._atual:
+            if not self._pendentes:
+                return 0
+            self._atual = memoryview(self._pendentes.popleft().result())
+            self._agendar()
+        n = min(len(destino), len(self._atual))
+        destino[:n] = self._atual[:n]
+        self._atual = self._atual[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._pendentes.clear()
+            self._atual = memoryview(b'')
+        super().close()
+
+def criar_cliente(regiao=None, endpoint_url=None, backend=None, diretorio=None, max_conexoes=None):
+    """
+    Cliente de armazenamento do backend configurado, reutilizado no processo.
+    max_conexoes dimensiona o pool HTTP do boto3 para os downloads paralelos.
+    """
+    backend = (backend or backend_padrao).lower()
+    diretorio = diretorio or diretorio_padrao
+    chave = (backend, regiao, endpoint_url, max_conexoes) if backend == 's3' else (backend, os.path.abspath(diretorio))
+    with _trava_clientes:
+        if chave not in _clientes:
+            if backend == 's3':
+                import boto3
+                from botocore.config import Config
+                config = Config(max_pool_connections=max(max_conexoes, 10)) if max_conexoes else None
+                _clientes[chave] = boto3.client('s3', region_name=regiao, endpoint_url=endpoint_url, config=config)
+            elif backend == 'local':
+                _clientes[chave] = ArmazenamentoLocal(diretorio)
+            elif backend == 'memoria':
+                _clientes[chave] = ArmazenamentoMemoria()
+            else:
+                raise ValueError(f"ARMAZENAMENTO inválido: {backend} (use 's3', 'local' ou 'memoria')")
+        return _clientes[chave]
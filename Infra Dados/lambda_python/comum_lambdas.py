@@ -0,0 +1,388 @@
+import contextlib
+import hashlib
+import importlib
+import io
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import unquote_plus
+
+try:
+    import resource
+except ImportError:  # Windows, ao rodar localmente
+    resource = None
+
+# Apoio comum às Lambdas (trusted, client e enriquecimento): imports
+# adiados, métricas por etapa, perfil, upload multipart, nomes das saídas
+# por objeto e leitura dos eventos do S3/SQS. Sem pandas aqui, para não pesar no cold start.
+
+# O S3 exige partes de no mínimo 5 MB no multipart upload (exceto a última)
+tamanho_parte_upload = max(int(os.environ.get('TAMANHO_PARTE_UPLOAD', str(8 * 1024 * 1024))), 5 * 1024 * 1024)
+
+# Métricas por etapa em linhas JSON no formato EMF, que o CloudWatch Logs
+# transforma em métricas sem chamadas extras à API
+emitir_metricas = os.environ.get('EMITIR_METRICAS', 'true').lower() == 'true'
+namespace_metricas = os.environ.get('NAMESPACE_METRICAS', 'Grupo3/Weather')
+
+# Perfil opcional com cProfile (PERFILAR=true); ARQUIVO_PERFIL salva o .prof
+perfilar = os.environ.get('PERFILAR', 'false').lower() == 'true'
+linhas_perfil = int(os.environ.get('LINHAS_PERFIL', '25'))
+arquivo_perfil = os.environ.get('ARQUIVO_PERFIL')
+
+# Tempo de cada import adiado, compartilhado pelas Lambdas do mesmo processo
+tempos_importacao = {}
+
+class ModuloPreguicoso:
+    """
+    Adia o import de um módulo pesado até o primeiro uso de um atributo,
+    registrando quanto tempo o import levou
+    """
+
+    def __init__(self, nome):
+        self._nome = nome
+        self._modulo = None
+
+    def __getattr__(self, atributo):
+        if self._modulo is None:
+            inicio = time.perf_counter()
+            self._modulo = importlib.import_module(self._nome)
+            tempos_importacao[self._nome] = time.perf_counter() - inicio
+        return getattr(self._modulo, atributo)
+
+def memoria_pico_mb():
+    """
+    Pico de memória residente do processo em MB (None fora de sistemas Unix)
+    """
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+class MedidorEtapas:
+    """
+    Mede cada etapa do processamento (tempo, linhas, bytes e pico de memória),
+    acumulando quando a etapa se repete por chunk. O tempo de uma etapa
+    aninhada é descontado da etapa de fora, então nada é contado duas vezes.
+    """
+
+    def __init__(self, funcao):
+        self.funcao = funcao
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.etapas = {}
+        # Pilha de etapas abertas por thread (o backfill grava no S3 em paralelo)
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def etapa(self, nome, linhas_entrada=0):
+        registro = self.etapas.setdefault(nome, {
+            'segundos': 0.0,
+            'chamadas': 0,
+            'linhas_entrada': 0,
+            'linhas_saida': 0,
+            'bytes': 0,
+            'memoria_pico_mb': None
+        })
+        registro['linhas_entrada'] += linhas_entrada
+        pilha = self._local.__dict__.setdefault('pilha', [])
+        pilha.append(0.0)
+        inicio = time.perf_counter()
+        try:
+            yield registro
+        finally:
+            duracao = time.perf_counter() - inicio
+            aninhadas = pilha.pop()
+            if pilha:
+                pilha[-1] += duracao
+            registro['segundos'] += duracao - aninhadas
+            registro['chamadas'] += 1
+            registro['memoria_pico_mb'] = memoria_pico_mb()
+
+    def resumo(self):
+        return {
+            nome: {**registro, 'segundos': round(registro['segundos'], 4)}
+            for nome, registro in self.etapas.items()
+        }
+
+    def emitir(self, request_id):
+        """
+        Uma linha JSON por etapa no formato EMF, com a função e a etapa como dimensões
+        """
+        if not emitir_metricas:
+            return
+        agora = int(time.time() * 1000)
+        for nome, registro in self.etapas.items():
+            valores = {
+                'Segundos': (round(registro['segundos'], 6), 'Seconds'),
+                'LinhasEntrada': (registro['linhas_entrada'], 'Count'),
+                'LinhasSaida': (registro['linhas_saida'], 'Count'),
+                'Bytes': (registro['bytes'], 'Bytes'),
+                'MemoriaPicoMB': (registro['memoria_pico_mb'], 'Megabytes')
+            }
+            valores = {metrica: par for metrica, par in valores.items() if par[0] is not None}
+            linha = {
+                '_aws': {
+                    'Timestamp': agora,
+                    'CloudWatchMetrics': [{
+                        'Namespace': namespace_metricas,
+                        'Dimensions': [['Funcao', 'Etapa']],
+                        'Metrics': [{'Name': metrica, 'Unit': unidade} for metrica, (_, unidade) in valores.items()]
+                    }]
+                },
+                'Funcao': self.funcao,
+                'Etapa': nome,
+                'Chamadas': registro['chamadas'],
+                'RequestId': request_id,
+                **{metrica: valor for metrica, (valor, _) in valores.items()}
+            }
+            print(json.dumps(linha))
+
+@contextlib.contextmanager
+def perfil_opcional():
+    """
+    Com PERFILAR=true, roda o bloco sob cProfile e imprime as funções com
+    maior tempo acumulado; com ARQUIVO_PERFIL, salva o perfil completo
+    """
+    if not perfilar:
+        yield
+        return
+
+    import cProfile
+    import pstats
+
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        yield
+    finally:
+        perfil.disable()
+        saida = io.StringIO()
+        pstats.Stats(perfil, stream=saida).sort_stats('cumulative').print_stats(linhas_perfil)
+        print(saida.getvalue())
+        if arquivo_perfil:
+            perfil.dump_stats(arquivo_perfil)
+            print(f"Perfil salvo em {arquivo_perfil}")
+
+class EscritorMultipartS3(io.RawIOBase):
+    """
+    Stream binário que envia ao S3 de forma incremental usando multipart upload,
+    em partes de tamanho_parte_upload. Se o conteúdo total couber em uma única
+    parte, faz um put_object simples. Pode ser embrulhado em io.TextIOWrapper
+    para o to_csv escrever direto nele. Os envios entram na etapa 'put' do medidor.
+    """
+
+    def __init__(self, cliente, medidor, bucket, key, content_type='text/csv', metadata=None):
+        super().__init__()
+        self.cliente = cliente
+        self.medidor = medidor
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.metadata = metadata or {}
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.partes = []
+        self.bytes_enviados = 0
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self.buffer.extend(dados)
+        if len(self.buffer) >= tamanho_parte_upload:
+            self._enviar_parte()
+        return len(dados)
+
+    def _enviar_parte(self):
+        if self.upload_id is None:
+            response = self.cliente.create_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                ContentType=self.content_type,
+                Metadata=self.metadata
+            )
+            self.upload_id = response['UploadId']
+
+        numero = len(self.partes) + 1
+        with self.medidor.etapa('put') as etapa:
+            response = self.cliente.upload_part(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id,
+                PartNumber=numero,
+                Body=bytes(self.buffer)
+            )
+            etapa['bytes'] += len(self.buffer)
+        self.partes.append({'ETag': response['ETag'], 'PartNumber': numero})
+        self.bytes_enviados += len(self.buffer)
+        self.buffer = bytearray()
+
+    def finalizar(self, metadata_final=None):
+        metadata = {**self.metadata, **(metadata_final or {})}
+
+        if self.upload_id is None:
+            # Conteúdo pequeno: um único PUT já com toda a metadata
+            with self.medidor.etapa('put') as etapa:
+                self.cliente.put_object(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    Body=bytes(self.buffer),
+                    ContentType=self.content_type,
+                    Metadata=metadata
+                )
+                etapa['bytes'] += len(self.buffer)
+            self.bytes_enviados += len(self.buffer)
+            self.buffer = bytearray()
+            return
+
+        if self.buffer:
+            self._enviar_parte()
+
+        with self.medidor.etapa('put'):
+            self.cliente.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={'Parts': self.partes}
+            )
+        self.upload_id = None
+
+        # A metadata do multipart é fixada na criação; o que só se conhece
+        # no final (ex.: total de linhas) vai como tag para não gerar novo evento
+        if metadata_final:
+            self.cliente.put_object_tagging(
+                Bucket=self.bucket,
+                Key=self.key,
+                Tagging={'TagSet': [{'Key': k, 'Value': str(v)} for k, v in metadata_final.items()]}
+            )
+
+    def abort(self):
+        if self.upload_id is not None:
+            self.cliente.abort_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id
+            )
+            self.upload_id = None
+        self.buffer = bytearray()
+
+def escrever_csv_s3(df, escritor, **opcoes):
+    """
+    Serializa o DataFrame direto no escritor multipart: o to_csv escreve em
+    blocos de linhas e cada bloco é codificado e enviado enquanto o resto
+    ainda está sendo gerado, sem montar o CSV inteiro em memória
+    """
+    texto = io.TextIOWrapper(escritor, encoding='utf-8', newline='')
+    try:
+        # O envio das partes fica na etapa 'put', aninhada nesta
+        with escritor.medidor.etapa('serializacao', len(df)) as etapa:
+            df.to_csv(texto, **opcoes)
+            texto.flush()
+            etapa['linhas_saida'] += len(df)
+    finally:
+        # Solta o escritor sem fechá-lo; quem finaliza o upload é quem o criou
+        texto.detach()
+
+def nome_base_arquivo(key):
+    """
+    Nome das saídas geradas a partir de um objeto: o nome do arquivo sem
+    extensão e um hash curto da key inteira, para que inmet/2023/dados.csv
+    e inmet/2024/dados.csv não gravem por cima um do outro
+    """
+    nome = os.path.splitext(os.path.basename(key))[0]
+    return f"{nome}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:10]}"
+
+def parte_do_arquivo(key, nome_base):
+    """
+    Se o parquet da key foi gerado a partir do objeto de nome_base: o
+    arquivo único ou uma das partes numeradas do streaming (-00001)
+    """
+    nome = key.rsplit('/', 1)[-1]
+    return re.fullmatch(rf"{re.escape(nome_base)}(-\d{{5}})?\.parquet", nome) is not None
+
+def registros_s3_evento(event):
+    """
+    Registros de notificação do S3 no evento, com o messageId da mensagem
+    SQS de origem (None na notificação direta). No lote da fila, cada
+    mensagem traz a notificação do S3 serializada no body.
+    """
+    for record in (event or {}).get('Records', []):
+        if record.get('eventSource') != 'aws:sqs':
+            yield record, None
+            continue
+        try:
+            corpo = json.loads(record.get('body') or '{}')
+        except ValueError:
+            print(f"Mensagem {record.get('messageId')} ignorada: body não é JSON")
+            continue
+        # O s3:TestEvent enviado ao criar a notificação não tem Records
+        for registro in corpo.get('Records', []):
+            yield registro, record.get('messageId')
+
+def objeto_do_registro(record):
+    """
+    (bucket, key) de um registro de objeto criado, ou None
+    """
+    if not record.get('eventName', 'ObjectCreated').startswith('ObjectCreated'):
+        return None
+    s3_info = record.get('s3', {})
+    bucket = s3_info.get('bucket', {}).get('name')
+    # As chaves chegam codificadas na notificação (espaço vira '+')
+    key = unquote_plus(s3_info.get('object', {}).get('key', ''))
+    # Ignora "pastas" criadas pelo console
+    if bucket and key and not key.endswith('/'):
+        return bucket, key
+    return None
+
+def extrair_objetos_evento(event, objeto_padrao):
+    """
+    Lista (bucket, key) de cada objeto criado no evento, sem repetir: no lote
+    da fila, várias notificações do mesmo objeto viram um único processamento.
+    Sem registros (execução manual ou local), usa o objeto padrão da Lambda.
+    """
+    objetos = {}
+    for record, _ in registros_s3_evento(event):
+        objeto = objeto_do_registro(record)
+        if objeto:
+            objetos[objeto] = True
+
+    if not (event or {}).get('Records'):
+        objetos[objeto_padrao] = True
+    return list(objetos)
+
+def falhas_lote(event, resultados=None):
+    """
+    batchItemFailures da resposta para a fila: só as mensagens dos objetos
+    que falharam voltam para a fila. Sem resultados (erro geral), todas voltam.
+    Retorna {} se o evento não veio da fila.
+    """
+    mensagens = [r.get('messageId') for r in (event or {}).get('Records', []) if r.get('eventSource') == 'aws:sqs']
+    if not mensagens:
+        return {}
+    if resultados is None:
+        falhas = mensagens
+    else:
+        com_falha = {(r['bucket'], r['key']) for r in resultados if not r['success']}
+        falhas = list(dict.fromkeys(
+            message_id for record, message_id in registros_s3_evento(event)
+            if objeto_do_registro(record) in com_falha
+        ))
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in falhas]}
+
+def tempos_execucao(cold_start, imports_antes, duration, duracao_init):
+    """
+    Separa o tempo de init do módulo (só na primeira invocação do container),
+    os imports adiados feitos nesta invocação e o tempo do handler
+    """
+    return {
+        'cold_start': cold_start,
+        'init_seconds': round(duracao_init, 4) if cold_start else 0.0,
+        'lazy_import_seconds': {
+            nome: round(segundos, 4)
+            for nome, segundos in tempos_importacao.items()
+            if nome not in imports_antes
+        },
+        'handler_seconds': duration
+    }
@@ -0,0 +1,290 @@
+import time
+_inicio_init = time.perf_counter()
+
+import io
+import json
+import os
+from datetime import datetime
+
+import comum_lambdas as comum
+import esquema_weather as esquema
+import indice_comentarios as indice
+import tratamento_para_client as client
+
+# Cliente S3, métricas por etapa, leitura de parquet e gravação no bucket
+# client vêm da Lambda client, que vai no mesmo pacote
+pd = client.pd
+
+# Configurações
+nome_bucket_client = client.nome_bucket_client
+prefixo_comentarios = 'comentarios/'
+prefixo_clima_diario = f"{client.prefixo_rollup}diario/"
+prefixo_clima_diario_parquet = f"{client.prefixo_rollup_parquet}diario/"
+prefixo_saida = 'comentarios_clima/'
+prefixo_saida_parquet = 'comentarios_clima_parquet/'
+arquivo_saida = 'comentarios_clima.csv'
+
+# Estações associadas a cada comentário (uma linha por comentário e estação)
+estacoes = [
+    estacao.strip().upper()
+    for estacao in os.environ.get('ESTACOES', 'A771,A701').split(',')
+    if estacao.strip()
+]
+
+# Leitura mais antiga aceita antes do comentário; sem leitura nesse
+# intervalo, o comentário fica com o clima vazio
+tolerancia_dias = int(os.environ.get('TOLERANCIA_DIAS_CLIMA', '7'))
+
+# Mantém o índice invertido de comment_text junto com o enriquecimento
+indexar = os.environ.get('INDEXAR_COMENTARIOS', 'true').lower() == 'true'
+
+# Colunas do cubo diário usadas no enriquecimento e o nome na saída
+colunas_clima = {
+    'temperatura_media': 'temperatura',
+    'precipitacao_soma': 'precipitacao',
+    'umidade_media': 'umidade'
+}
+
+medidor = comum.MedidorEtapas('enriquecimento_comentarios')
+
+def listar_chaves(bucket, prefixo, sufixo):
+
+    paginator = client.s3_client.get_paginator('list_objects_v2')
+    return sorted(
+        obj['Key']
+        for pagina in paginator.paginate(Bucket=bucket, Prefix=prefixo)
+        for obj in pagina.get('Contents', [])
+        if obj['Key'].endswith(sufixo)
+    )
+
+def ler_csvs_s3(bucket, prefixo, esquema_camada, camada, colunas=None):
+    """
+    Lê e concatena todos os CSVs do prefixo, validando o cabeçalho de cada
+    um contra o esquema da camada antes do parse
+    """
+    chaves = listar_chaves(bucket, prefixo, '.csv')
+    if not chaves:
+        raise FileNotFoundError(f"Nenhum CSV encontrado em s3://{bucket}/{prefixo}")
+
+    partes = []
+    for key in chaves:
+        with medidor.etapa('s3_get') as etapa:
+            conteudo = client.s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+            etapa['bytes'] += len(conteudo)
+        esquema.validar_colunas(esquema.cabecalho_csv(conteudo[:65536], sep=';'), esquema_camada, camada, colunas)
+        with medidor.etapa('parse') as etapa:
+            parte = pd.read_csv(
+                io.BytesIO(conteudo),
+                sep=';',
+                encoding='utf-8-sig',  # o CSV de comentários vem com BOM
+                **esquema.opcoes_leitura(esquema_camada, colunas)
+            )
+            etapa['linhas_saida'] += len(parte)
+        partes.append(parte)
+
+    print(f"{len(chaves)} arquivos lidos de s3://{bucket}/{prefixo}")
+    return pd.concat(partes, ignore_index=True)
+
+def ler_comentarios():
+    """
+    Comentários exportados para o bucket client, com a data de criação
+    convertida; comentários sem data válida ficam de fora
+    """
+    comentarios = ler_csvs_s3(nome_bucket_client, prefixo_comentarios, esquema.esquema_comentarios, 'comentarios')
+    with medidor.etapa('limpeza', len(comentarios)) as etapa:
+        # Exportações diferentes usam 'T' ou espaço entre a data e a hora
+        comentarios['comment_created_at'] = pd.to_datetime(
+            comentarios['comment_created_at'], format='ISO8601', errors='coerce'
+        )
+        sem_data = int(comentarios['comment_created_at'].isna().sum())
+        if sem_data:
+            print(f"{sem_data} comentários sem data de criação válida foram ignorados")
+        # O mesmo comentário pode vir em mais de uma exportação
+        comentarios = comentarios.dropna(subset=['comment_created_at']).drop_duplicates('comment_id', keep='last')
+        etapa['linhas_saida'] += len(comentarios)
+    return comentarios
+
+def juntar_dias_repetidos(clima):
+    """
+    Sem o estado do client (MODO_INCREMENTAL) há um rollup por arquivo raw, e o mesmo dia pode
+    vir de mais de um. As somas (em centavos) e contagens desses dias são
+    somadas e a média recalculada, como no rollup da Lambda client, sem
+    depender da ordem da listagem.
+    """
+    somas = [f"{coluna.rsplit('_', 1)[0]}_soma" for coluna in colunas_clima]
+    contagens = [f"{coluna.rsplit('_', 1)[0]}_contagem" for coluna in colunas_clima]
+    clima = clima.assign(**client.para_centavos(clima[somas]))
+    clima = clima.groupby(['estacao', 'periodo'], as_index=False)[somas + contagens].sum(min_count=1)
+    for coluna in colunas_clima:
+        metrica, estatistica = coluna.rsplit('_', 1)
+        soma = clima[f"{metrica}_soma"] / 100
+        if estatistica == 'media':
+            contagem = clima[f"{metrica}_contagem"]
+            clima[coluna] = (soma / contagem.where(contagem > 0)).round(2)
+        else:
+            clima[coluna] = soma.round(2)
+    return clima[['estacao', 'periodo'] + list(colunas_clima)]
+
+def ler_clima_diario():
+    """
+    Leituras diárias por estação do cubo do client (rollup diário)
+    """
+    colunas = ['estacao', 'periodo'] + sorted({
+        f"{coluna.rsplit('_', 1)[0]}_{estatistica}" for coluna in colunas_clima for estatistica in ('soma', 'contagem')
+    })
+    if client.formato_saida == 'parquet':
+        clima = client.ler_parquet_particionado_s3(nome_bucket_client, prefixo_clima_diario_parquet, colunas)
+        clima['periodo'] = pd.to_datetime(clima['periodo'])
+    else:
+        clima = ler_csvs_s3(nome_bucket_client, prefixo_clima_diario, esquema.esquema_rollup, 'rollup diário', colunas)
+
+    with medidor.etapa('limpeza', len(clima)) as etapa:
+        clima = clima[clima['estacao'].astype(str).isin(estacoes)]
+        clima = juntar_dias_repetidos(clima.assign(estacao=clima['estacao'].astype(str)))
+        clima = clima.rename(columns={'periodo': 'data_clima', **colunas_clima})
+        etapa['linhas_saida'] += len(clima)
+    return clima
+
+def enriquecer(comentarios, clima):
+    """
+    Anexa a cada comentário, para cada estação, a leitura diária mais
+    recente com data até a do comentário (o próprio dia conta). Usa
+    merge_asof sobre as duas tabelas ordenadas pelo tempo: O(n log n),
+    sem busca linha a linha.
+    """
+    with medidor.etapa('merge_asof', len(comentarios)) as etapa:
+        # merge_asof exige a mesma resolução nas duas chaves; o parquet e o
+        # parse do CSV devolvem resoluções diferentes
+        comentarios = comentarios.assign(comment_created_at=comentarios['comment_created_at'].astype('datetime64[ns]'))
+        clima = clima.assign(data_clima=clima['data_clima'].astype('datetime64[ns]'))
+        esquerda = comentarios.merge(pd.DataFrame({'estacao': estacoes}), how='cross')
+        enriquecidos = pd.merge_asof(
+            esquerda.sort_values('comment_created_at', kind='stable'),
+            clima.sort_values('data_clima', kind='stable'),
+            left_on='comment_created_at',
+            right_on='data_clima',
+            by='estacao',
+            direction='backward',
+            tolerance=pd.Timedelta(days=tolerancia_dias)
+        )
+        enriquecidos = enriquecidos.sort_values(['comment_id', 'estacao'], ignore_index=True)
+        etapa['linhas_saida'] += len(enriquecidos)
+    return enriquecidos[list(esquema.esquema_comentarios_clima)]
+
+def salvar_enriquecidos(enriquecidos):
+    """
+    Grava o dataset enriquecido no bucket client no formato configurado
+    """
+    if client.formato_saida == 'parquet':
+        client.salvar_parquet_particionado_s3(
+            enriquecidos,
+            nome_bucket_client,
+            prefixo_saida_parquet,
+            comum.nome_base_arquivo(arquivo_saida),
+            ['estacao']
+        )
+    else:
+        client.salvar_arquivo_s3(enriquecidos, prefixo_saida + arquivo_saida)
+
+def enriquecer_comentarios():
+    """
+    Recalcula o dataset inteiro: os comentários e o clima diário mudam por
+    arquivos diferentes, então qualquer atualização refaz a junção. O índice
+    de termos só recebe os comentários que ainda não tem. Retorna as linhas
+    gravadas e os comentários indexados, ou None em caso de erro.
+    """
+    try:
+        print("\n=== Iniciando Enriquecimento dos Comentários com o Clima ===")
+
+        print("\n1. Leitura dos comentários e do clima diário...")
+        comentarios = ler_comentarios()
+
+        # O índice só depende dos comentários: é atualizado antes da leitura
+        # do clima, que falha enquanto o cubo diário não existe
+        indexados = 0
+        if indexar:
+            print("\nAtualizando o índice de termos dos comentários...")
+            indexados = indice.indexar_comentarios(comentarios)
+
+        clima = ler_clima_diario()
+        print(f"{len(comentarios)} comentários e {len(clima)} leituras diárias das estações {', '.join(estacoes)}")
+
+        print("\n2. Associando cada comentário à leitura anterior mais próxima...")
+        enriquecidos = enriquecer(comentarios, clima)
+        sem_clima = int(enriquecidos['data_clima'].isna().sum())
+        print(f"{len(enriquecidos)} linhas, {sem_clima} sem leitura nos {tolerancia_dias} dias anteriores")
+
+        print("\n3. Salvando resultados no bucket client...")
+        salvar_enriquecidos(enriquecidos)
+        return {'linhas': len(enriquecidos), 'indexados': indexados}
+
+    except Exception as e:
+        print(f"Erro durante o processamento: {e}")
+        return None
+
+def lambda_handler(event, context):
+    """
+    Acionada por novos comentários ou por uma nova versão do rollup diário
+    """
+    # As funções da Lambda client usadas aqui registram nas etapas desta Lambda
+    client.medidor = medidor
+    medidor.reiniciar()
+    request_id = context.aws_request_id if context else 'Local'
+
+    print("\n=== Iniciando Execução Lambda de Enriquecimento dos Comentários ===")
+    start_time = datetime.now()
+
+    try:
+        print(f"Request ID: {request_id}")
+        objetos = [key for _, key in client.extrair_objetos_evento(event) if key]
+        if objetos:
+            print(f"Arquivos alterados: {', '.join(objetos)}")
+
+        resultado = enriquecer_comentarios()
+        end_time = datetime.now()
+        duration = (end_time - start_time).total_seconds()
+        message = {
+            'status': 'success' if resultado is not None else 'error',
+            'message': 'Enriquecimento dos comentários concluído com sucesso!' if resultado is not None
+                       else 'Falha no enriquecimento dos comentários',
+            'rows': resultado['linhas'] if resultado else None,
+            'indexed_comments': resultado['indexados'] if resultado else None,
+            'duration_seconds': duration,
+            'init_seconds': round(duracao_init, 4),
+            'stages': medidor.resumo(),
+            'timestamp': end_time.isoformat()
+        }
+        print(f"\nProcessamento finalizado em {duration:.2f} segundos")
+        return {
+            'statusCode': 200 if resultado is not None else 500,
+            'body': json.dumps(message)
+        }
+
+    except Exception as e:
+        end_time = datetime.now()
+        duration = (end_time - start_time).total_seconds()
+        error_message = {
+            'status': 'error',
+            'message': f'Erro: {str(e)}',
+            'duration_seconds': duration,
+            'stages': medidor.resumo(),
+            'timestamp': end_time.isoformat()
+        }
+        print(f"\nErro na execução da Lambda após {duration:.2f} segundos: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps(error_message)
+        }
+
+    finally:
+        medidor.emitir(request_id)
+
+# Tempo de init do módulo (imports e clientes)
+duracao_init = time.perf_counter() - _inicio_init
+
+# Permite testar o código localmente
+if __name__ == "__main__":
+    print("Iniciando enriquecimento dos comentários localmente...")
+    response = lambda_handler({}, None)
+    print(f"\nResultado da execução:")
+    print(f"Status: {response['statusCode']}")
@@ -0,0 +1,163 @@
+import csv
+
+# Esquema declarado das camadas raw, trusted e client, compartilhado pelas
+# duas Lambdas. Cada camada lista as colunas na ordem do arquivo e o tipo
+# usado na leitura ('category', 'str', 'float64', ...). Sem pandas aqui,
+# para não pesar no cold start.
+
+class ErroEsquema(ValueError):
+    """
+    Arquivo fora do esquema da camada: colunas faltando, renomeadas ou com outro tipo
+    """
+
+# Raw do INMET: só as colunas usadas pela Lambda trusted; as demais não são lidas
+esquema_raw = {
+    'ESTACAO': 'category',
+    'DATA (YYYY-MM-DD)': 'str',
+    'temp_avg': 'float64',
+    'rain_max': 'float64',
+    'rad_max': 'float64',
+    'hum_max': 'float64',
+    'wind_max': 'float64'
+}
+
+# Trusted: arquivo gravado pela Lambda trusted
+esquema_trusted = {
+    'timestamp': 'str',
+    'temperatura': 'float64',
+    'precipitacao': 'float64',
+    'radiacao': 'float64',
+    'umidade': 'float64',
+    'velocidade_vento': 'float64',
+    'estacao': 'category'
+}
+
+# Faixas plausíveis (mínimo, máximo) das medições do trusted; linhas com
+# algum valor fora da faixa vão para a quarentena. None deixa o lado aberto.
+# O INMET usa -9999 para leitura faltando, que cai abaixo de qualquer mínimo.
+regras_faixa = {
+    'temperatura': (-40.0, 50.0),       # °C
+    'precipitacao': (0.0, 200.0),       # mm
+    'radiacao': (0.0, 5000.0),          # kJ/m²
+    'umidade': (0.0, 100.0),            # %
+    'velocidade_vento': (0.0, 60.0)     # m/s
+}
+
+# Client: médias mensais publicadas pela Lambda client
+esquema_client = {
+    'estacao': 'category',
+    'data': 'datetime64[ns]',
+    'mes': 'int32',
+    'nome_mes': 'str',
+    'temperatura_media': 'float64'
+}
+
+# Cubo de agregados do client: um dataset por granularidade, com as mesmas
+# colunas. periodo é o primeiro dia do período (a segunda-feira na semanal).
+granularidades_rollup = ['diario', 'semanal', 'mensal', 'anual']
+estatisticas_rollup = {
+    'media': 'float64',
+    'minimo': 'float64',
+    'maximo': 'float64',
+    'soma': 'float64',
+    'contagem': 'int64'
+}
+esquema_rollup = {
+    'estacao': 'category',
+    'periodo': 'datetime64[ns]',
+    'ano': 'int32',
+    **{
+        f"{metrica}_{estatistica}": tipo
+        for metrica in [c for c, t in esquema_trusted.items() if t == 'float64']
+        for estatistica, tipo in estatisticas_rollup.items()
+    }
+}
+
+# Comentários de clientes exportados do MySQL para o bucket client
+esquema_comentarios = {
+    'comment_username': 'str',
+    'comment_text': 'str',
+    'comment_created_at': 'str',
+    'comment_id': 'int64',
+    'comment_user_id': 'int64'
+}
+
+# Comentários com a leitura diária do clima anterior mais próxima, por estação
+esquema_comentarios_clima = {
+    'comment_id': 'int64',
+    'comment_user_id': 'int64',
+    'comment_username': 'str',
+    'comment_text': 'str',
+    'comment_created_at': 'datetime64[ns]',
+    'estacao': 'category',
+    'data_clima': 'datetime64[ns]',
+    'temperatura': 'float64',
+    'precipitacao': 'float64',
+    'umidade': 'float64'
+}
+
+# Correspondência das colunas do raw com as do trusted
+colunas_raw_para_trusted = {
+    'temp_avg': 'temperatura',
+    'rain_max': 'precipitacao',
+    'rad_max': 'radiacao',
+    'hum_max': 'umidade',
+    'wind_max': 'velocidade_vento',
+    'ESTACAO': 'estacao'
+}
+
+def colunas_numericas(esquema):
+    return [coluna for coluna, tipo in esquema.items() if tipo == 'float64']
+
+def projetar(esquema, colunas=None):
+    """
+    Subconjunto do esquema com as colunas pedidas, na ordem do esquema
+    """
+    if colunas is None:
+        return dict(esquema)
+    return {coluna: tipo for coluna, tipo in esquema.items() if coluna in colunas}
+
+def opcoes_leitura(esquema, colunas=None, tipar_numericas=True):
+    """
+    Parâmetros do read_csv para ler só as colunas projetadas, com os tipos
+    declarados e o parser em C. Sem tipar_numericas, as colunas numéricas
+    ficam com o tipo inferido, para a conversão tolerante com to_numeric.
+    Colunas de data são convertidas com parse_dates.
+    """
+    projetado = projetar(esquema, colunas)
+    opcoes = {
+        'usecols': lambda coluna: coluna in projetado,
+        'dtype': {
+            coluna: tipo for coluna, tipo in projetado.items()
+            if not tipo.startswith('datetime') and (tipar_numericas or tipo != 'float64')
+        },
+        'engine': 'c'
+    }
+    datas = [coluna for coluna, tipo in projetado.items() if tipo.startswith('datetime')]
+    if datas:
+        opcoes['parse_dates'] = datas
+    return opcoes
+
+def cabecalho_csv(inicio, sep=','):
+    """
+    Nomes das colunas a partir dos primeiros bytes de um CSV
+    """
+    primeira_linha = bytes(inicio).split(b'\n', 1)[0].decode('utf-8-sig').rstrip('\r')
+    return next(csv.reader([primeira_linha], delimiter=sep), [])
+
+def validar_colunas(encontradas, esquema, camada, colunas=None, exato=False):
+    """
+    Rejeita o arquivo se faltar alguma coluna projetada do esquema ou, com
+    exato=True, se o cabeçalho não for exatamente o da camada
+    """
+    encontradas = list(encontradas)
+    faltando = [coluna for coluna in projetar(esquema, colunas) if coluna not in encontradas]
+    if faltando:
+        raise ErroEsquema(
+            f"Arquivo {camada} fora do esquema: faltam as colunas {faltando} "
+            f"(colunas encontradas: {encontradas})"
+        )
+    if exato and encontradas != list(esquema):
+        raise ErroEsquema(
+            f"Arquivo {camada} fora do esquema: colunas {encontradas}, esperado {list(esquema)}"
+        )
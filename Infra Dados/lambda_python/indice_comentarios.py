@@ -0,0 +1,257 @@
+import argparse
+import gzip
+import json
+import time
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+import tratamento_para_client as client
+
+# Índice invertido de comment_text -> comment_id, guardado no bucket client.
+# Cada shard (termos/<primeira letra>.json.gz) guarda, por termo, os ids dos
+# comentários em ordem crescente codificados por diferença, o que deixa o
+# gzip bem menor. O manifesto guarda os ids já indexados e a frequência de
+# cada termo; uma nova exportação só tokeniza os comentários novos e só
+# regrava os shards dos termos que eles trazem.
+pd = client.pd
+
+nome_bucket_client = client.nome_bucket_client
+prefixo_indice = 'indice_comentarios/'
+prefixo_shards = f"{prefixo_indice}termos/"
+arquivo_frequencia = f"{prefixo_indice}frequencia/frequencia_termos.csv"
+arquivo_manifesto = '_estado/indice_comentarios.json.gz'
+tentativas_escrita = 5
+
+# Termos com menos caracteres que isso não entram no índice
+tamanho_minimo_termo = 2
+
+# Stopwords do português, já sem acento (o texto é normalizado antes)
+stopwords = frozenset("""
+    a o as os um uma uns umas de do da dos das em no na nos nas num numa
+    por pelo pela pelos pelas para pra pro pras pros com sem ao aos
+    e ou mas nem que se como quando onde porque pois ja nao sim so tambem
+    ainda ate mais menos muito muita muitos muitas pouco bem mal
+    eu tu ele ela vos eles elas voce voces me te lhe lhes mim ti
+    meu minha meus minhas teu tua seu sua seus suas nosso nossa
+    isso isto esse essa esses essas este esta estes estas aquele aquela aquilo
+    ser sou eh foi era sao estou estava tem ter tinha vou vai fica ficou
+    aqui ali la entao tipo todo toda todos todas
+""".split())
+
+def normalizar_texto(textos):
+    """
+    Minúsculas e sem acentos, com pandas vetorizado
+    """
+    return (
+        textos.fillna('').astype(str)
+        .str.normalize('NFKD')
+        .str.encode('ascii', 'ignore')
+        .str.decode('ascii')
+        .str.lower()
+    )
+
+def tokenizar(comentarios):
+    """
+    Uma linha por (termo, comment_id) com as ocorrências do termo no
+    comentário, sem stopwords
+    """
+    termos = normalizar_texto(comentarios['comment_text']).str.findall(r'[a-z0-9]+')
+    tokens = pd.DataFrame({
+        'comment_id': comentarios['comment_id'].to_numpy(),
+        'termo': termos.to_numpy()
+    }).explode('termo').dropna(subset=['termo'])
+    tokens = tokens[
+        (tokens['termo'].str.len() >= tamanho_minimo_termo) & ~tokens['termo'].isin(stopwords)
+    ]
+    return (
+        tokens.groupby(['termo', 'comment_id'], sort=True)
+        .size()
+        .rename('ocorrencias')
+        .reset_index()
+    )
+
+def termos_da_consulta(consulta):
+    """
+    Termos de uma busca, normalizados como os do índice
+    """
+    textos = pd.DataFrame({'comment_id': [0], 'comment_text': [consulta]})
+    return list(dict.fromkeys(tokenizar(textos)['termo']))
+
+def codificar_ids(ids):
+    """
+    Ids em ordem crescente -> primeiro id seguido das diferenças
+    """
+    ids = pd.Series(ids, dtype='int64').drop_duplicates().sort_values().to_numpy()
+    return ids[:1].tolist() + (ids[1:] - ids[:-1]).tolist()
+
+def decodificar_ids(diferencas):
+
+    return pd.Series(diferencas, dtype='int64').cumsum().tolist()
+
+def chave_shard(termo):
+
+    return f"{prefixo_shards}{termo[0]}.json.gz"
+
+def ler_json_gz(key):
+    """
+    Lê um objeto JSON compactado. Retorna (conteúdo, ETag) ou (None, None)
+    se ainda não existe.
+    """
+    try:
+        response = client.s3_client.get_object(Bucket=nome_bucket_client, Key=key)
+        return json.loads(gzip.decompress(response['Body'].read())), response['ETag']
+    except client.s3_client.exceptions.NoSuchKey:
+        return None, None
+
+def gravar_json_gz(key, conteudo, etag):
+    """
+    Grava com escrita condicional: só se o objeto ainda estiver na versão lida
+    """
+    dados = gzip.compress(json.dumps(conteudo, separators=(',', ':')).encode('utf-8'), mtime=0)
+    condicao = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+    client.s3_client.put_object(
+        Bucket=nome_bucket_client,
+        Key=key,
+        Body=dados,
+        ContentType='application/json',
+        ContentEncoding='gzip',
+        Metadata={'processed-date': datetime.now().isoformat()},
+        **condicao
+    )
+    return len(dados)
+
+def atualizar_json_gz(key, mesclar):
+    """
+    Lê o objeto, aplica `mesclar` e grava de volta, repetindo se outra
+    execução gravou o objeto no meio do caminho. `mesclar` recebe o conteúdo
+    atual (ou None) e devolve o novo, ou None se não há nada a gravar.
+    """
+    for tentativa in range(1, tentativas_escrita + 1):
+        with client.medidor.etapa('s3_get'):
+            atual, etag = ler_json_gz(key)
+        novo = mesclar(atual)
+        if novo is None:
+            return atual
+        try:
+            with client.medidor.etapa('put') as etapa:
+                etapa['bytes'] += gravar_json_gz(key, novo, etag)
+            return novo
+        except ClientError as e:
+            codigo = e.response.get('Error', {}).get('Code')
+            if codigo not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                raise
+            print(f"{key} alterado por outra execução, tentando novamente ({tentativa}/{tentativas_escrita})")
+    raise Exception(f"Não foi possível atualizar s3://{nome_bucket_client}/{key}")
+
+def mesclar_shard(postagens):
+    """
+    União das listas de ids de cada termo com as do shard gravado. É
+    idempotente: reindexar os mesmos comentários não altera o shard.
+    """
+    def mesclar(atual):
+        atual = atual or {}
+        for termo, ids in postagens.items():
+            if termo in atual:
+                ids = decodificar_ids(atual[termo]) + list(ids)
+            atual[termo] = codificar_ids(ids)
+        return atual
+    return mesclar
+
+def mesclar_manifesto(ids, tokens):
+    """
+    Acrescenta ao manifesto os ids e as frequências dos comentários que ele
+    ainda não tem; os já contados por outra execução ficam de fora
+    """
+    def mesclar(atual):
+        atual = atual or {'ids': [], 'termos': {}}
+        conhecidos = set(decodificar_ids(atual['ids']))
+        ids_novos = ids[~ids.isin(conhecidos)]
+        novos = tokens[~tokens['comment_id'].isin(conhecidos)]
+        if ids_novos.empty:
+            return None
+
+        frequencias = novos.groupby('termo').agg(
+            documentos=('comment_id', 'size'),
+            ocorrencias=('ocorrencias', 'sum')
+        )
+        termos = atual['termos']
+        for termo, documentos, ocorrencias in frequencias.itertuples():
+            anterior = termos.get(termo, [0, 0])
+            termos[termo] = [anterior[0] + int(documentos), anterior[1] + int(ocorrencias)]
+        atual['ids'] = codificar_ids(list(conhecidos) + ids_novos.tolist())
+        return atual
+    return mesclar
+
+def salvar_frequencias(manifesto):
+    """
+    Resumo de frequência dos termos, ordenado pelos mais frequentes, em CSV
+    para consulta no Athena
+    """
+    if not manifesto['termos']:
+        return
+    frequencias = pd.DataFrame(
+        [(termo, documentos, ocorrencias) for termo, (documentos, ocorrencias) in manifesto['termos'].items()],
+        columns=['termo', 'documentos', 'ocorrencias']
+    ).sort_values(['documentos', 'ocorrencias', 'termo'], ascending=[False, False, True])
+    client.salvar_arquivo_s3(frequencias, arquivo_frequencia)
+
+def indexar_comentarios(comentarios):
+    """
+    Acrescenta ao índice os comentários ainda não indexados. Comentários são
+    tratados como imutáveis: um comment_id já indexado não é relido.
+    Retorna quantos comentários entraram no índice.
+    """
+    manifesto, _ = ler_json_gz(arquivo_manifesto)
+    conhecidos = set(decodificar_ids(manifesto['ids'])) if manifesto else set()
+    novos = comentarios[~comentarios['comment_id'].isin(conhecidos)]
+    if novos.empty:
+        print(f"Índice atualizado: nenhum comentário novo ({len(conhecidos)} indexados)")
+        return 0
+
+    with client.medidor.etapa('tokenizacao', len(novos)) as etapa:
+        tokens = tokenizar(novos)
+        etapa['linhas_saida'] += len(tokens)
+
+    # Shards primeiro: se a execução falhar antes do manifesto, a próxima
+    # reindexa os mesmos comentários, e a união nos shards não duplica nada
+    for key, grupo in tokens.groupby(tokens['termo'].map(chave_shard), sort=True):
+        postagens = grupo.groupby('termo', sort=False)['comment_id'].agg(list).to_dict()
+        atualizar_json_gz(key, mesclar_shard(postagens))
+
+    manifesto = atualizar_json_gz(arquivo_manifesto, mesclar_manifesto(novos['comment_id'], tokens))
+    salvar_frequencias(manifesto)
+    print(f"Índice atualizado: {len(novos)} comentários novos, "
+          f"{tokens['termo'].nunique()} termos, {len(manifesto['termos'])} termos no total")
+    return len(novos)
+
+def buscar(consulta, todos=True):
+    """
+    Ids dos comentários com todos os termos da consulta (ou com algum deles,
+    com todos=False). Lê só os shards dos termos pedidos.
+    """
+    termos = termos_da_consulta(consulta)
+    shards = {}
+    resultado = None
+    for termo in termos:
+        key = chave_shard(termo)
+        if key not in shards:
+            shards[key] = ler_json_gz(key)[0] or {}
+        ids = set(decodificar_ids(shards[key].get(termo, [])))
+        if resultado is None:
+            resultado = ids
+        else:
+            resultado = resultado & ids if todos else resultado | ids
+    return sorted(resultado or [])
+
+# Busca local no índice gravado no S3
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Busca comentários pelo índice invertido")
+    parser.add_argument('termos', nargs='+')
+    parser.add_argument('--qualquer', action='store_true', help="Comentários com qualquer um dos termos")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    ids = buscar(' '.join(args.termos), todos=not args.qualquer)
+    print(f"{len(ids)} comentários em {(time.perf_counter() - inicio) * 1000:.1f} ms")
+    print(ids)
@@ -1,38 +1,206 @@
-import pandas as pd
-import numpy as np
-import boto3
+import time
+_inicio_init = time.perf_counter()
+
+import contextlib
+import gzip
 import io
 import json
 import csv
+import math
+import mmap
+import os
+import re
 from datetime import datetime
 
+import armazenamento
+import comum_lambdas as comum
+import esquema_weather as esquema
+
+# pandas e numpy só são importados quando usados; o caminho leve não precisa deles
+pd = comum.ModuloPreguicoso('pandas')
+np = comum.ModuloPreguicoso('numpy')
+
 # Configurações AWS
 regiao = 'us-east-1'
 nome_bucket_raw = 'bucket-raw-g3-venuste-v2'
 nome_bucket_trusted = 'bucket-trusted-g3-venuste-v2'
 arquivo_weather = 'weather_sum_2025.csv'
 
-# Inicialização dos clientes AWS
-s3_client = boto3.client('s3', region_name=regiao)
-s3_resource = boto3.resource('s3', region_name=regiao)
+# Estações mantidas no trusted (lista separada por vírgula)
+estacoes = [
+    estacao.strip().upper()
+    for estacao in os.environ.get('ESTACOES', 'A771,A701').split(',')
+    if estacao.strip()
+]
+
+# Configurações do modo streaming (leitura e escrita em blocos de linhas)
+modo_streaming = os.environ.get('MODO_STREAMING', 'false').lower() == 'true'
+tamanho_chunk = int(os.environ.get('TAMANHO_CHUNK', '100000'))
+
+# Download paralelo do raw: objetos a partir do limite (em bytes) são
+# baixados em intervalos (Range) simultâneos, em vez de um GET só. Com 0, o
+# download é sempre um GET só.
+limite_download_paralelo = int(os.environ.get('LIMITE_DOWNLOAD_PARALELO', str(64 * 1024 * 1024)))
+tamanho_intervalo_download = max(int(os.environ.get('TAMANHO_INTERVALO_DOWNLOAD', str(16 * 1024 * 1024))), 1024 * 1024)
+concorrencia_download = max(int(os.environ.get('CONCORRENCIA_DOWNLOAD', '8')), 1)
+
+# Mantém as medições como float e deixa a formatação '%.2f'/'N/A' para o to_csv
+manter_float_tipado = os.environ.get('MANTER_FLOAT_TIPADO', 'false').lower() == 'true'
+
+# Modo enxuto da transformação: um único DataFrame de trabalho alterado no
+# lugar, medições em float32 formatadas só na serialização
+modo_enxuto = os.environ.get('MODO_ENXUTO', 'false').lower() == 'true'
+formato_timestamp = '%Y-%m-%dT%H:%M:%S'
+
+# Pipeline fundido: gera também a camada client em memória, sem reler o trusted
+modo_fundido = os.environ.get('MODO_FUNDIDO', 'false').lower() == 'true'
+
+# Formato de saída do trusted: 'csv' (arquivo único) ou 'parquet' (particionado)
+formato_saida = os.environ.get('FORMATO_SAIDA', 'csv').lower()
+compressao_parquet = os.environ.get('COMPRESSAO_PARQUET', 'snappy')  # 'snappy' ou 'zstd'
+prefixo_parquet = 'weather_parquet/'
+colunas_particao = ['estacao', 'ano', 'mes']
+
+# Linhas rejeitadas na validação de qualidade, em CSV compactado no bucket
+# trusted (o .gz não dispara o gatilho de .csv da Lambda client)
+prefixo_quarentena = 'quarentena/'
+colunas_quarentena = list(esquema.esquema_trusted) + ['motivos']
+
+# Caminho leve: arquivos pequenos processados só com o módulo csv, sem pandas
+caminho_leve = os.environ.get('CAMINHO_LEVE', 'false').lower() == 'true'
+limite_caminho_leve = int(os.environ.get('LIMITE_CAMINHO_LEVE', str(2 * 1024 * 1024)))
+
+valores_nulos = ['', 'NULL', 'null', 'NA', 'na', ' ', '#N/A']
+numeric_columns = esquema.colunas_numericas(esquema.esquema_trusted)
+
+# Tabelas de consulta da formatação vetorizada, criadas no primeiro uso
+limite_tabela_inteiros = 100000
+_tabela_inteiros = None
+_tabela_decimais = None
+
+# Endpoint opcional para usar um S3 compatível local (MinIO, LocalStack)
+endpoint_s3 = os.environ.get('S3_ENDPOINT_URL') or None
 
-def ler_arquivo_s3():
+# Cliente do armazenamento (S3, diretório local ou memória, pela variável
+# ARMAZENAMENTO), reutilizado entre invocações do mesmo container. O pool
+# de conexões comporta os GETs simultâneos do download paralelo.
+s3_client = armazenamento.criar_cliente(regiao, endpoint_s3, max_conexoes=concorrencia_download)
+
+medidor = comum.MedidorEtapas('tratamento_base')
+
+def obter_objeto_s3(bucket, key):
 
     try:
-        print(f"Tentando ler arquivo {arquivo_weather} do bucket {nome_bucket_raw}")
-        response = s3_client.get_object(Bucket=nome_bucket_raw, Key=arquivo_weather)
-        
-        df = pd.read_csv(
-            io.BytesIO(response['Body'].read()),
-            na_values=['', 'NULL', 'null', 'NA', 'na', ' ', '#N/A'],
-            keep_default_na=True,
-            dtype_backend='numpy_nullable'
-        )
+        print(f"Tentando ler arquivo {key} do bucket {bucket}")
+        with medidor.etapa('s3_get') as etapa:
+            response = s3_client.get_object(Bucket=bucket, Key=key)
+            etapa['bytes'] += response['ContentLength']
+        return response
+    except s3_client.exceptions.NoSuchKey:
+        error_msg = f"Arquivo {key} não encontrado no bucket {bucket}"
+        print(error_msg)
+        raise FileNotFoundError(error_msg)
+    except Exception as e:
+        error_msg = f"Erro ao ler arquivo do S3: {str(e)}"
+        print(error_msg)
+        raise Exception(error_msg)
+
+def usar_download_paralelo(response):
+    """
+    Objeto grande o bastante para o download em intervalos. O mmap do
+    backend local já é lido sem cópia e fica com o GET só.
+    """
+    return (
+        limite_download_paralelo > 0
+        and response['ContentLength'] >= limite_download_paralelo
+        and not isinstance(response['Body'], mmap.mmap)
+    )
+
+def baixar_em_intervalos(bucket, key, response, em_ordem=False):
+    """
+    Troca o corpo do GET já aberto pelo download em intervalos simultâneos,
+    todos presos ao ETag da resposta. Devolve o objeto inteiro num buffer
+    pré-alocado ou, com em_ordem=True, um arquivo lido em sequência enquanto
+    os próximos intervalos chegam (para o parse em chunks).
+    """
+    response['Body'].close()
+    tamanho = response['ContentLength']
+    print(f"Download em intervalos: {tamanho / 1024 / 1024:.1f} MB em fatias de "
+          f"{tamanho_intervalo_download / 1024 / 1024:.0f} MB, {concorrencia_download} simultâneas")
+    argumentos = (s3_client, bucket, key, tamanho, response['ETag'], tamanho_intervalo_download, concorrencia_download)
+    if em_ordem:
+        return armazenamento.LeitorIntervalos(*argumentos)
+    return armazenamento.baixar_intervalos(*argumentos)
+
+def ler_csv_raw(fonte):
+    """
+    Lê do raw só as colunas do esquema, com os tipos declarados. Se alguma
+    coluna numérica tiver texto, relê com as numéricas inferidas para a
+    conversão tolerante do transformar_dados (streams são lidos assim direto,
+    pois não dá para reler; o mmap do backend local pode ser relido).
+    """
+    try:
+        with medidor.etapa('parse') as etapa:
+            tipar_numericas = isinstance(fonte, (io.BytesIO, mmap.mmap))
+            if tipar_numericas:
+                # Rejeita um raw fora do esquema antes do parse
+                esquema.validar_colunas(esquema.cabecalho_csv(fonte.read(65536)), esquema.esquema_raw, 'raw')
+                fonte.seek(0)
+            try:
+                df = pd.read_csv(
+                    fonte,
+                    na_values=valores_nulos,
+                    keep_default_na=True,
+                    **esquema.opcoes_leitura(esquema.esquema_raw, tipar_numericas=tipar_numericas)
+                )
+            except ValueError:
+                if not tipar_numericas:
+                    raise
+                print("Valores não numéricos nas medições, relendo com conversão tolerante")
+                fonte.seek(0)
+                df = pd.read_csv(
+                    fonte,
+                    na_values=valores_nulos,
+                    keep_default_na=True,
+                    dtype_backend='numpy_nullable',
+                    **esquema.opcoes_leitura(esquema.esquema_raw, tipar_numericas=False)
+                )
+            esquema.validar_colunas(df.columns, esquema.esquema_raw, 'raw')
+            etapa['linhas_saida'] += len(df)
         print(f"Arquivo lido com sucesso. Shape: {df.shape}")
         return df
-        
+    except Exception as e:
+        error_msg = f"Erro ao ler arquivo do S3: {str(e)}"
+        print(error_msg)
+        raise Exception(error_msg)
+
+def ler_arquivo_s3(bucket=None, key=None):
+
+    bucket = bucket or nome_bucket_raw
+    key = key or arquivo_weather
+    response = obter_objeto_s3(bucket, key)
+    with medidor.etapa('s3_get'):
+        if usar_download_paralelo(response):
+            fonte = baixar_em_intervalos(bucket, key, response)
+        else:
+            fonte = armazenamento.fonte_leitura(response)
+    return ler_csv_raw(fonte)
+
+def ler_arquivo_s3_em_chunks(tamanho=None, bucket=None, key=None):
+    """
+    Lê o arquivo do bucket raw em blocos de linhas direto do StreamingBody,
+    sem carregar o objeto inteiro em memória
+    """
+    tamanho = tamanho or tamanho_chunk
+    bucket = bucket or nome_bucket_raw
+    key = key or arquivo_weather
+    try:
+        print(f"Tentando ler arquivo {key} do bucket {bucket} em chunks de {tamanho} linhas")
+        with medidor.etapa('s3_get') as etapa:
+            response = s3_client.get_object(Bucket=bucket, Key=key)
+            etapa['bytes'] += response['ContentLength']
     except s3_client.exceptions.NoSuchKey:
-        error_msg = f"Arquivo {arquivo_weather} não encontrado no bucket {nome_bucket_raw}"
+        error_msg = f"Arquivo {key} não encontrado no bucket {bucket}"
         print(error_msg)
         raise FileNotFoundError(error_msg)
     except Exception as e:
@@ -40,7 +208,88 @@ def ler_arquivo_s3():
         print(error_msg)
         raise Exception(error_msg)
 
-def salvar_arquivo_s3(df):
+    # Objetos grandes chegam por intervalos baixados à frente do parse
+    corpo = response['Body']
+    if usar_download_paralelo(response):
+        corpo = baixar_em_intervalos(bucket, key, response, em_ordem=True)
+
+    # Um chunk com texto em coluna numérica não pode ser relido do stream,
+    # então as medições ficam com o tipo inferido e a conversão é tolerante
+    leitor = pd.read_csv(
+        corpo,
+        na_values=valores_nulos,
+        keep_default_na=True,
+        dtype_backend='numpy_nullable',
+        chunksize=tamanho,
+        **esquema.opcoes_leitura(esquema.esquema_raw, tipar_numericas=False)
+    )
+    # O download acontece aos poucos dentro do parse de cada chunk
+    with contextlib.closing(corpo), leitor:
+        while True:
+            with medidor.etapa('parse') as etapa:
+                chunk = next(leitor, None)
+                if chunk is not None:
+                    esquema.validar_colunas(chunk.columns, esquema.esquema_raw, 'raw')
+                    etapa['linhas_saida'] += len(chunk)
+            if chunk is None:
+                break
+            yield chunk
+
+def opcoes_csv_trusted():
+    """
+    Parâmetros do to_csv do trusted. No modo float tipado a formatação
+    dos números e do 'N/A' acontece uma única vez, na serialização.
+    """
+    opcoes = {
+        'index': False,
+        'sep': ';',
+        'decimal': ',',
+        'encoding': 'utf-8',
+        'quoting': csv.QUOTE_MINIMAL  # Adiciona quotes apenas quando necessário
+    }
+    if manter_float_tipado or modo_enxuto:
+        # Ponto decimal para gerar exatamente o mesmo texto do modo formatado
+        opcoes.update({'decimal': '.', 'float_format': '%.2f', 'na_rep': 'N/A'})
+    return opcoes
+
+def _tabelas_formatacao():
+    global _tabela_inteiros, _tabela_decimais
+    if _tabela_inteiros is None:
+        _tabela_inteiros = np.arange(limite_tabela_inteiros).astype(str)
+        _tabela_decimais = np.array([f".{i:02d}" for i in range(100)])
+    return _tabela_inteiros, _tabela_decimais
+
+def formatar_decimais(serie):
+    """
+    Equivalente vetorizado de f"{x:.2f}" com 'N/A' para nulos, para valores
+    já arredondados em 2 casas. Monta o texto por consulta em tabelas
+    (parte inteira e centavos) em vez de chamar Python célula a célula.
+    """
+    tabela_inteiros, tabela_decimais = _tabelas_formatacao()
+
+    valores = serie.to_numpy(dtype='float64', na_value=np.nan)
+    nulos = np.isnan(valores)
+    finitos = np.isfinite(valores)
+
+    centavos = np.rint(np.abs(np.where(finitos, valores, 0.0)) * 100).astype(np.int64)
+    inteiros = centavos // 100
+    fora_da_tabela = inteiros >= limite_tabela_inteiros
+
+    texto = np.char.add(
+        tabela_inteiros[np.minimum(inteiros, limite_tabela_inteiros - 1)],
+        tabela_decimais[centavos % 100]
+    )
+    texto = np.char.add(np.where(np.signbit(valores), '-', ''), texto).astype(object)
+
+    texto[nulos] = 'N/A'
+    # Infinitos e valores muito grandes são raros; usa o próprio f-string
+    excecoes = (~finitos | fora_da_tabela) & ~nulos
+    if excecoes.any():
+        texto[excecoes] = [f"{x:.2f}" for x in valores[excecoes]]
+
+    return pd.Series(texto, index=serie.index, dtype=object)
+
+def salvar_arquivo_s3(df, key=None):
 
     try:
         print(f"Preparando para salvar arquivo no bucket {nome_bucket_trusted}")
@@ -48,30 +297,25 @@ def salvar_arquivo_s3(df):
         if df.empty:
             raise ValueError("DataFrame está vazio, nenhum dado para salvar")
             
-        # Converter DataFrame para CSV em memória usando ponto-e-vírgula como separador
-        csv_buffer = io.StringIO()
-        df.to_csv(
-            csv_buffer, 
-            index=False, 
-            sep=';', 
-            decimal=',',
-            encoding='utf-8',
-            quoting=csv.QUOTE_MINIMAL  # Adiciona quotes apenas quando necessário
-        )
-        
-        # Upload para S3 com metadata para melhor identificação
-        conteudo = csv_buffer.getvalue().encode('utf-8')
-        s3_client.put_object(
-            Bucket=nome_bucket_trusted,
-            Key=arquivo_weather,
-            Body=conteudo,
-            ContentType='text/csv',
-            Metadata={
+        # Converter DataFrame para CSV usando ponto-e-vírgula como separador,
+        # enviando ao S3 em partes durante a serialização, com metadata para melhor identificação
+        escritor = comum.EscritorMultipartS3(
+            s3_client,
+            medidor,
+            nome_bucket_trusted,
+            key or arquivo_weather,
+            metadata={
                 'rows': str(len(df)),
                 'columns': str(len(df.columns)),
                 'processed-date': datetime.now().isoformat()
             }
         )
+        try:
+            comum.escrever_csv_s3(df, escritor, **opcoes_csv_trusted())
+            escritor.finalizar()
+        except Exception:
+            escritor.abort()
+            raise
         print(f"Arquivo processado salvo com sucesso no bucket {nome_bucket_trusted}")
         print(f"Total de registros salvos: {len(df)}")
         
@@ -80,94 +324,650 @@ def salvar_arquivo_s3(df):
         print(error_msg)
         raise Exception(error_msg)
 
-def process_weather_data_optimized():
+def valores_float64(serie):
+    """
+    Medição como float64. No modo enxuto a coluna pode estar em float32, já
+    arredondada em 2 casas: o round devolve o mesmo float64 do modo normal.
+    """
+    valores = serie.to_numpy(dtype='float64', na_value=np.nan)
+    if serie.dtype == np.float32:
+        valores = np.round(valores, 2)
+    return valores
+
+def preparar_dados_parquet(temp_df):
+    """
+    Mantém os tipos do processamento (timestamp e medições float)
+    e adiciona as colunas de partição ano/mes
+    """
+    df = temp_df.copy()
+    for col in numeric_columns:
+        df[col] = valores_float64(df[col])
+    df['estacao'] = df['estacao'].astype(str)
+    df['ano'] = df['timestamp'].dt.year.astype('int64')
+    df['mes'] = df['timestamp'].dt.month.astype('int64')
+    return df
+
+def limpar_particoes_s3(bucket, prefixo, nome_base):
+    """
+    Remove os arquivos parquet gerados anteriormente a partir do mesmo
+    arquivo de origem, para que o reprocessamento não deixe partições antigas
+    """
+    paginator = s3_client.get_paginator('list_objects_v2')
+    chaves = [
+        {'Key': obj['Key']}
+        for pagina in paginator.paginate(Bucket=bucket, Prefix=prefixo)
+        for obj in pagina.get('Contents', [])
+        if comum.parte_do_arquivo(obj['Key'], nome_base)
+    ]
+    # O delete_objects aceita no máximo 1000 chaves por chamada
+    for i in range(0, len(chaves), 1000):
+        s3_client.delete_objects(Bucket=bucket, Delete={'Objects': chaves[i:i + 1000]})
+    if chaves:
+        print(f"{len(chaves)} arquivos parquet antigos removidos de {prefixo}")
 
+def salvar_parquet_particionado_s3(df, bucket, prefixo, nome_base, particoes, sufixo=''):
+    """
+    Salva o DataFrame em parquet no layout Hive (coluna=valor/), um arquivo
+    por partição. As colunas de partição ficam só no caminho.
+    """
     try:
-        print("\n=== Iniciando Processamento dos Dados Meteorológicos ===")
-        
-        # Leitura do CSV do S3
-        print("\n1. Leitura do arquivo do S3...")
-        df = ler_arquivo_s3()
-        
-        print("\n2. Iniciando limpeza e transformação dos dados...")
+        if df.empty:
+            raise ValueError("DataFrame está vazio, nenhum dado para salvar")
+
+        chaves = []
+        for valores, grupo in df.groupby(particoes, sort=True, observed=True):
+            caminho = '/'.join(f"{col}={valor}" for col, valor in zip(particoes, valores))
+            key = f"{prefixo}{caminho}/{nome_base}{sufixo}.parquet"
+
+            with medidor.etapa('serializacao', len(grupo)) as etapa:
+                buffer = io.BytesIO()
+                grupo.drop(columns=particoes).to_parquet(
+                    buffer,
+                    engine='pyarrow',
+                    compression=compressao_parquet,
+                    index=False,
+                    # Athena lê timestamps em milissegundos
+                    coerce_timestamps='ms',
+                    allow_truncated_timestamps=True
+                )
+                etapa['linhas_saida'] += len(grupo)
+            with medidor.etapa('put') as etapa:
+                s3_client.put_object(
+                    Bucket=bucket,
+                    Key=key,
+                    Body=buffer.getvalue(),
+                    ContentType='application/vnd.apache.parquet',
+                    Metadata={
+                        'rows': str(len(grupo)),
+                        'columns': str(len(grupo.columns) - len(particoes)),
+                        'processed-date': datetime.now().isoformat()
+                    }
+                )
+                etapa['bytes'] += buffer.getbuffer().nbytes
+            chaves.append(key)
+
+        print(f"{len(chaves)} partições parquet salvas em s3://{bucket}/{prefixo}")
+        return chaves
+
+    except Exception as e:
+        error_msg = f"Erro ao salvar parquet no S3: {str(e)}"
+        print(error_msg)
+        raise Exception(error_msg)
+
+def marcar_conclusao_s3(bucket, prefixo, nome_base):
+    """
+    Grava o marcador _SUCCESS/<arquivo>.success depois de todas as partições
+    do arquivo de origem, que é o gatilho da Lambda do client no modo parquet
+    """
+    s3_client.put_object(Bucket=bucket, Key=f"{prefixo}_SUCCESS/{nome_base}.success", Body=b'')
+
+def chave_trusted_para_client(key):
+    """
+    Key do trusted que a Lambda client receberia no evento: o próprio CSV
+    ou o marcador _SUCCESS/<arquivo>.success no modo parquet
+    """
+    if formato_saida == 'parquet':
+        return f"{prefixo_parquet}_SUCCESS/{comum.nome_base_arquivo(key)}.success"
+    return key
+
+def agregar_para_client(temp_df):
+    """
+    Agregação parcial do client (soma/contagem/mín/máx diários de cada
+    métrica por estação) a partir do DataFrame tipado, usada no pipeline fundido
+    """
+    import tratamento_para_client as client  # só necessário no modo fundido
+    client.medidor = medidor  # etapas do client entram nas métricas desta Lambda
+    df = temp_df[client.colunas_trusted].assign(
+        estacao=temp_df['estacao'].astype(str),
+        **{
+            metrica: valores_float64(temp_df[metrica])
+            for metrica in client.metricas_rollup
+        }
+    )
+    return client.agregar_parcial(df, origem='')
+
+def gerar_client_fundido(parciais, key, coletor=None):
+    """
+    Grava a camada client a partir das agregações em memória,
+    pulando o download, o parse e a conversão do CSV trusted.
+    Com um coletor (lote de vários arquivos), só guarda a agregação
+    do arquivo para publicar_client_lote gravar o client uma vez.
+    """
+    import tratamento_para_client as client  # só necessário no modo fundido
+    client.medidor = medidor  # etapas do client entram nas métricas desta Lambda
+    if coletor is not None:
+        coletor[key] = client.combinar_parciais(parciais)
+        return
+    with medidor.etapa('client_fundido'):
+        client.publicar_medias_de_parcial(
+            client.combinar_parciais(parciais),
+            nome_bucket_trusted,
+            chave_trusted_para_client(key)
+        )
+
+def publicar_client_lote(coletor):
+    """
+    Grava a camada client de todos os arquivos do lote de uma vez
+    """
+    import tratamento_para_client as client  # só necessário no modo fundido
+    client.medidor = medidor
+    with medidor.etapa('client_fundido'):
+        client.publicar_medias_de_parciais({
+            (nome_bucket_trusted, chave_trusted_para_client(key)): parcial
+            for key, parcial in coletor.items()
+        })
+
+def limpar_estacoes(serie):
+    """
+    Remove espaços e padroniza em maiúsculas os códigos das estações, com
+    nulos como ''. No categórico a limpeza é feita uma vez por categoria,
+    não por linha, e o resultado continua categórico.
+    """
+    if not isinstance(serie.dtype, pd.CategoricalDtype):
+        serie = serie.astype('category')
+    limpas = serie.cat.categories.astype(str).str.strip().str.upper()
+    categorias = pd.Index(list(dict.fromkeys([*limpas, ''])))
+    # O código -1 (nulo) pega o último elemento, que é o código de ''
+    novos_codigos = np.append(categorias.get_indexer(limpas), categorias.get_loc(''))
+    return pd.Series(
+        pd.Categorical.from_codes(novos_codigos[serie.cat.codes.to_numpy()], categories=categorias),
+        index=serie.index
+    )
+
+def nova_qualidade():
+    """
+    Acumulador da validação de um arquivo (somado entre os chunks no streaming)
+    """
+    return {'linhas_validadas': 0, 'linhas_rejeitadas': 0, 'violacoes': {}, 'alertas': {}, 'quarentena': []}
+
+def validar_qualidade(final_df, temp_df):
+    """
+    Aplica as regras de faixa do esquema em operações por coluna inteira.
+    Retorna a máscara das linhas válidas, as linhas rejeitadas com os códigos
+    dos motivos, a contagem de violações por código (rejeitam a linha) e a de
+    alertas (valores não numéricos convertidos em nulo, a linha é mantida).
+    No modo enxuto, final_df traz só as colunas numéricas lidas como texto.
+    """
+    valores = {col: temp_df[col].to_numpy(dtype='float64', na_value=np.nan) for col in numeric_columns}
+    violacoes = {'sem_medicoes': np.logical_and.reduce([np.isnan(v) for v in valores.values()])}
+    alertas = {}
+    for col, (minimo, maximo) in esquema.regras_faixa.items():
+        # Comparações com NaN dão False: valor nulo não viola a faixa
+        if minimo is not None:
+            violacoes[f"{col}_abaixo_minimo"] = valores[col] < minimo
+        if maximo is not None:
+            violacoes[f"{col}_acima_maximo"] = valores[col] > maximo
+        # Lido como número pelo read_csv, não há texto convertido em nulo
+        if col in final_df and not pd.api.types.is_float_dtype(final_df[col].dtype):
+            alertas[f"{col}_nao_numerico"] = (final_df[col].notna() & temp_df[col].isna()).to_numpy()
+
+    rejeitadas = np.logical_or.reduce(list(violacoes.values()))
+    posicoes = np.flatnonzero(rejeitadas)
+    quarentena = temp_df.iloc[posicoes].copy()
+    motivos = np.full(len(posicoes), '', dtype=object)
+    for codigo, mascara in violacoes.items():
+        motivos = np.where(mascara[posicoes], motivos + codigo + '|', motivos)
+    quarentena['motivos'] = pd.Series(motivos, index=quarentena.index, dtype=str).str.rstrip('|')
+
+    violacoes = {codigo: int(m.sum()) for codigo, m in violacoes.items() if m.any()}
+    alertas = {codigo: int(m.sum()) for codigo, m in alertas.items() if m.any()}
+    return ~rejeitadas, quarentena, violacoes, alertas
+
+def registrar_qualidade(qualidade, linhas, quarentena, violacoes, alertas):
+
+    qualidade['linhas_validadas'] += linhas
+    qualidade['linhas_rejeitadas'] += len(quarentena)
+    for destino, contagens in (('violacoes', violacoes), ('alertas', alertas)):
+        for codigo, quantidade in contagens.items():
+            qualidade[destino][codigo] = qualidade[destino].get(codigo, 0) + quantidade
+    if not quarentena.empty:
+        qualidade['quarentena'].append(quarentena)
+
+def resumo_qualidade(qualidade):
+    """
+    Resumo da validação para a resposta da Lambda, sem as linhas rejeitadas
+    """
+    return {chave: valor for chave, valor in qualidade.items() if chave != 'quarentena'}
+
+def somar_qualidade(resumos):
+    """
+    Total da validação de todos os arquivos da invocação
+    """
+    total = resumo_qualidade(nova_qualidade())
+    for resumo in resumos:
+        total['linhas_validadas'] += resumo['linhas_validadas']
+        total['linhas_rejeitadas'] += resumo['linhas_rejeitadas']
+        for destino in ('violacoes', 'alertas'):
+            for codigo, quantidade in resumo[destino].items():
+                total[destino][codigo] = total[destino].get(codigo, 0) + quantidade
+    return total
+
+def chave_quarentena(key):
+
+    return f"{prefixo_quarentena}{comum.nome_base_arquivo(key)}.csv.gz"
+
+def salvar_quarentena_s3(qualidade, key):
+    """
+    Grava as linhas rejeitadas do arquivo, com os motivos, ou remove a
+    quarentena de um processamento anterior se nada foi rejeitado
+    """
+    destino = chave_quarentena(key)
+    if not qualidade['quarentena']:
+        s3_client.delete_object(Bucket=nome_bucket_trusted, Key=destino)
+        return
+
+    partes = qualidade['quarentena']
+    with medidor.etapa('quarentena') as etapa:
+        csv_buffer = io.StringIO()
+        if isinstance(partes[0], list):
+            # Linhas do caminho leve
+            escritor = csv.writer(csv_buffer, delimiter=';', lineterminator='\n', quoting=csv.QUOTE_MINIMAL)
+            escritor.writerow(colunas_quarentena)
+            escritor.writerows(partes)
+            linhas = len(partes)
+        else:
+            quarentena = pd.concat(partes, ignore_index=True)
+            quarentena.to_csv(csv_buffer, index=False, sep=';', date_format=formato_timestamp)
+            linhas = len(quarentena)
+        dados = gzip.compress(csv_buffer.getvalue().encode('utf-8'), mtime=0)
+        etapa['linhas_saida'] += linhas
+        s3_client.put_object(
+            Bucket=nome_bucket_trusted,
+            Key=destino,
+            Body=dados,
+            ContentType='application/gzip',
+            Metadata={
+                'rows': str(linhas),
+                'source': key,
+                'processed-date': datetime.now().isoformat()
+            }
+        )
+        etapa['bytes'] += len(dados)
+    print(f"{linhas} linhas rejeitadas salvas em s3://{nome_bucket_trusted}/{destino}")
+
+def transformar_dados(df, qualidade=None):
+    """
+    Aplica limpeza, filtro de estações, validação de qualidade, renomeação e
+    arredondamento. Retorna o DataFrame formatado para o trusted e o
+    DataFrame numérico. As linhas rejeitadas e as contagens da validação são
+    acumuladas em `qualidade` (ver nova_qualidade).
+    """
+    if modo_enxuto:
+        return transformar_dados_enxuto(df, qualidade)
+
+    with medidor.etapa('limpeza', len(df)):
         # Limpar dados nulos
         df = df.fillna({
-            'ESTACAO': '',
             'DATA (YYYY-MM-DD)': ''
         })
-        
+    
         # Limpar espaços em branco e padronizar strings
-        df['ESTACAO'] = df['ESTACAO'].astype(str).str.strip().str.upper()
+        df['ESTACAO'] = limpar_estacoes(df['ESTACAO'])
         df['DATA (YYYY-MM-DD)'] = df['DATA (YYYY-MM-DD)'].astype(str).str.strip()
-        
+
+    with medidor.etapa('filtro', len(df)) as etapa:
         # Filtrar apenas as estações desejadas e remover linhas totalmente vazias
         df = df[
-            (df['ESTACAO'].isin(['A771', 'A701'])) & 
+            (df['ESTACAO'].isin(estacoes)) & 
             (~df.isna().all(axis=1))
         ]
-        
+        df['ESTACAO'] = df['ESTACAO'].cat.remove_unused_categories()
+    
         # Criar timestamp de forma otimizada
         df['timestamp'] = pd.to_datetime(df['DATA (YYYY-MM-DD)'])
-        
+    
         # Extrair apenas a data para agrupamento
         df['date'] = df['timestamp'].dt.date
-        
+    
         # Renomear colunas para nomes mais simples
-        column_mapping = {
-            'temp_avg': 'temperatura',
-            'rain_max': 'precipitacao',
-            'rad_max': 'radiacao',
-            'hum_max': 'umidade',
-            'wind_max': 'velocidade_vento',
-            'ESTACAO': 'estacao'
-        }
-        df = df.rename(columns=column_mapping)
-        
-        # Selecionar colunas relevantes
-        columns_to_keep = [
-            'timestamp',
-            'temperatura',
-            'precipitacao',
-            'radiacao',
-            'umidade',
-            'velocidade_vento',
-            'estacao'
-        ]
-        
+        df = df.rename(columns=esquema.colunas_raw_para_trusted)
+    
+        # Selecionar colunas relevantes, na ordem do esquema do trusted
+        columns_to_keep = list(esquema.esquema_trusted)
+    
         final_df = df[columns_to_keep].copy()
-        
-        # Tratar valores numéricos
-        numeric_columns = ['temperatura', 'precipitacao', 'radiacao', 'umidade', 'velocidade_vento']
-        
-        # Criar uma cópia para manipulação
+    
+        # Tratar valores numéricos: criar uma cópia para manipulação
         temp_df = final_df.copy()
-        
+    
         # Converter colunas numéricas para float, permitindo NaN
         for col in numeric_columns:
             temp_df[col] = pd.to_numeric(temp_df[col], errors='coerce')
-        
-        # Remover registros onde todos os valores numéricos são NaN
-        valid_rows = ~temp_df[numeric_columns].isna().all(axis=1)
+    
+        etapa['linhas_saida'] += len(final_df)
+
+    with medidor.etapa('validacao', len(final_df)) as etapa:
+        # Remover registros sem nenhuma medição ou com valores fora da faixa
+        valid_rows, quarentena, violacoes, alertas = validar_qualidade(final_df, temp_df)
+        if qualidade is not None:
+            registrar_qualidade(qualidade, len(final_df), quarentena, violacoes, alertas)
         final_df = final_df[valid_rows]
         temp_df = temp_df[valid_rows]
-        
+        etapa['linhas_saida'] += len(final_df)
+
+    with medidor.etapa('formatacao', len(final_df)) as etapa:
         # Arredondar e formatar valores numéricos
         for col in numeric_columns:
             # Arredondar valores não-nulos
             temp_df[col] = temp_df[col].round(2)
-            # Converter para string formatada, usando 'N/A' para NaN
-            final_df[col] = temp_df[col].apply(lambda x: f"{x:.2f}" if pd.notnull(x) else 'N/A')
+            if manter_float_tipado:
+                final_df[col] = temp_df[col].to_numpy(dtype='float64', na_value=np.nan)
+            else:
+                # Converter para string formatada, usando 'N/A' para NaN
+                final_df[col] = formatar_decimais(temp_df[col])
+    
+        # Converter timestamp para ISO (datas inválidas ficam vazias, como no to_csv)
+        final_df['timestamp'] = final_df['timestamp'].dt.strftime(formato_timestamp).fillna('')
+        etapa['linhas_saida'] += len(final_df)
+
+    return final_df, temp_df
+
+def manter_linhas(df, mascara):
+    """
+    Filtra as linhas no próprio DataFrame, liberando a memória das descartadas
+    """
+    if not mascara.all():
+        df.drop(index=df.index[~mascara], inplace=True)
+
+def transformar_dados_enxuto(df, qualidade=None):
+    """
+    Mesmo resultado do transformar_dados com um único DataFrame de trabalho,
+    alterado no lugar: sem as cópias final_df/temp_df e sem a coluna date,
+    com a estação categórica e as medições em float32 quando as 2 casas
+    cabem. O DataFrame recebido é consumido. Retorna o DataFrame numérico e
+    uma visão dele para o CSV, que só troca o timestamp pelo texto; os
+    números são formatados pelo to_csv (ver opcoes_csv_trusted).
+    """
+    with medidor.etapa('limpeza', len(df)):
+        df['ESTACAO'] = limpar_estacoes(df['ESTACAO'])
+
+    with medidor.etapa('filtro', len(df)) as etapa:
+        # Com a data vazia preenchida com '', nenhuma linha é totalmente
+        # nula; basta o filtro das estações
+        manter_linhas(df, df['ESTACAO'].isin(estacoes).to_numpy())
+        df['ESTACAO'] = df['ESTACAO'].cat.remove_unused_categories()
+        df.insert(0, 'timestamp', pd.to_datetime(df.pop('DATA (YYYY-MM-DD)').fillna('').astype(str).str.strip()))
+        df.rename(columns=esquema.colunas_raw_para_trusted, inplace=True)
+
+        # Ordem do esquema do trusted, movendo uma coluna por vez
+        for col in list(esquema.esquema_trusted)[1:]:
+            df[col] = df.pop(col)
+
+        # Só as colunas lidas como texto são guardadas, para os alertas da validação
+        originais = {}
+        for col in numeric_columns:
+            if not pd.api.types.is_float_dtype(df[col].dtype):
+                originais[col] = df[col]
+            df[col] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        etapa['linhas_saida'] += len(df)
+
+    with medidor.etapa('validacao', len(df)) as etapa:
+        valid_rows, quarentena, violacoes, alertas = validar_qualidade(originais, df)
+        del originais
+        if qualidade is not None:
+            registrar_qualidade(qualidade, len(df), quarentena, violacoes, alertas)
+        manter_linhas(df, valid_rows)
+        etapa['linhas_saida'] += len(df)
+
+    with medidor.etapa('formatacao', len(df)) as etapa:
+        for col in numeric_columns:
+            valores = np.round(df[col].to_numpy(), 2)
+            compactos = valores.astype('float32')
+            # float32 só se as 2 casas voltam iguais (ver valores_float64)
+            if np.array_equal(np.round(compactos.astype('float64'), 2), valores, equal_nan=True):
+                valores = compactos
+            df[col] = valores
+
+        # Texto do timestamp formatado uma vez por dia distinto (categórico),
+        # com data vazia como '' (o na_rep 'N/A' do to_csv é só das medições).
+        # O DataFrame do CSV referencia as colunas do numérico, sem copiá-las.
+        datas = df['timestamp'].astype('category')
+        textos = pd.Index([*datas.cat.categories.strftime(formato_timestamp), ''])
+        codigos = datas.cat.codes.to_numpy()
+        timestamp = pd.Categorical.from_codes(np.where(codigos < 0, len(textos) - 1, codigos), categories=textos)
+        final_df = pd.DataFrame(
+            {**{col: df[col] for col in df.columns}, 'timestamp': pd.Series(timestamp, index=df.index)},
+            copy=False
+        )
+        etapa['linhas_saida'] += len(df)
+
+    return final_df, df
+
+# Valores tratados como nulos pelo read_csv (padrões do pandas + valores_nulos)
+_nulos_leve = set(valores_nulos) | {
+    '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NaN', 'None', 'n/a', 'nan'
+}
+_regex_numero = re.compile(r'[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?')
+_regex_data = re.compile(r'\d{4}-\d{2}-\d{2}')
+_colunas_raw_leve = esquema.colunas_numericas(esquema.esquema_raw)
+_faixas_leve = [
+    (esquema.colunas_raw_para_trusted[col], *esquema.regras_faixa.get(esquema.colunas_raw_para_trusted[col], (None, None)))
+    for col in _colunas_raw_leve
+]
+
+def _motivos_leve(linha, valores, i_numeros):
+    """
+    Códigos de rejeição de uma linha, na mesma ordem do validar_qualidade
+    """
+    if all(valor == 'N/A' for valor in valores):
+        return ['sem_medicoes']
+    motivos = []
+    for valor, i, (col, minimo, maximo) in zip(valores, i_numeros, _faixas_leve):
+        if valor == 'N/A':
+            continue
+        numero = float(linha[i])
+        if minimo is not None and numero < minimo:
+            motivos.append(f"{col}_abaixo_minimo")
+        if maximo is not None and numero > maximo:
+            motivos.append(f"{col}_acima_maximo")
+    return motivos
+
+def _formatar_leve(texto):
+    """
+    Mesmo resultado de pd.to_numeric + round(2) + f"{x:.2f}" para uma célula.
+    Retorna None se o valor não for um número simples.
+    """
+    if texto in _nulos_leve:
+        return 'N/A'
+    if not _regex_numero.fullmatch(texto):
+        return None
+    valor = float(texto)
+    if not math.isfinite(valor):
+        return None
+    # Igual ao np.round: multiplica, arredonda para o par mais próximo e divide
+    escalado = valor * 100.0
+    valor = math.copysign(float(round(escalado)), escalado) / 100.0
+    return f"{valor:.2f}"
+
+def transformar_leve(conteudo):
+    """
+    Versão sem pandas/numpy do transformar_dados para arquivos pequenos,
+    gerando exatamente o mesmo CSV trusted e as mesmas linhas na quarentena.
+    Retorna (bytes, registros por estação, linhas rejeitadas, violações) ou
+    None quando o arquivo foge do formato simples esperado, para o chamador
+    seguir pelo pandas.
+    """
+    linhas = csv.reader(io.StringIO(conteudo.decode('utf-8-sig'), newline=''))
+    cabecalho = next(linhas, None)
+    try:
+        i_estacao = cabecalho.index('ESTACAO')
+        i_data = cabecalho.index('DATA (YYYY-MM-DD)')
+        i_numeros = [cabecalho.index(col) for col in _colunas_raw_leve]
+    except (AttributeError, ValueError):
+        return None
+
+    saida = io.StringIO()
+    escritor = csv.writer(saida, delimiter=';', lineterminator='\n', quoting=csv.QUOTE_MINIMAL)
+    escritor.writerow(['timestamp'] + numeric_columns + ['estacao'])
+    registros_por_estacao = {}
+    rejeitadas = []
+    violacoes = {}
+
+    for linha in linhas:
+        if not linha:
+            continue
+        if len(linha) != len(cabecalho):
+            return None
+
+        estacao = linha[i_estacao]
+        estacao = '' if estacao in _nulos_leve else estacao.strip().upper()
+        if estacao not in estacoes:
+            continue
+
+        valores = [_formatar_leve(linha[i]) for i in i_numeros]
+        if None in valores:
+            return None
+
+        data = linha[i_data]
+        if data in _nulos_leve:
+            timestamp = ''
+        else:
+            data = data.strip()
+            if not _regex_data.fullmatch(data):
+                return None
+            try:
+                timestamp = datetime.strptime(data, '%Y-%m-%d').strftime('%Y-%m-%dT%H:%M:%S')
+            except ValueError:
+                return None
+
+        motivos = _motivos_leve(linha, valores, i_numeros)
+        if motivos:
+            # Valores sem arredondar, como o float do pandas no to_csv
+            numeros = ['' if valor == 'N/A' else repr(float(linha[i])) for valor, i in zip(valores, i_numeros)]
+            rejeitadas.append([timestamp] + numeros + [estacao, '|'.join(motivos)])
+            for motivo in motivos:
+                violacoes[motivo] = violacoes.get(motivo, 0) + 1
+            continue
+
+        escritor.writerow([timestamp] + valores + [estacao])
+        registros_por_estacao[estacao] = registros_por_estacao.get(estacao, 0) + 1
+
+    return saida.getvalue().encode('utf-8'), registros_por_estacao, rejeitadas, violacoes
+
+def process_weather_data_leve(conteudo, key, qualidade):
+    """
+    Processa um arquivo pequeno pelo caminho leve. Retorna False se o
+    arquivo precisar do caminho com pandas.
+    """
+    with medidor.etapa('transformacao_leve') as etapa:
+        resultado = transformar_leve(conteudo)
+        if resultado is not None:
+            etapa['linhas_saida'] += sum(resultado[1].values())
+    if resultado is None:
+        print("Arquivo fora do formato simples, seguindo pelo pandas")
+        return False
+
+    dados, registros_por_estacao, rejeitadas, violacoes = resultado
+    total = sum(registros_por_estacao.values())
+    if total == 0:
+        raise ValueError("DataFrame está vazio, nenhum dado para salvar")
+
+    escritor = comum.EscritorMultipartS3(
+        s3_client,
+        medidor,
+        nome_bucket_trusted,
+        key,
+        metadata={
+            'rows': str(total),
+            'columns': str(len(numeric_columns) + 2),
+            'processed-date': datetime.now().isoformat()
+        }
+    )
+    escritor.write(dados)
+    escritor.finalizar()
+    print(f"Arquivo processado salvo com sucesso no bucket {nome_bucket_trusted} (caminho leve)")
+
+    # As linhas rejeitadas vão como listas, gravadas sem pandas
+    qualidade['linhas_validadas'] += total + len(rejeitadas)
+    qualidade['linhas_rejeitadas'] += len(rejeitadas)
+    for codigo, quantidade in violacoes.items():
+        qualidade['violacoes'][codigo] = qualidade['violacoes'].get(codigo, 0) + quantidade
+    qualidade['quarentena'].extend(rejeitadas)
+    salvar_quarentena_s3(qualidade, key)
+
+    print(f"\nEstatísticas do processamento:")
+    print(f"Total de dias processados: {total}")
+    print(f"Registros por estação:")
+    for estacao, quantidade in sorted(registros_por_estacao.items()):
+        print(f"{estacao}: {quantidade}")
+    return True
+
+def process_weather_data_optimized(bucket=None, key=None, coletor=None, qualidade=None):
+
+    bucket = bucket or nome_bucket_raw
+    key = key or arquivo_weather
+    qualidade = qualidade if qualidade is not None else nova_qualidade()
+    try:
+        print("\n=== Iniciando Processamento dos Dados Meteorológicos ===")
+        
+        # Leitura do CSV do S3
+        print("\n1. Leitura do arquivo do S3...")
+        if caminho_leve and formato_saida == 'csv' and not modo_fundido:
+            response = obter_objeto_s3(bucket, key)
+            if response['ContentLength'] <= limite_caminho_leve:
+                with medidor.etapa('s3_get'):
+                    conteudo = response['Body'].read()
+                if process_weather_data_leve(conteudo, key, qualidade):
+                    return True
+                df = ler_csv_raw(io.BytesIO(conteudo))
+            elif usar_download_paralelo(response):
+                with medidor.etapa('s3_get'):
+                    fonte = baixar_em_intervalos(bucket, key, response)
+                df = ler_csv_raw(fonte)
+            else:
+                df = ler_csv_raw(response['Body'])
+        else:
+            df = ler_arquivo_s3(bucket, key)
         
-        # Converter timestamp para ISO
-        final_df['timestamp'] = final_df['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%S')
+        print("\n2. Iniciando limpeza, validação e transformação dos dados...")
+        final_df, temp_df = transformar_dados(df, qualidade)
         
         # Salvar no S3
         print("Salvando arquivo processado no S3...")
-        salvar_arquivo_s3(final_df)
+        if formato_saida == 'parquet':
+            nome_base = comum.nome_base_arquivo(key)
+            limpar_particoes_s3(nome_bucket_trusted, prefixo_parquet, nome_base)
+            salvar_parquet_particionado_s3(
+                preparar_dados_parquet(temp_df),
+                nome_bucket_trusted,
+                prefixo_parquet,
+                nome_base,
+                colunas_particao
+            )
+            marcar_conclusao_s3(nome_bucket_trusted, prefixo_parquet, nome_base)
+        else:
+            salvar_arquivo_s3(final_df, key)
+        salvar_quarentena_s3(qualidade, key)
+
+        if modo_fundido:
+            print("\n3. Gerando camada client em memória (pipeline fundido)...")
+            gerar_client_fundido([agregar_para_client(temp_df)], key, coletor)
         
         # Imprimir estatísticas
         print(f"\nEstatísticas do processamento:")
         print(f"Total de dias processados: {len(final_df)}")
+        print(f"Linhas rejeitadas na validação: {qualidade['linhas_rejeitadas']} {qualidade['violacoes']}")
         print(f"Registros por estação:")
         print(final_df['estacao'].value_counts())
         print("\nEstatísticas das medições:")
@@ -179,17 +979,169 @@ def process_weather_data_optimized():
         print(f"Erro durante o processamento: {e}")
         return False
 
+def process_weather_data_streaming(tamanho=None, bucket=None, key=None, coletor=None, qualidade=None):
+    """
+    Processa o arquivo raw em blocos de linhas, gravando o trusted de forma
+    incremental. A memória fica limitada ao tamanho do chunk e da parte de upload.
+    """
+    tamanho = tamanho or tamanho_chunk
+    bucket = bucket or nome_bucket_raw
+    key = key or arquivo_weather
+    qualidade = qualidade if qualidade is not None else nova_qualidade()
+    escritor = None
+
+    try:
+        print("\n=== Iniciando Processamento dos Dados Meteorológicos (streaming) ===")
+        print(f"Tamanho do chunk: {tamanho} linhas")
+
+        nome_base = comum.nome_base_arquivo(key)
+        if formato_saida == 'parquet':
+            limpar_particoes_s3(nome_bucket_trusted, prefixo_parquet, nome_base)
+        else:
+            escritor = comum.EscritorMultipartS3(
+                s3_client,
+                medidor,
+                nome_bucket_trusted,
+                key,
+                metadata={'processed-date': datetime.now().isoformat()}
+            )
+
+        total_lido = 0
+        total_salvo = 0
+        total_colunas = 0
+        registros_por_estacao = {}
+        escreveu_cabecalho = False
+        parciais_client = []
+
+        for numero_chunk, df in enumerate(ler_arquivo_s3_em_chunks(tamanho, bucket, key), start=1):
+            linhas_chunk = len(df)
+            total_lido += linhas_chunk
+            final_df, temp_df = transformar_dados(df, qualidade)
+
+            if final_df.empty:
+                continue
+
+            if formato_saida == 'parquet':
+                # Cada chunk vira um arquivo a mais dentro das partições
+                salvar_parquet_particionado_s3(
+                    preparar_dados_parquet(temp_df),
+                    nome_bucket_trusted,
+                    prefixo_parquet,
+                    nome_base,
+                    colunas_particao,
+                    sufixo=f"-{numero_chunk:05d}"
+                )
+            else:
+                comum.escrever_csv_s3(
+                    final_df,
+                    escritor,
+                    header=not escreveu_cabecalho,
+                    **opcoes_csv_trusted()
+                )
+                escreveu_cabecalho = True
+
+            if modo_fundido:
+                parciais_client.append(agregar_para_client(temp_df))
+
+            total_salvo += len(final_df)
+            total_colunas = len(final_df.columns)
+            for estacao, quantidade in final_df['estacao'].value_counts().items():
+                registros_por_estacao[estacao] = registros_por_estacao.get(estacao, 0) + int(quantidade)
+
+            print(f"Chunk {numero_chunk}: {linhas_chunk} linhas lidas, {len(final_df)} linhas gravadas")
+
+        if total_salvo == 0:
+            raise ValueError("DataFrame está vazio, nenhum dado para salvar")
+
+        if formato_saida == 'parquet':
+            marcar_conclusao_s3(nome_bucket_trusted, prefixo_parquet, nome_base)
+        else:
+            escritor.finalizar(metadata_final={
+                'rows': str(total_salvo),
+                'columns': str(total_colunas)
+            })
+        print(f"Arquivo processado salvo com sucesso no bucket {nome_bucket_trusted}")
+        salvar_quarentena_s3(qualidade, key)
+
+        if modo_fundido:
+            print("\nGerando camada client em memória (pipeline fundido)...")
+            gerar_client_fundido(parciais_client, key, coletor)
+
+        # Imprimir estatísticas
+        print(f"\nEstatísticas do processamento:")
+        print(f"Total de linhas lidas: {total_lido}")
+        print(f"Total de dias processados: {total_salvo}")
+        print(f"Linhas rejeitadas na validação: {qualidade['linhas_rejeitadas']} {qualidade['violacoes']}")
+        print(f"Registros por estação:")
+        for estacao, quantidade in sorted(registros_por_estacao.items()):
+            print(f"{estacao}: {quantidade}")
+
+        return True
+
+    except Exception as e:
+        if escritor is not None:
+            escritor.abort()
+        print(f"Erro durante o processamento: {e}")
+        return False
+
+def extrair_objetos_evento(event):
+    """
+    Lista (bucket, key) de cada objeto criado no evento, sem repetir
+    """
+    return comum.extrair_objetos_evento(event, (nome_bucket_raw, arquivo_weather))
+
 def lambda_handler(event, context):
 
+    global _primeira_invocacao
+    cold_start = _primeira_invocacao
+    _primeira_invocacao = False
+    imports_antes = set(comum.tempos_importacao)
+    medidor.reiniciar()
+    request_id = context.aws_request_id if context else 'Local'
+
     print("\n=== Iniciando Execução Lambda de Processamento Meteorológico ===")
     start_time = datetime.now()
     
     try:
+        print(f"Cold start: {cold_start} (init do módulo: {duracao_init:.3f} segundos)")
         print(f"Timestamp início: {start_time.isoformat()}")
         print(f"Função Lambda: {context.function_name if context else 'Local'}")
-        print(f"Request ID: {context.aws_request_id if context else 'Local'}")
+        print(f"Request ID: {request_id}")
         
-        success = process_weather_data_optimized()
+        objetos = extrair_objetos_evento(event)
+        print(f"Objetos a processar: {len(objetos)}")
+
+        # No pipeline fundido com vários arquivos (lote da fila), o client
+        # é gravado uma única vez no fim, com as agregações de todos
+        coletor = {} if modo_fundido and len(objetos) > 1 else None
+
+        resultados = []
+        with comum.perfil_opcional():
+            for bucket, key in objetos:
+                print(f"\nProcessando s3://{bucket}/{key}")
+                qualidade = nova_qualidade()
+                if modo_streaming:
+                    ok = process_weather_data_streaming(bucket=bucket, key=key, coletor=coletor, qualidade=qualidade)
+                else:
+                    ok = process_weather_data_optimized(bucket, key, coletor, qualidade)
+                resultados.append({
+                    'bucket': bucket,
+                    'key': key,
+                    'success': ok,
+                    'data_quality': resumo_qualidade(qualidade)
+                })
+
+            if coletor:
+                print(f"\nGerando camada client do lote ({len(coletor)} arquivos)...")
+                try:
+                    publicar_client_lote(coletor)
+                except Exception as e:
+                    print(f"Erro ao gerar a camada client do lote: {e}")
+                    for resultado in resultados:
+                        if resultado['key'] in coletor:
+                            resultado['success'] = False
+
+        success = all(r['success'] for r in resultados)
         
         end_time = datetime.now()
         duration = (end_time - start_time).total_seconds()
@@ -198,25 +1150,35 @@ def lambda_handler(event, context):
             message = {
                 'status': 'success',
                 'message': 'Processamento meteorológico concluído com sucesso!',
+                'objects': resultados,
+                'data_quality': somar_qualidade(r['data_quality'] for r in resultados),
                 'duration_seconds': duration,
+                'timings': comum.tempos_execucao(cold_start, imports_antes, duration, duracao_init),
+                'stages': medidor.resumo(),
                 'timestamp': end_time.isoformat()
             }
             print(f"\nProcessamento concluído com sucesso em {duration:.2f} segundos")
             return {
                 'statusCode': 200,
-                'body': json.dumps(message)
+                'body': json.dumps(message),
+                **comum.falhas_lote(event, resultados)
             }
         else:
             message = {
                 'status': 'error',
                 'message': 'Falha no processamento dos dados meteorológicos',
+                'objects': resultados,
+                'data_quality': somar_qualidade(r['data_quality'] for r in resultados),
                 'duration_seconds': duration,
+                'timings': comum.tempos_execucao(cold_start, imports_antes, duration, duracao_init),
+                'stages': medidor.resumo(),
                 'timestamp': end_time.isoformat()
             }
             print(f"\nProcessamento falhou após {duration:.2f} segundos")
             return {
                 'statusCode': 500,
-                'body': json.dumps(message)
+                'body': json.dumps(message),
+                **comum.falhas_lote(event, resultados)
             }
             
     except Exception as e:
@@ -226,14 +1188,24 @@ def lambda_handler(event, context):
             'status': 'error',
             'message': f'Erro: {str(e)}',
             'duration_seconds': duration,
+            'timings': comum.tempos_execucao(cold_start, imports_antes, duration, duracao_init),
+            'stages': medidor.resumo(),
             'timestamp': end_time.isoformat()
         }
         print(f"\nErro na execução da Lambda após {duration:.2f} segundos: {str(e)}")
         return {
             'statusCode': 500,
-            'body': json.dumps(error_message)
+            'body': json.dumps(error_message),
+            **comum.falhas_lote(event)
         }
 
+    finally:
+        medidor.emitir(request_id)
+
+# Tempo de init do módulo (imports e clientes), reportado na primeira invocação
+duracao_init = time.perf_counter() - _inicio_init
+_primeira_invocacao = True
+
 # Permite testar o código localmente
 if __name__ == "__main__":
     print("Iniciando processamento dos dados meteorológicos localmente...")
@@ -1,47 +1,225 @@
 
-import pandas as pd
-import boto3
+import time
+_inicio_init = time.perf_counter()
+
 import io
 import json
 import csv
+import os
 from datetime import datetime
 
+from botocore.exceptions import ClientError
+
+import armazenamento
+import comum_lambdas as comum
+import esquema_weather as esquema
+
+# pandas só é importado no primeiro uso, fora do init do container
+pd = comum.ModuloPreguicoso('pandas')
+
 # Configurações AWS
 regiao = 'us-east-1'
 nome_bucket_trusted = 'bucket-trusted-g3-venuste-v2'
 nome_bucket_client = 'bucket-client-g3-venuste-v2'
 arquivo_entrada = 'weather_sum_2025.csv'
 arquivo_saida = 'csv_client.csv'
+# Os demais arquivos do trusted geram <key sem extensão>_client.csv
+sufixo_saida_client = '_client.csv'
+
+# Formatos de leitura do trusted e de escrita do client: 'csv' ou 'parquet'
+formato_entrada = os.environ.get('FORMATO_ENTRADA', 'csv').lower()
+formato_saida = os.environ.get('FORMATO_SAIDA', 'csv').lower()
+compressao_parquet = os.environ.get('COMPRESSAO_PARQUET', 'snappy')  # 'snappy' ou 'zstd'
+prefixo_parquet_trusted = 'weather_parquet/'
+prefixo_parquet_client = 'weather_parquet/'
+colunas_particao_client = ['estacao', 'ano']
+
+# Cubo de agregados: um dataset por granularidade (GRANULARIDADES_ROLLUP vazio desativa)
+granularidades_rollup = [
+    granularidade.strip()
+    for granularidade in os.environ.get('GRANULARIDADES_ROLLUP', ','.join(esquema.granularidades_rollup)).split(',')
+    if granularidade.strip()
+]
+prefixo_rollup = 'rollup/'
+prefixo_rollup_parquet = 'rollup_parquet/'
+
+# Agregação por estado (MODO_INCREMENTAL): soma/contagem/mín/máx diários de
+# cada métrica por origem e estação, num único arquivo. Só a leitura do
+# trusted se limita ao arquivo novo: cada execução lê e regrava o estado
+# inteiro e recalcula o cubo de todo o histórico, então o custo (tempo,
+# memória e bytes no S3) cresce com o histórico, não com o arquivo.
+modo_incremental = os.environ.get('MODO_INCREMENTAL', 'false').lower() == 'true'
+arquivo_estado = '_estado/agregados_diarios.csv'
+tentativas_estado = 5
+
+# Colunas do trusted lidas pelo client: todas as métricas entram no cubo
+metricas_rollup = esquema.colunas_numericas(esquema.esquema_trusted)
+colunas_trusted = ['timestamp', 'estacao'] + metricas_rollup
+
+# Como cada estatística diária se combina entre arquivos, chunks e períodos
+agregacoes_estatisticas = {'soma': 'sum', 'contagem': 'sum', 'minimo': 'min', 'maximo': 'max'}
+colunas_parcial = ['origem', 'estacao', 'dia'] + [
+    f"{metrica}_{estatistica}" for metrica in metricas_rollup for estatistica in agregacoes_estatisticas
+]
+colunas_soma = [f"{metrica}_soma" for metrica in metricas_rollup]
+
+meses = {
+    1: 'Janeiro', 2: 'Fevereiro', 3: 'Março',
+    4: 'Abril', 5: 'Maio', 6: 'Junho',
+    7: 'Julho', 8: 'Agosto', 9: 'Setembro',
+    10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'
+}
+
+# Endpoint opcional para usar um S3 compatível local (MinIO, LocalStack)
+endpoint_s3 = os.environ.get('S3_ENDPOINT_URL') or None
 
-# Inicialização dos clientes AWS
-s3_client = boto3.client('s3', region_name=regiao)
-s3_resource = boto3.resource('s3', region_name=regiao)
+# Cliente do armazenamento (S3, diretório local ou memória, pela variável
+# ARMAZENAMENTO), reutilizado entre invocações do mesmo container
+s3_client = armazenamento.criar_cliente(regiao, endpoint_s3)
 
-def ler_arquivo_s3():
+medidor = comum.MedidorEtapas('tratamento_para_client')
+
+def ler_arquivo_s3(bucket=None, key=None):
     """
     Lê o arquivo CSV do bucket trusted
     """
+    bucket = bucket or nome_bucket_trusted
+    key = key or arquivo_entrada
     try:
-        print(f"Tentando ler arquivo {arquivo_entrada} do bucket {nome_bucket_trusted}")
-        response = s3_client.get_object(Bucket=nome_bucket_trusted, Key=arquivo_entrada)
+        print(f"Tentando ler arquivo {key} do bucket {bucket}")
+        with medidor.etapa('s3_get') as etapa:
+            response = s3_client.get_object(Bucket=bucket, Key=key)
+            fonte = armazenamento.fonte_leitura(response)
+            etapa['bytes'] += response['ContentLength']
        
-        df = pd.read_csv(
-            io.BytesIO(response['Body'].read()),
-            sep=';'  # Usando ponto-e-vírgula como separador pois o arquivo vem do trusted
-        )
+        # Rejeita um trusted fora do esquema antes do parse
+        esquema.validar_colunas(esquema.cabecalho_csv(fonte.read(65536), sep=';'), esquema.esquema_trusted, 'trusted', exato=True)
+        fonte.seek(0)
+
+        with medidor.etapa('parse') as etapa:
+            # Só as colunas usadas nas médias, já tipadas ('N/A' vira nulo)
+            df = pd.read_csv(
+                fonte,
+                sep=';',  # Usando ponto-e-vírgula como separador pois o arquivo vem do trusted
+                **esquema.opcoes_leitura(esquema.esquema_trusted, colunas_trusted)
+            )
+            etapa['linhas_saida'] += len(df)
         print(f"Arquivo lido com sucesso. Shape: {df.shape}")
         return df
        
     except s3_client.exceptions.NoSuchKey:
-        error_msg = f"Arquivo {arquivo_entrada} não encontrado no bucket {nome_bucket_trusted}"
+        error_msg = f"Arquivo {key} não encontrado no bucket {bucket}"
         print(error_msg)
         raise FileNotFoundError(error_msg)
+    except esquema.ErroEsquema as e:
+        print(str(e))
+        raise
     except Exception as e:
         error_msg = f"Erro ao ler arquivo do S3: {str(e)}"
         print(error_msg)
         raise Exception(error_msg)
 
-def salvar_arquivo_s3(df):
+def ler_parquet_particionado_s3(bucket, prefixo, colunas, nome_base=None, chaves=None):
+    """
+    Lê os arquivos parquet de um prefixo no layout Hive (coluna=valor/),
+    carregando só as colunas pedidas e recuperando as partições pelo caminho.
+    Com nome_base, lê apenas as partes geradas a partir daquele arquivo raw;
+    com chaves, lê só essas keys do prefixo, sem listá-lo.
+    """
+    try:
+        print(f"Tentando ler parquet particionado de s3://{bucket}/{prefixo}")
+        if chaves is None:
+            paginator = s3_client.get_paginator('list_objects_v2')
+            chaves = [
+                obj['Key']
+                for pagina in paginator.paginate(Bucket=bucket, Prefix=prefixo)
+                for obj in pagina.get('Contents', [])
+                if obj['Key'].endswith('.parquet')
+                and (nome_base is None or comum.parte_do_arquivo(obj['Key'], nome_base))
+            ]
+        if not chaves:
+            raise FileNotFoundError(f"Nenhum arquivo parquet encontrado em s3://{bucket}/{prefixo}")
+
+        partes = []
+        for key in chaves:
+            with medidor.etapa('s3_get') as etapa:
+                response = s3_client.get_object(Bucket=bucket, Key=key)
+                fonte = armazenamento.fonte_leitura(response)
+                etapa['bytes'] += response['ContentLength']
+            caminho = key[len(prefixo):].split('/')[:-1]
+            particoes = dict(trecho.split('=', 1) for trecho in caminho)
+            # Só busca do arquivo as colunas que não vêm do caminho
+            colunas_arquivo = [c for c in colunas if c not in particoes]
+            with medidor.etapa('parse') as etapa:
+                parte = pd.read_parquet(fonte, columns=colunas_arquivo)
+                etapa['linhas_saida'] += len(parte)
+            for coluna, valor in particoes.items():
+                if coluna in colunas:
+                    parte[coluna] = valor
+            partes.append(parte)
+
+        df = pd.concat(partes, ignore_index=True)[colunas]
+        print(f"{len(chaves)} arquivos lidos com sucesso. Shape: {df.shape}")
+        return df
+
+    except FileNotFoundError as e:
+        print(str(e))
+        raise
+    except Exception as e:
+        error_msg = f"Erro ao ler parquet do S3: {str(e)}"
+        print(error_msg)
+        raise Exception(error_msg)
+
+def salvar_parquet_particionado_s3(df, bucket, prefixo, nome_base, particoes):
+    """
+    Salva o DataFrame em parquet no layout Hive (coluna=valor/), um arquivo
+    por partição. As colunas de partição ficam só no caminho.
+    """
+    try:
+        if df.empty:
+            raise ValueError("DataFrame está vazio, nenhum dado para salvar")
+
+        chaves = []
+        for valores, grupo in df.groupby(particoes, sort=True, observed=True):
+            caminho = '/'.join(f"{col}={valor}" for col, valor in zip(particoes, valores))
+            key = f"{prefixo}{caminho}/{nome_base}.parquet"
+
+            with medidor.etapa('serializacao', len(grupo)) as etapa:
+                buffer = io.BytesIO()
+                grupo.drop(columns=particoes).to_parquet(
+                    buffer,
+                    engine='pyarrow',
+                    compression=compressao_parquet,
+                    index=False,
+                    # Athena lê timestamps em milissegundos
+                    coerce_timestamps='ms',
+                    allow_truncated_timestamps=True
+                )
+                etapa['linhas_saida'] += len(grupo)
+            with medidor.etapa('put') as etapa:
+                s3_client.put_object(
+                    Bucket=bucket,
+                    Key=key,
+                    Body=buffer.getvalue(),
+                    ContentType='application/vnd.apache.parquet',
+                    Metadata={
+                        'rows': str(len(grupo)),
+                        'columns': str(len(grupo.columns) - len(particoes)),
+                        'processed-date': datetime.now().isoformat()
+                    }
+                )
+                etapa['bytes'] += buffer.getbuffer().nbytes
+            chaves.append(key)
+
+        print(f"{len(chaves)} partições parquet salvas em s3://{bucket}/{prefixo}")
+        return chaves
+
+    except Exception as e:
+        error_msg = f"Erro ao salvar parquet no S3: {str(e)}"
+        print(error_msg)
+        raise Exception(error_msg)
+
+def salvar_arquivo_s3(df, key=None):
     """
     Salva o DataFrame processado no bucket client
     """
@@ -51,30 +229,33 @@ def salvar_arquivo_s3(df):
         if df.empty:
             raise ValueError("DataFrame está vazio, nenhum dado para salvar")
            
-        # Converter DataFrame para CSV em memória usando ponto-e-vírgula como separador
-        csv_buffer = io.StringIO()
-        df.to_csv(
-            csv_buffer,
-            index=False,
-            sep=';',
-            decimal='.',
-            encoding='utf-8',
-            quoting=csv.QUOTE_MINIMAL
-        )
-       
-        # Upload para S3 com metadata para melhor identificação
-        conteudo = csv_buffer.getvalue().encode('utf-8')
-        s3_client.put_object(
-            Bucket=nome_bucket_client,
-            Key=arquivo_saida,
-            Body=conteudo,
-            ContentType='text/csv',
-            Metadata={
+        # Converter DataFrame para CSV usando ponto-e-vírgula como separador,
+        # enviando ao S3 em partes durante a serialização, com metadata para melhor identificação
+        escritor = comum.EscritorMultipartS3(
+            s3_client,
+            medidor,
+            nome_bucket_client,
+            key or arquivo_saida,
+            metadata={
                 'rows': str(len(df)),
                 'columns': str(len(df.columns)),
                 'processed-date': datetime.now().isoformat()
             }
         )
+        try:
+            comum.escrever_csv_s3(
+                df,
+                escritor,
+                index=False,
+                sep=';',
+                decimal='.',
+                quoting=csv.QUOTE_MINIMAL
+            )
+            escritor.finalizar()
+        except Exception:
+            escritor.abort()
+            raise
+       
         print(f"Arquivo processado salvo com sucesso no bucket {nome_bucket_client}")
         print(f"Total de registros salvos: {len(df)}")
        
@@ -83,63 +264,204 @@ def salvar_arquivo_s3(df):
         print(error_msg)
         raise Exception(error_msg)
    
-def calculate_monthly_averages():
+def chave_saida_client(key):
+    """
+    Chave do CSV client gerado a partir de um arquivo do trusted.
+    O arquivo padrão continua gerando o csv_client.csv.
+    """
+    if key == arquivo_entrada:
+        return arquivo_saida
+    return f"{os.path.splitext(key)[0]}{sufixo_saida_client}"
+
+def resolver_entrada(key=None):
+    """
+    Define a key do trusted a ler. A key pode ser um CSV ou um marcador
+    _SUCCESS/<arquivo>.success do modo parquet; sem key, usa o arquivo padrão.
+    Retorna (key, se é parquet, nome base do arquivo de origem).
+    """
+    marcador_parquet = f"{prefixo_parquet_trusted}_SUCCESS/"
+    if key is None and formato_entrada == 'parquet':
+        key = f"{marcador_parquet}{comum.nome_base_arquivo(arquivo_entrada)}.success"
+    key = key or arquivo_entrada
+    entrada_parquet = key.startswith(marcador_parquet)
+    if entrada_parquet:
+        nome_base = os.path.splitext(key[len(marcador_parquet):])[0]
+    else:
+        nome_base = comum.nome_base_arquivo(key)
+    return key, entrada_parquet, nome_base
+
+def ler_dados_trusted(bucket, key, entrada_parquet, nome_base):
+    """
+    Lê os dados do trusted e converte timestamp e métricas
+    """
+    if entrada_parquet:
+        df = ler_parquet_particionado_s3(
+            bucket,
+            prefixo_parquet_trusted,
+            colunas_trusted,
+            nome_base=nome_base
+        )
+        df['estacao'] = df['estacao'].astype('category')
+    else:
+        df = ler_arquivo_s3(bucket, key)
+
+    with medidor.etapa('limpeza', len(df)) as etapa:
+        # Converter timestamp para datetime para agrupar por dia
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+   
+        # Converter as métricas para numérico, ignorando 'N/A'
+        for metrica in metricas_rollup:
+            df[metrica] = pd.to_numeric(df[metrica], errors='coerce')
+        etapa['linhas_saida'] += len(df)
+    return df
+
+def formatar_medias_mensais(mensal):
+    """
+    Médias mensais de temperatura a partir do mensal do cubo, ordenadas por
+    estação, ano e mês, com nome do mês e a data do próprio mês (com o ano dos dados)
+    """
+    with medidor.etapa('formatacao', len(mensal)) as etapa:
+        monthly_avg = mensal[['estacao', 'periodo', 'temperatura_media']].rename(columns={'periodo': 'data'})
+        monthly_avg = monthly_avg.sort_values(['estacao', 'data'])
+        monthly_avg['mes'] = monthly_avg['data'].dt.month.astype('int32')
+   
+        # Adicionar nome do mês
+        monthly_avg['nome_mes'] = monthly_avg['mes'].map(meses)
+        etapa['linhas_saida'] += len(monthly_avg)
+   
+    # Reordenar colunas
+    return monthly_avg[['estacao', 'data', 'mes', 'nome_mes', 'temperatura_media']]
+
+def salvar_medias_mensais(monthly_avg, nome_base, key_csv):
+    """
+    Salva as médias mensais no bucket client no formato configurado
+    """
+    if formato_saida == 'parquet':
+        salvar_parquet_particionado_s3(
+            monthly_avg.assign(ano=monthly_avg['data'].dt.year),
+            nome_bucket_client,
+            prefixo_parquet_client,
+            nome_base,
+            colunas_particao_client
+        )
+    else:
+        salvar_arquivo_s3(monthly_avg, key_csv)
+
+def periodo_rollup(dias, granularidade):
+    """
+    Primeiro dia do período da granularidade para cada dia (datetime64[D])
+    """
+    if granularidade == 'diario':
+        return dias
+    if granularidade == 'semanal':
+        # Semanas ISO, começando na segunda-feira (1970-01-01 foi uma quinta)
+        return dias - ((dias.astype('int64') + 3) % 7).astype('timedelta64[D]')
+    if granularidade == 'mensal':
+        return dias.astype('datetime64[M]').astype('datetime64[D]')
+    if granularidade == 'anual':
+        return dias.astype('datetime64[Y]').astype('datetime64[D]')
+    raise ValueError(f"Granularidade desconhecida: {granularidade}")
+
+def rollup(estado, granularidade):
+    """
+    Agrega os totais diários por estação e período da granularidade, com
+    média, mínimo, máximo, soma e contagem de cada métrica. Os períodos
+    são datas completas, então anos diferentes não se misturam.
+    """
+    with medidor.etapa('rollup', len(estado)) as etapa:
+        dias = estado['dia'].to_numpy(dtype='datetime64[D]')
+        periodo = pd.Series(
+            periodo_rollup(dias, granularidade).astype('datetime64[ns]'),
+            index=estado.index,
+            name='periodo'
+        )
+        agregacoes = {coluna: agregacoes_estatisticas[coluna.rsplit('_', 1)[1]] for coluna in colunas_parcial[3:]}
+        # Somas em centavos: a média arredondada não depende da ordem em que
+        # as origens entraram no estado
+        totais = estado.assign(**para_centavos(estado[colunas_soma])).groupby(
+            [estado['estacao'], periodo], observed=True
+        ).agg(agregacoes).reset_index()
+        totais[colunas_soma] = totais[colunas_soma] / 100
+
+        totais['ano'] = totais['periodo'].dt.year.astype('int32')
+        for metrica in metricas_rollup:
+            contagem = totais[f"{metrica}_contagem"].astype('int64')
+            totais[f"{metrica}_media"] = (totais[f"{metrica}_soma"] / contagem.where(contagem > 0)).round(2)
+            totais[f"{metrica}_soma"] = totais[f"{metrica}_soma"].round(2)
+            totais[f"{metrica}_contagem"] = contagem
+        etapa['linhas_saida'] += len(totais)
+    return totais[list(esquema.esquema_rollup)]
+
+def salvar_rollups(cubo, nome_base):
+    """
+    Grava cada granularidade do cubo como um dataset próprio no bucket client
+    e, por último, o marcador _SUCCESS/<arquivo>.success do rollup, que é o
+    gatilho do enriquecimento (uma vez por publicação, não por partição)
+    """
+    parquet = formato_saida == 'parquet'
+    for granularidade in granularidades_rollup:
+        if parquet:
+            salvar_parquet_particionado_s3(
+                cubo[granularidade],
+                nome_bucket_client,
+                f"{prefixo_rollup_parquet}{granularidade}/",
+                nome_base,
+                colunas_particao_client
+            )
+        else:
+            salvar_arquivo_s3(cubo[granularidade], f"{prefixo_rollup}{granularidade}/{nome_base}.csv")
+    prefixo = prefixo_rollup_parquet if parquet else prefixo_rollup
+    s3_client.put_object(Bucket=nome_bucket_client, Key=f"{prefixo}_SUCCESS/{nome_base}.success", Body=b'')
+
+def publicar_client(estado, nome_base, key_csv):
+    """
+    Calcula o cubo a partir dos totais diários e grava as médias mensais
+    e um dataset por granularidade
+    """
+    cubo = {
+        granularidade: rollup(estado, granularidade)
+        for granularidade in dict.fromkeys(granularidades_rollup + ['mensal'])
+    }
+    monthly_avg = formatar_medias_mensais(cubo['mensal'])
+    salvar_medias_mensais(monthly_avg, nome_base, key_csv)
+    salvar_rollups(cubo, nome_base)
+    return monthly_avg, cubo
+
+def imprimir_medias(monthly_avg):
+    print("\nMédias mensais de temperatura por estação:")
+    print("\nEstação A701:")
+    print(monthly_avg[monthly_avg['estacao'] == 'A701'].to_string(index=False))
+
+def calculate_monthly_averages(bucket=None, key=None):
     """
     Calcula as médias mensais de temperatura por estação
     """
+    bucket = bucket or nome_bucket_trusted
+    key, entrada_parquet, nome_base = resolver_entrada(key)
+
     try:
         print("\n=== Iniciando Cálculo de Médias Mensais ===")
        
         # Leitura do CSV do S3
         print("\n1. Leitura do arquivo do bucket trusted...")
-        df = ler_arquivo_s3()
+        df = ler_dados_trusted(bucket, key, entrada_parquet, nome_base)
        
         print("\n2. Processando dados...")
-        # Converter timestamp para datetime para extrair mês
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df['mes'] = df['timestamp'].dt.month
-       
-        # Converter temperatura para numérico, ignorando 'N/A'
-        df['temperatura'] = pd.to_numeric(df['temperatura'], errors='coerce')
-       
-        # Calcular médias mensais por estação
-        monthly_avg = df.groupby(['estacao', 'mes'])['temperatura'].agg([
-            ('temperatura_media', 'mean')
-        ]).round(2).reset_index()
-       
-        # Ordenar por estação e mês
-        monthly_avg = monthly_avg.sort_values(['estacao', 'mes'])
-       
-        # Adicionar nome do mês
-        meses = {
-            1: 'Janeiro', 2: 'Fevereiro', 3: 'Março',
-            4: 'Abril', 5: 'Maio', 6: 'Junho',
-            7: 'Julho', 8: 'Agosto', 9: 'Setembro',
-            10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'
-        }
-        monthly_avg['nome_mes'] = monthly_avg['mes'].map(meses)
-
-        monthly_avg['data'] = pd.to_datetime(
-        monthly_avg['mes'].astype(str) + '-2025', format='%m-%Y'
-        )
-       
-        # Reordenar colunas
-        monthly_avg = monthly_avg[['estacao', 'data', 'mes', 'nome_mes', 'temperatura_media']]
+        # Totais diários de todas as métricas em uma passada; o cubo e as
+        # médias mensais saem deles
+        parcial = agregar_parcial(df, f"{bucket}/{key}")
        
         # Salvar no S3
         print("\n3. Salvando resultados no bucket client...")
-        salvar_arquivo_s3(monthly_avg)
+        monthly_avg, cubo = publicar_client(parcial, nome_base, chave_saida_client(key))
        
         # Imprimir resultados
-        print("\nMédias mensais de temperatura por estação:")
-        print("\nEstação A701:")
-        print(monthly_avg[monthly_avg['estacao'] == 'A701'].to_string(index=False))
+        imprimir_medias(monthly_avg)
        
-        # Calcular e mostrar médias anuais
+        # Mostrar médias anuais
         print("\nMédias anuais por estação:")
-        annual_avg = df.groupby('estacao')['temperatura'].mean().round(2)
-        for estacao, media in annual_avg.items():
-            print(f"Estação {estacao}: {media}°C")
+        for linha in rollup(parcial, 'anual').itertuples(index=False):
+            print(f"Estação {linha.estacao} ({linha.ano}): {linha.temperatura_media}°C")
        
         return True
        
@@ -147,19 +469,278 @@ def calculate_monthly_averages():
         print(f"Erro durante o processamento: {e}")
         return False
 
+def para_centavos(valores):
+    """
+    Medições, ou somas delas, em centavos inteiros (ainda em float64). As
+    medições do trusted têm 2 casas, então as somas em centavos são exatas
+    e não dependem da ordem: dividir o arquivo em chunks, ou juntar origens
+    em outra ordem, não muda a média arredondada.
+    """
+    return (valores.astype('float64') * 100).round()
+
+def agregar_parcial(df, origem):
+    """
+    Soma, contagem, mínimo e máximo diários de cada métrica por estação, em
+    uma única passada pelas linhas de um arquivo do trusted. As semanas,
+    meses e anos do cubo são agregados a partir destes totais.
+    """
+    with medidor.etapa('agregacao', len(df)) as etapa:
+        dia = df['timestamp'].dt.normalize().rename('dia')
+        parcial = para_centavos(df[metricas_rollup]).groupby([df['estacao'], dia], observed=True).agg(
+            ['sum', 'count', 'min', 'max']
+        )
+        nomes = dict(zip(['sum', 'count', 'min', 'max'], agregacoes_estatisticas))
+        parcial.columns = [f"{metrica}_{nomes[funcao]}" for metrica, funcao in parcial.columns]
+        for coluna in parcial.columns:
+            if not coluna.endswith('_contagem'):
+                parcial[coluna] = parcial[coluna] / 100
+        parcial = parcial.reset_index()
+        parcial.insert(0, 'origem', origem)
+        etapa['linhas_saida'] += len(parcial)
+    return parcial[colunas_parcial]
+
+def combinar_parciais(parciais):
+    """
+    Junta agregações parciais (ex.: de vários chunks do mesmo arquivo)
+    somando somas e contagens e combinando mínimos e máximos
+    """
+    parciais = [p for p in parciais if not p.empty]
+    if not parciais:
+        return pd.DataFrame(columns=colunas_parcial)
+    agregacoes = {coluna: agregacoes_estatisticas[coluna.rsplit('_', 1)[1]] for coluna in colunas_parcial[3:]}
+    juntas = pd.concat(parciais, ignore_index=True)
+    combinadas = juntas.assign(**para_centavos(juntas[colunas_soma])).groupby(
+        ['origem', 'estacao', 'dia'], sort=False, observed=True
+    ).agg(agregacoes).reset_index()
+    combinadas[colunas_soma] = combinadas[colunas_soma] / 100
+    return combinadas
+
+def carregar_estado():
+    """
+    Lê o estado inteiro da agregação. Retorna (DataFrame, ETag);
+    se ainda não existe, retorna um estado vazio e ETag None.
+    """
+    try:
+        response = s3_client.get_object(Bucket=nome_bucket_client, Key=arquivo_estado)
+        estado = pd.read_csv(
+            io.BytesIO(response['Body'].read()),
+            sep=';',
+            dtype={'origem': str, 'estacao': str},
+            parse_dates=['dia'],
+            # Relê as somas exatamente como gravadas, sem perder precisão a cada execução
+            float_precision='round_trip'
+        )
+        print(f"Estado carregado: {len(estado)} grupos")
+        return estado, response['ETag']
+    except s3_client.exceptions.NoSuchKey:
+        print("Estado ainda não existe, iniciando um novo")
+        return pd.DataFrame(columns=colunas_parcial), None
+
+def salvar_estado(estado, etag):
+    """
+    Grava o estado com escrita condicional, para que duas execuções
+    concorrentes não sobrescrevam a atualização uma da outra
+    """
+    csv_buffer = io.StringIO()
+    # Sem float_format para não perder precisão nas somas
+    estado.to_csv(csv_buffer, index=False, sep=';')
+    condicao = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+    s3_client.put_object(
+        Bucket=nome_bucket_client,
+        Key=arquivo_estado,
+        Body=csv_buffer.getvalue().encode('utf-8'),
+        ContentType='text/csv',
+        Metadata={
+            'rows': str(len(estado)),
+            'processed-date': datetime.now().isoformat()
+        },
+        **condicao
+    )
+
+def mesclar_estado(parcial, origem):
+    """
+    Substitui no estado a contribuição da origem pela nova agregação parcial.
+    Reprocessar o mesmo arquivo não duplica as somas. Lê e regrava o estado
+    inteiro, O(histórico) a cada chamada. Aceita também uma
+    lista de origens, para o backfill mesclar vários arquivos de uma vez.
+    """
+    origens = [origem] if isinstance(origem, str) else list(origem)
+    for tentativa in range(1, tentativas_estado + 1):
+        with medidor.etapa('estado', len(parcial)) as etapa:
+            estado, etag = carregar_estado()
+            estado = pd.concat(
+                [df for df in (estado[~estado['origem'].isin(origens)], parcial) if not df.empty],
+                ignore_index=True
+            )
+            etapa['linhas_saida'] += len(estado)
+        try:
+            with medidor.etapa('put'):
+                salvar_estado(estado, etag)
+            return estado
+        except ClientError as e:
+            codigo = e.response.get('Error', {}).get('Code')
+            if codigo not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                raise
+            print(f"Estado alterado por outra execução, tentando novamente ({tentativa}/{tentativas_estado})")
+    raise Exception("Não foi possível atualizar o estado da agregação")
+
+def medias_a_partir_do_estado(estado):
+    """
+    Médias mensais de temperatura por estação calculadas só com as somas e
+    contagens diárias do estado, equivalentes à média sobre todos os dados
+    """
+    return formatar_medias_mensais(rollup(estado, 'mensal'))
+
+def publicar_medias_de_parcial(parcial, bucket, key):
+    """
+    Entrada do pipeline fundido: recebe a agregação parcial calculada em
+    memória pela Lambda trusted e grava o client sem baixar nem reler o trusted
+    """
+    key, _, nome_base = resolver_entrada(key)
+    origem = f"{bucket}/{key}"
+    parcial = parcial.assign(origem=origem)
+
+    if modo_incremental:
+        estado = mesclar_estado(parcial, origem)
+        monthly_avg, _ = publicar_client(estado, comum.nome_base_arquivo(arquivo_saida), arquivo_saida)
+    else:
+        monthly_avg, _ = publicar_client(parcial, nome_base, chave_saida_client(key))
+
+    imprimir_medias(monthly_avg)
+    return monthly_avg
+
+def publicar_medias_de_parciais(parciais):
+    """
+    Publica o client de vários arquivos do trusted a partir das agregações
+    parciais por (bucket, key). No modo com estado o estado e o CSV client
+    são gravados uma única vez para todos os arquivos.
+    """
+    if not modo_incremental:
+        for (bucket, key), parcial in parciais.items():
+            publicar_medias_de_parcial(parcial, bucket, key)
+        return
+
+    origens = []
+    lista = []
+    for (bucket, key), parcial in parciais.items():
+        key, _, _ = resolver_entrada(key)
+        origem = f"{bucket or nome_bucket_trusted}/{key}"
+        origens.append(origem)
+        lista.append(parcial.assign(origem=origem))
+
+    estado = mesclar_estado(pd.concat(lista, ignore_index=True), origens)
+    print(f"Estado com {estado['origem'].nunique()} arquivos e {len(estado)} grupos")
+    monthly_avg, _ = publicar_client(estado, comum.nome_base_arquivo(arquivo_saida), arquivo_saida)
+    imprimir_medias(monthly_avg)
+    return monthly_avg
+
+def calculate_monthly_averages_incremental(bucket=None, key=None):
+    """
+    Lê só o arquivo recebido do trusted e mescla a agregação dele no estado
+    persistido. O estado é lido e regravado inteiro e o cubo e o CSV client
+    são recalculados sobre todo o histórico, O(histórico) por execução.
+    """
+    bucket = bucket or nome_bucket_trusted
+    key, entrada_parquet, nome_base = resolver_entrada(key)
+    origem = f"{bucket}/{key}"
+
+    try:
+        print("\n=== Iniciando Cálculo de Médias Mensais pelo Estado ===")
+
+        print("\n1. Leitura do arquivo do bucket trusted...")
+        df = ler_dados_trusted(bucket, key, entrada_parquet, nome_base)
+
+        print("\n2. Atualizando estado da agregação...")
+        parcial = agregar_parcial(df, origem)
+        estado = mesclar_estado(parcial, origem)
+        print(f"Estado com {estado['origem'].nunique()} arquivos e {len(estado)} grupos")
+
+        print("\n3. Salvando resultados no bucket client...")
+        monthly_avg, _ = publicar_client(estado, comum.nome_base_arquivo(arquivo_saida), arquivo_saida)
+
+        imprimir_medias(monthly_avg)
+        return True
+
+    except Exception as e:
+        print(f"Erro durante o processamento: {e}")
+        return False
+
+def calculate_monthly_averages_lote(objetos):
+    """
+    Modo com estado e vários arquivos no mesmo evento (lote da fila):
+    agrega cada arquivo e mescla todos no estado de uma vez. Retorna o
+    sucesso de cada objeto, na ordem recebida.
+    """
+    print(f"\n=== Iniciando Cálculo de Médias Mensais pelo Estado ({len(objetos)} arquivos) ===")
+    sucesso = {}
+    parciais = {}
+    for bucket, key in objetos:
+        try:
+            print(f"\nLendo s3://{bucket}/{key or arquivo_entrada}")
+            key_resolvida, entrada_parquet, nome_base = resolver_entrada(key)
+            df = ler_dados_trusted(bucket, key_resolvida, entrada_parquet, nome_base)
+            parciais[(bucket, key)] = agregar_parcial(df, '')
+            sucesso[(bucket, key)] = True
+        except Exception as e:
+            print(f"Erro durante o processamento: {e}")
+            sucesso[(bucket, key)] = False
+
+    if parciais:
+        try:
+            print(f"\nAtualizando estado da agregação com {len(parciais)} arquivos...")
+            publicar_medias_de_parciais(parciais)
+        except Exception as e:
+            print(f"Erro durante o processamento: {e}")
+            for objeto in parciais:
+                sucesso[objeto] = False
+
+    return [sucesso[objeto] for objeto in objetos]
+
+def extrair_objetos_evento(event):
+    """
+    Lista (bucket, key) de cada objeto criado no evento, sem repetir
+    """
+    return comum.extrair_objetos_evento(event, (nome_bucket_trusted, None))
+
 def lambda_handler(event, context):
     """
     Handler da função Lambda AWS
     """
+    global _primeira_invocacao
+    cold_start = _primeira_invocacao
+    _primeira_invocacao = False
+    imports_antes = set(comum.tempos_importacao)
+    medidor.reiniciar()
+    request_id = context.aws_request_id if context else 'Local'
+
     print("\n=== Iniciando Execução Lambda de Cálculo de Médias Mensais ===")
     start_time = datetime.now()
    
     try:
+        print(f"Cold start: {cold_start} (init do módulo: {duracao_init:.3f} segundos)")
         print(f"Timestamp início: {start_time.isoformat()}")
         print(f"Função Lambda: {context.function_name if context else 'Local'}")
-        print(f"Request ID: {context.aws_request_id if context else 'Local'}")
+        print(f"Request ID: {request_id}")
        
-        success = calculate_monthly_averages()
+        objetos = extrair_objetos_evento(event)
+        print(f"Objetos a processar: {len(objetos)}")
+
+        resultados = []
+        with comum.perfil_opcional():
+            if modo_incremental and len(objetos) > 1:
+                # Lote coalescido: uma única mescla e escrita do estado e do client
+                for (bucket, key), ok in zip(objetos, calculate_monthly_averages_lote(objetos)):
+                    resultados.append({'bucket': bucket, 'key': key or arquivo_entrada, 'success': ok})
+            else:
+                for bucket, key in objetos:
+                    print(f"\nProcessando s3://{bucket}/{key or arquivo_entrada}")
+                    if modo_incremental:
+                        ok = calculate_monthly_averages_incremental(bucket, key)
+                    else:
+                        ok = calculate_monthly_averages(bucket, key)
+                    resultados.append({'bucket': bucket, 'key': key or arquivo_entrada, 'success': ok})
+
+        success = all(r['success'] for r in resultados)
        
         end_time = datetime.now()
         duration = (end_time - start_time).total_seconds()
@@ -168,25 +749,33 @@ def lambda_handler(event, context):
             message = {
                 'status': 'success',
                 'message': 'Processamento das médias mensais concluído com sucesso!',
+                'objects': resultados,
                 'duration_seconds': duration,
+                'timings': comum.tempos_execucao(cold_start, imports_antes, duration, duracao_init),
+                'stages': medidor.resumo(),
                 'timestamp': end_time.isoformat()
             }
             print(f"\nProcessamento concluído com sucesso em {duration:.2f} segundos")
             return {
                 'statusCode': 200,
-                'body': json.dumps(message)
+                'body': json.dumps(message),
+                **comum.falhas_lote(event, resultados)
             }
         else:
             message = {
                 'status': 'error',
                 'message': 'Falha no processamento das médias mensais',
+                'objects': resultados,
                 'duration_seconds': duration,
+                'timings': comum.tempos_execucao(cold_start, imports_antes, duration, duracao_init),
+                'stages': medidor.resumo(),
                 'timestamp': end_time.isoformat()
             }
             print(f"\nProcessamento falhou após {duration:.2f} segundos")
             return {
                 'statusCode': 500,
-                'body': json.dumps(message)
+                'body': json.dumps(message),
+                **comum.falhas_lote(event, resultados)
             }
            
     except Exception as e:
@@ -196,14 +785,24 @@ def lambda_handler(event, context):
             'status': 'error',
             'message': f'Erro: {str(e)}',
             'duration_seconds': duration,
+            'timings': comum.tempos_execucao(cold_start, imports_antes, duration, duracao_init),
+            'stages': medidor.resumo(),
             'timestamp': end_time.isoformat()
         }
         print(f"\nErro na execução da Lambda após {duration:.2f} segundos: {str(e)}")
         return {
             'statusCode': 500,
-            'body': json.dumps(error_message)
+            'body': json.dumps(error_message),
+            **comum.falhas_lote(event)
         }
 
+    finally:
+        medidor.emitir(request_id)
+
+# Tempo de init do módulo (imports e clientes), reportado na primeira invocação
+duracao_init = time.perf_counter() - _inicio_init
+_primeira_invocacao = True
+
 # Permite testar o código localmente
 if __name__ == "__main__":
     print("Iniciando processamento das médias mensais localmente...")
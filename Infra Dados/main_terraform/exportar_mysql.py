@@ -1,7 +1,17 @@
 import pymysql
+import pymysql.cursors
 import pandas as pd
 import boto3
+import csv
+import io
+import json
 import os
+import queue
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from boto3.s3.transfer import TransferConfig
 
 # ----------------------------
 # CONFIGURAÇÕES DO USUÁRIO
@@ -14,12 +24,402 @@ DATABASE = "projeto_extensao"
 BUCKET = "bucket-client-g3-venuste-v2"
 PASTA = "weather/"
 
-conn = pymysql.connect(
-    host=HOST,
-    user=USER,
-    password=PASSWORD,
-    db=DATABASE
-)
+# Exportação em streaming: lê com cursor do lado do servidor (sem buffer)
+# em lotes e envia direto ao S3 em multipart, sem CSV local
+EXPORTACAO_STREAMING = True
+TAMANHO_LOTE = 10000                     # linhas buscadas por fetchmany
+TAMANHO_PARTE_UPLOAD = 8 * 1024 * 1024   # mínimo de 5 MB exigido pelo S3
+
+# Exportação paralela: cada worker usa uma conexão própria do pool;
+# as maiores tabelas são agendadas primeiro
+EXPORTACAO_PARALELA = True
+EXPORTACAO_WORKERS = 4
+
+# Exportação incremental (delta): guarda no S3 a marca d'água de cada tabela
+# e exporta só as linhas novas como arquivos extras no mesmo prefixo. Com
+# marca por data/hora as linhas alteradas voltariam num delta, repetidas ao
+# lado do snapshot; nessas tabelas qualquer alteração refaz o snapshot
+EXPORTACAO_INCREMENTAL = True
+ARQUIVO_ESTADO = "_estado/exportacao_mysql.json"
+# Coluna da marca d'água por tabela; sem configuração, usa a coluna timestamp
+# com ON UPDATE CURRENT_TIMESTAMP ou, na falta dela, a chave auto_increment
+COLUNAS_WATERMARK = {}
+# Número de deltas acumulados (marca auto_increment) que dispara a
+# compactação em um novo snapshot
+COMPACTAR_APOS_PARTES = 24
+
+# ----------------------------
+# FUNÇÕES DE EXPORTAÇÃO
+# ----------------------------
+class CursorCSVStream(io.RawIOBase):
+    """
+    Stream de leitura que gera o CSV sob demanda a partir de um cursor:
+    cada read() busca o próximo lote, codifica e devolve os bytes.
+    A memória fica limitada a um lote, qualquer que seja o tamanho da tabela.
+    """
+
+    def __init__(self, cursor, tamanho_lote=TAMANHO_LOTE, coluna_watermark=None):
+        super().__init__()
+        self.cursor = cursor
+        self.tamanho_lote = tamanho_lote
+        self.pendente = b""
+        self.linhas = 0
+        self.fim = False
+        # Maior valor visto da coluna de marca d'água, se houver
+        nomes = [coluna[0] for coluna in cursor.description]
+        self.indice_watermark = nomes.index(coluna_watermark) if coluna_watermark else None
+        self.maximo = None
+        self.texto = io.StringIO()
+        # Mesmo formato do to_csv(index=False, sep=";")
+        self.escritor = csv.writer(self.texto, delimiter=";", lineterminator="\n")
+        self.escritor.writerow([coluna[0] for coluna in cursor.description])
+        self._consumir_texto()
+
+    def _consumir_texto(self):
+        self.pendente += self.texto.getvalue().encode("utf-8")
+        self.texto.seek(0)
+        self.texto.truncate(0)
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        while not self.pendente and not self.fim:
+            lote = self.cursor.fetchmany(self.tamanho_lote)
+            if not lote:
+                self.fim = True
+                break
+            self.escritor.writerows(lote)
+            self.linhas += len(lote)
+            if self.indice_watermark is not None:
+                valores = [linha[self.indice_watermark] for linha in lote if linha[self.indice_watermark] is not None]
+                if valores:
+                    maior = max(valores)
+                    self.maximo = maior if self.maximo is None else max(self.maximo, maior)
+            self._consumir_texto()
+
+        quantidade = min(len(destino), len(self.pendente))
+        destino[:quantidade] = self.pendente[:quantidade]
+        self.pendente = self.pendente[quantidade:]
+        return quantidade
+
+def criar_conexao():
+    return pymysql.connect(
+        host=HOST,
+        user=USER,
+        password=PASSWORD,
+        db=DATABASE
+    )
+
+class PoolConexoes:
+    """
+    Pool fixo de conexões pymysql, uma por worker
+    """
+
+    def __init__(self, tamanho):
+        self.conexoes = queue.Queue()
+        for _ in range(tamanho):
+            self.conexoes.put(criar_conexao())
+
+    @contextmanager
+    def conexao(self):
+        conexao = self.conexoes.get()
+        try:
+            conexao.ping(reconnect=True)
+            yield conexao
+        finally:
+            self.conexoes.put(conexao)
+
+    def fechar(self):
+        while not self.conexoes.empty():
+            self.conexoes.get().close()
+
+def tabelas_por_tamanho(conexao, tabelas):
+    """
+    Ordena as tabelas da maior para a menor (dados + índices segundo o
+    information_schema), para a mais lenta não ser a última a começar
+    """
+    with conexao.cursor() as cursor_tamanho:
+        cursor_tamanho.execute(
+            "SELECT TABLE_NAME, COALESCE(DATA_LENGTH, 0) + COALESCE(INDEX_LENGTH, 0) "
+            "FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s",
+            (DATABASE,)
+        )
+        tamanhos = dict(cursor_tamanho.fetchall())
+    return sorted(tabelas, key=lambda tabela: tamanhos.get(tabela, 0), reverse=True)
+
+def exportar_tabela_streaming(tabela, conexao, key=None, filtro="", parametros=(), coluna_watermark=None):
+    """
+    Exporta a tabela com SSCursor direto para o S3 (por padrão {tabela}/{tabela}.csv).
+    Retorna o número de linhas e o maior valor da coluna de marca d'água.
+    """
+    key = key or f"{tabela}/{tabela}.csv"
+    with conexao.cursor(pymysql.cursors.SSCursor) as cursor_streaming:
+        cursor_streaming.execute(f"SELECT * FROM `{tabela}` {filtro}", parametros)
+        stream = CursorCSVStream(cursor_streaming, coluna_watermark=coluna_watermark)
+        s3.upload_fileobj(
+            # BufferedReader garante leituras do tamanho pedido pelo upload
+            io.BufferedReader(stream, buffer_size=TAMANHO_PARTE_UPLOAD),
+            BUCKET,
+            key,
+            ExtraArgs={"ContentType": "text/csv"},
+            Config=TransferConfig(
+                multipart_threshold=TAMANHO_PARTE_UPLOAD,
+                multipart_chunksize=TAMANHO_PARTE_UPLOAD
+            )
+        )
+    print(f"{stream.linhas} linhas de {tabela} enviadas para s3://{BUCKET}/{key}")
+    return stream.linhas, stream.maximo
+
+def exportar_tabela_pandas(tabela, conexao):
+    """
+    Exportação original: SELECT * em memória, CSV local e upload
+    """
+    # Exporta SELECT *
+    df = pd.read_sql(f"SELECT * FROM {tabela}", conexao)
+
+    # Gera arquivo CSV local
+    nome_csv = f"{tabela}.csv"
+    df.to_csv(nome_csv, index=False, sep=";")
+
+    print(f"Enviando {nome_csv} para S3...")
+
+    # Envia para o bucket/pasta no S3
+    s3.upload_file(nome_csv, BUCKET, f"{tabela}/{nome_csv}")
+
+    # Remover CSV local (opcional)
+    os.remove(nome_csv)
+    return len(df)
+
+def carregar_estado_exportacao():
+    try:
+        response = s3.get_object(Bucket=BUCKET, Key=ARQUIVO_ESTADO)
+        return json.loads(response["Body"].read())
+    except s3.exceptions.NoSuchKey:
+        return {}
+
+def salvar_estado_exportacao(estado):
+    s3.put_object(
+        Bucket=BUCKET,
+        Key=ARQUIVO_ESTADO,
+        Body=json.dumps(estado, indent=2, default=str).encode("utf-8"),
+        ContentType="application/json"
+    )
+
+def detectar_watermark(conexao, tabela):
+    """
+    Retorna (coluna, tipo) da marca d'água da tabela, ou (None, None)
+    quando não há coluna adequada e a tabela precisa ser exportada inteira
+    """
+    with conexao.cursor() as cursor_colunas:
+        cursor_colunas.execute(
+            "SELECT COLUMN_NAME, DATA_TYPE, EXTRA FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s ORDER BY ORDINAL_POSITION",
+            (DATABASE, tabela)
+        )
+        colunas = cursor_colunas.fetchall()
+
+    tipos = {nome: (tipo.lower(), (extra or "").lower()) for nome, tipo, extra in colunas}
+    if tabela in COLUNAS_WATERMARK:
+        coluna = COLUNAS_WATERMARK[tabela]
+        tipo_coluna = tipos.get(coluna, ("", ""))[0]
+        if tipo_coluna == "date":
+            return coluna, "date"
+        return coluna, "timestamp" if tipo_coluna in ("timestamp", "datetime") else "auto_increment"
+    # Timestamp atualizado em UPDATE captura linhas novas e alteradas
+    for nome, (tipo, extra) in tipos.items():
+        if tipo in ("timestamp", "datetime") and "on update" in extra:
+            return nome, "timestamp"
+    # Auto incremento captura apenas linhas novas
+    for nome, (tipo, extra) in tipos.items():
+        if "auto_increment" in extra:
+            return nome, "auto_increment"
+    return None, None
+
+def limite_watermark(conexao, tipo):
+    """
+    Limite superior fechado da exportação por data/hora: um segundo antes do
+    relógio do banco (ou ontem, em colunas DATE). Linhas gravadas depois têm
+    valor maior que ele, então salvar o limite como marca d'água não perde
+    nem repete linhas.
+    """
+    consulta = "SELECT CURDATE() - INTERVAL 1 DAY" if tipo == "date" else "SELECT NOW() - INTERVAL 1 SECOND"
+    with conexao.cursor() as cursor_limite:
+        cursor_limite.execute(consulta)
+        return cursor_limite.fetchone()[0]
+
+def existem_alteracoes(conexao, tabela, coluna, valor, limite):
+    """
+    Indica se há linhas com a marca d'água em (valor, limite], sem exportá-las
+    """
+    with conexao.cursor() as cursor_alteracoes:
+        cursor_alteracoes.execute(
+            f"SELECT 1 FROM `{tabela}` WHERE `{coluna}` > %s AND `{coluna}` <= %s LIMIT 1",
+            (valor, limite)
+        )
+        return cursor_alteracoes.fetchone() is not None
+
+def listar_deltas(tabela):
+    paginator = s3.get_paginator("list_objects_v2")
+    return [
+        obj["Key"]
+        for pagina in paginator.paginate(Bucket=BUCKET, Prefix=f"{tabela}/{tabela}_delta_")
+        for obj in pagina.get("Contents", [])
+    ]
+
+def compactar_tabela(tabela, conexao, coluna, limite=None):
+    """
+    Gera um novo snapshot {tabela}/{tabela}.csv e remove os deltas.
+    O snapshot é lido direto do banco em streaming, então já reflete
+    todas as alterações dos deltas (e também exclusões). Com limite, as
+    linhas acima dele ficam para o próximo delta.
+    """
+    deltas = listar_deltas(tabela)
+    if limite is None:
+        linhas, maximo = exportar_tabela_streaming(tabela, conexao, coluna_watermark=coluna)
+    else:
+        linhas, maximo = exportar_tabela_streaming(
+            tabela,
+            conexao,
+            filtro=f"WHERE `{coluna}` IS NULL OR `{coluna}` <= %s",
+            parametros=(limite,),
+            coluna_watermark=coluna
+        )
+    for i in range(0, len(deltas), 1000):
+        s3.delete_objects(
+            Bucket=BUCKET,
+            Delete={"Objects": [{"Key": key} for key in deltas[i:i + 1000]]}
+        )
+    print(f"{tabela}: snapshot compactado, {len(deltas)} deltas removidos")
+    return linhas, maximo
+
+def exportar_tabela_incremental(tabela, conexao, estado):
+    """
+    Exporta só as linhas acima da marca d'água salva como um novo arquivo
+    delta no prefixo da tabela, que a tabela do Glue já lê junto com o
+    snapshot. Só a marca auto_increment gera deltas: ela pega apenas linhas
+    novas. Na marca por data/hora (ON UPDATE) o delta repetiria as linhas
+    alteradas, que já estão no snapshot, e o Athena as leria duas vezes;
+    com alterações, o snapshot é refeito na mesma execução.
+    """
+    coluna, tipo = detectar_watermark(conexao, tabela)
+    anterior = estado.get(tabela)
+
+    if coluna is None:
+        print(f"{tabela}: sem coluna de marca d'água, exportando snapshot completo")
+        linhas, _ = exportar_tabela_streaming(tabela, conexao)
+        return linhas
+
+    # Em data/hora, várias linhas podem cair no mesmo segundo da marca: cada
+    # exportação vai de (marca anterior, limite] e salva o limite como marca
+    limite = limite_watermark(conexao, tipo) if tipo in ("timestamp", "date") else None
+
+    if anterior is None or anterior.get("coluna") != coluna or anterior.get("valor") is None \
+            or anterior.get("partes", 0) >= COMPACTAR_APOS_PARTES:
+        linhas, maximo = compactar_tabela(tabela, conexao, coluna, limite)
+        partes = 0
+    elif limite is not None:
+        if existem_alteracoes(conexao, tabela, coluna, anterior["valor"], limite):
+            linhas, maximo = compactar_tabela(tabela, conexao, coluna, limite)
+        else:
+            linhas, maximo = 0, None
+            print(f"{tabela}: nenhuma linha nova")
+        partes = 0
+    else:
+        key = f"{tabela}/{tabela}_delta_{datetime.now():%Y%m%dT%H%M%S%f}.csv"
+        linhas, maximo = exportar_tabela_streaming(
+            tabela,
+            conexao,
+            key=key,
+            filtro=f"WHERE `{coluna}` > %s ORDER BY `{coluna}`",
+            parametros=(anterior["valor"],),
+            coluna_watermark=coluna
+        )
+        if linhas == 0:
+            s3.delete_object(Bucket=BUCKET, Key=key)
+            print(f"{tabela}: nenhuma linha nova")
+        partes = anterior.get("partes", 0) + (1 if linhas else 0)
+        if maximo is None:
+            maximo = anterior["valor"]
+
+    if limite is not None:
+        maximo = limite
+
+    estado[tabela] = {
+        "coluna": coluna,
+        "tipo": tipo,
+        "valor": str(maximo) if hasattr(maximo, "isoformat") else maximo,
+        "partes": partes,
+        "atualizado_em": datetime.now().isoformat()
+    }
+    return linhas
+
+def exportar_tabela(tabela, conexao, estado=None):
+    """
+    Cria o prefixo da tabela no S3, exporta e mede o tempo
+    """
+    print(f"Exportando {tabela}...")
+    inicio = time.perf_counter()
+    prefix = f"{tabela}/"  
+    
+    s3.put_object(
+        Bucket=BUCKET,
+        Key=prefix  # cria o prefixo
+    )
+    
+    print(f"Pasta criada (prefixo): {prefix}")
+
+    try:
+        if EXPORTACAO_INCREMENTAL and estado is not None:
+            linhas = exportar_tabela_incremental(tabela, conexao, estado)
+        elif EXPORTACAO_STREAMING:
+            linhas, _ = exportar_tabela_streaming(tabela, conexao)
+        else:
+            linhas = exportar_tabela_pandas(tabela, conexao)
+        status = "ok"
+    except Exception as e:
+        print(f"Erro ao exportar {tabela}: {e}")
+        linhas = 0
+        status = f"erro: {e}"
+
+    return {
+        "tabela": tabela,
+        "linhas": linhas,
+        "segundos": time.perf_counter() - inicio,
+        "status": status
+    }
+
+def exportar_em_paralelo(tabelas, estado=None):
+    """
+    Exporta as tabelas com no máximo EXPORTACAO_WORKERS ao mesmo tempo
+    """
+    pool = PoolConexoes(min(EXPORTACAO_WORKERS, len(tabelas)))
+
+    def tarefa(tabela):
+        with pool.conexao() as conexao:
+            # Cada tarefa só altera a entrada da própria tabela no estado
+            return exportar_tabela(tabela, conexao, estado)
+
+    resultados = []
+    try:
+        with ThreadPoolExecutor(max_workers=EXPORTACAO_WORKERS) as executor:
+            # Submetidas em ordem de tamanho: o executor inicia as maiores primeiro
+            futuros = [executor.submit(tarefa, tabela) for tabela in tabelas]
+            for futuro in as_completed(futuros):
+                resultados.append(futuro.result())
+    finally:
+        pool.fechar()
+    return resultados
+
+def imprimir_relatorio(resultados, duracao_total):
+    print("\nTempo por tabela:")
+    print(f"{'tabela':<30} {'linhas':>12} {'segundos':>10}  status")
+    for r in sorted(resultados, key=lambda r: r["segundos"], reverse=True):
+        print(f"{r['tabela']:<30} {r['linhas']:>12} {r['segundos']:>10.2f}  {r['status']}")
+    soma = sum(r["segundos"] for r in resultados)
+    print(f"\nTempo total: {duracao_total:.2f}s (soma das tabelas: {soma:.2f}s)")
+
+conn = criar_conexao()
 
 cursor = conn.cursor()
 
@@ -68,31 +468,19 @@ s3.upload_file(csv_local2, BUCKET, nome_no_s3_2)
 # ----------------------------
 # EXPORTAR DO MYSQL E ENVIAR PARA S3
 # ----------------------------
-for tabela in tabelas:
-    print(f"Exportando {tabela}...")
-    prefix = f"{tabela}/"  
-    
-    s3.put_object(
-        Bucket=BUCKET,
-        Key=prefix  # cria o prefixo
-    )
-    
-    print(f"Pasta criada (prefixo): {prefix}")
+inicio_exportacao = time.perf_counter()
+estado_exportacao = carregar_estado_exportacao() if EXPORTACAO_INCREMENTAL else None
 
-    # Exporta SELECT *
-    df = pd.read_sql(f"SELECT * FROM {tabela}", conn)
+if EXPORTACAO_PARALELA and tabelas:
+    resultados = exportar_em_paralelo(tabelas_por_tamanho(conn, tabelas), estado_exportacao)
+else:
+    resultados = [exportar_tabela(tabela, conn, estado_exportacao) for tabela in tabelas]
 
-    # Gera arquivo CSV local
-    nome_csv = f"{tabela}.csv"
-    df.to_csv(nome_csv, index=False, sep=";")
-
-    print(f"Enviando {nome_csv} para S3...")
+# A marca d'água só avança para as tabelas exportadas com sucesso
+if estado_exportacao is not None:
+    salvar_estado_exportacao(estado_exportacao)
 
-    # Envia para o bucket/pasta no S3
-    s3.upload_file(nome_csv, BUCKET, f"{tabela}/{nome_csv}")
-
-    # Remover CSV local (opcional)
-    os.remove(nome_csv)
+imprimir_relatorio(resultados, time.perf_counter() - inicio_exportacao)
 
 cursor.close()
 conn.close()
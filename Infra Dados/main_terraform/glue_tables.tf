@@ -59,6 +59,548 @@ resource "aws_glue_catalog_table" "weather_data_from_stations" {
   }
 }
 
+variable "estacoes_meteorologicas" {
+  description = "Estações mantidas pela Lambda trusted e presentes nas partições parquet (projeção do Athena)"
+  type        = list(string)
+  default     = ["A701", "A771"]
+}
+
+resource "aws_glue_catalog_table" "weather_trusted_parquet" {
+  name          = "weather_trusted_parquet"
+  database_name = aws_glue_catalog_database.venuste_db.name
+  table_type    = "EXTERNAL_TABLE"
+  description   = "Dados meteorológicos diários da camada trusted em parquet particionado"
+
+  partition_keys {
+    name = "estacao"
+    type = "string"
+  }
+
+  partition_keys {
+    name = "ano"
+    type = "int"
+  }
+
+  partition_keys {
+    name = "mes"
+    type = "int"
+  }
+
+  storage_descriptor {
+    location      = "s3://bucket-trusted-g3-venuste-v2/weather_parquet/"
+    input_format  = "org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat"
+    output_format = "org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat"
+
+    ser_de_info {
+      name                  = "weather_trusted_parquet"
+      serialization_library = "org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe"
+    }
+
+    columns {
+      name = "timestamp"
+      type = "timestamp"
+    }
+
+    columns {
+      name = "temperatura"
+      type = "double"
+    }
+
+    columns {
+      name = "precipitacao"
+      type = "double"
+    }
+
+    columns {
+      name = "radiacao"
+      type = "double"
+    }
+
+    columns {
+      name = "umidade"
+      type = "double"
+    }
+
+    columns {
+      name = "velocidade_vento"
+      type = "double"
+    }
+  }
+
+  parameters = {
+    EXTERNAL                        = "TRUE"
+    "classification"                = "parquet"
+    "projection.enabled"            = "true"
+    "projection.estacao.type"       = "enum"
+    "projection.estacao.values"     = join(",", var.estacoes_meteorologicas)
+    "projection.ano.type"           = "integer"
+    "projection.ano.range"          = "2000,2100"
+    "projection.mes.type"           = "integer"
+    "projection.mes.range"          = "1,12"
+    "storage.location.template"     = "s3://bucket-trusted-g3-venuste-v2/weather_parquet/estacao=$${estacao}/ano=$${ano}/mes=$${mes}/"
+  }
+}
+
+resource "aws_glue_catalog_table" "weather_quarentena" {
+  name          = "weather_quarentena"
+  database_name = aws_glue_catalog_database.venuste_db.name
+  table_type    = "EXTERNAL_TABLE"
+  description   = "Linhas rejeitadas pela validação de qualidade da Lambda trusted, com os códigos dos motivos"
+
+  storage_descriptor {
+    location      = "s3://bucket-trusted-g3-venuste-v2/quarentena/"
+    input_format  = "org.apache.hadoop.mapred.TextInputFormat"
+    output_format = "org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat"
+
+    ser_de_info {
+      name                  = "weather_quarentena"
+      serialization_library = "org.apache.hadoop.hive.serde2.lazy.LazySimpleSerDe"
+      parameters = {
+        "field.delim"          = ";"
+        "serialization.format" = ";"
+        "line.delim"           = "\n"
+      }
+    }
+
+    columns {
+      name = "timestamp"
+      type = "string"
+    }
+
+    columns {
+      name = "temperatura"
+      type = "double"
+    }
+
+    columns {
+      name = "precipitacao"
+      type = "double"
+    }
+
+    columns {
+      name = "radiacao"
+      type = "double"
+    }
+
+    columns {
+      name = "umidade"
+      type = "double"
+    }
+
+    columns {
+      name = "velocidade_vento"
+      type = "double"
+    }
+
+    columns {
+      name = "estacao"
+      type = "string"
+    }
+
+    columns {
+      name = "motivos"
+      type = "string"
+    }
+  }
+
+  parameters = {
+    EXTERNAL                 = "TRUE"
+    "classification"         = "csv"
+    "typeOfData"             = "file"
+    "compressionType"        = "gzip"
+    "skip.header.line.count" = "1"
+  }
+}
+
+resource "aws_glue_catalog_table" "weather_data_from_stations_parquet" {
+  name          = "weather_data_from_stations_parquet"
+  database_name = aws_glue_catalog_database.venuste_db.name
+  table_type    = "EXTERNAL_TABLE"
+  description   = "Médias mensais de temperatura por estação em parquet particionado"
+
+  partition_keys {
+    name = "estacao"
+    type = "string"
+  }
+
+  partition_keys {
+    name = "ano"
+    type = "int"
+  }
+
+  storage_descriptor {
+    location      = "s3://bucket-client-g3-venuste-v2/weather_parquet/"
+    input_format  = "org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat"
+    output_format = "org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat"
+
+    ser_de_info {
+      name                  = "weather_data_from_stations_parquet"
+      serialization_library = "org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe"
+    }
+
+    columns {
+      name = "data"
+      type = "timestamp"
+    }
+
+    columns {
+      name = "mes"
+      type = "int"
+    }
+
+    columns {
+      name = "nome_mes"
+      type = "string"
+    }
+
+    columns {
+      name = "temperatura_media"
+      type = "double"
+    }
+  }
+
+  parameters = {
+    EXTERNAL                        = "TRUE"
+    "classification"                = "parquet"
+    "projection.enabled"            = "true"
+    "projection.estacao.type"       = "enum"
+    "projection.estacao.values"     = join(",", var.estacoes_meteorologicas)
+    "projection.ano.type"           = "integer"
+    "projection.ano.range"          = "2000,2100"
+    "storage.location.template"     = "s3://bucket-client-g3-venuste-v2/weather_parquet/estacao=$${estacao}/ano=$${ano}/"
+  }
+}
+
+variable "granularidades_rollup" {
+  description = "Granularidades do cubo de agregados gravadas pela Lambda client, uma tabela cada"
+  type        = list(string)
+  default     = ["diario", "semanal", "mensal", "anual"]
+}
+
+locals {
+  # Média, mínimo, máximo, soma e contagem de cada métrica, na ordem gravada pela Lambda
+  colunas_rollup = flatten([
+    for metrica in ["temperatura", "precipitacao", "radiacao", "umidade", "velocidade_vento"] : [
+      for estatistica in ["media", "minimo", "maximo", "soma", "contagem"] : {
+        nome = "${metrica}_${estatistica}"
+        tipo = estatistica == "contagem" ? "bigint" : "double"
+      }
+    ]
+  ])
+}
+
+resource "aws_glue_catalog_table" "weather_rollup" {
+  for_each      = toset(var.granularidades_rollup)
+  name          = "weather_rollup_${each.key}"
+  database_name = aws_glue_catalog_database.venuste_db.name
+  table_type    = "EXTERNAL_TABLE"
+  description   = "Agregados ${each.key} de todas as métricas por estação (periodo = primeiro dia do período)"
+
+  storage_descriptor {
+    location      = "s3://bucket-client-g3-venuste-v2/rollup/${each.key}/"
+    input_format  = "org.apache.hadoop.mapred.TextInputFormat"
+    output_format = "org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat"
+
+    ser_de_info {
+      name                  = "weather_rollup_${each.key}"
+      serialization_library = "org.apache.hadoop.hive.serde2.lazy.LazySimpleSerDe"
+      parameters = {
+        "field.delim"          = ";"
+        "serialization.format" = ";"
+        "line.delim"           = "\n"
+      }
+    }
+
+    columns {
+      name = "estacao"
+      type = "string"
+    }
+
+    columns {
+      name = "periodo"
+      type = "string"
+    }
+
+    columns {
+      name = "ano"
+      type = "int"
+    }
+
+    dynamic "columns" {
+      for_each = local.colunas_rollup
+      content {
+        name = columns.value.nome
+        type = columns.value.tipo
+      }
+    }
+  }
+
+  parameters = {
+    EXTERNAL                 = "TRUE"
+    "classification"         = "csv"
+    "typeOfData"             = "file"
+    "compressionType"        = "none"
+    "skip.header.line.count" = "1"
+  }
+}
+
+resource "aws_glue_catalog_table" "weather_rollup_parquet" {
+  for_each      = toset(var.granularidades_rollup)
+  name          = "weather_rollup_${each.key}_parquet"
+  database_name = aws_glue_catalog_database.venuste_db.name
+  table_type    = "EXTERNAL_TABLE"
+  description   = "Agregados ${each.key} de todas as métricas por estação em parquet particionado"
+
+  partition_keys {
+    name = "estacao"
+    type = "string"
+  }
+
+  partition_keys {
+    name = "ano"
+    type = "int"
+  }
+
+  storage_descriptor {
+    location      = "s3://bucket-client-g3-venuste-v2/rollup_parquet/${each.key}/"
+    input_format  = "org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat"
+    output_format = "org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat"
+
+    ser_de_info {
+      name                  = "weather_rollup_${each.key}_parquet"
+      serialization_library = "org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe"
+    }
+
+    columns {
+      name = "periodo"
+      type = "timestamp"
+    }
+
+    dynamic "columns" {
+      for_each = local.colunas_rollup
+      content {
+        name = columns.value.nome
+        type = columns.value.tipo
+      }
+    }
+  }
+
+  parameters = {
+    EXTERNAL                    = "TRUE"
+    "classification"            = "parquet"
+    "projection.enabled"        = "true"
+    "projection.estacao.type"   = "enum"
+    "projection.estacao.values" = join(",", var.estacoes_meteorologicas)
+    "projection.ano.type"       = "integer"
+    "projection.ano.range"      = "2000,2100"
+    "storage.location.template" = "s3://bucket-client-g3-venuste-v2/rollup_parquet/${each.key}/estacao=$${estacao}/ano=$${ano}/"
+  }
+}
+
+resource "aws_glue_catalog_table" "comentarios_clima" {
+  name          = "comentarios_clima"
+  database_name = aws_glue_catalog_database.venuste_db.name
+  table_type    = "EXTERNAL_TABLE"
+  description   = "Comentários de clientes com a leitura diária de clima anterior mais próxima, por estação"
+
+  storage_descriptor {
+    location      = "s3://bucket-client-g3-venuste-v2/comentarios_clima/"
+    input_format  = "org.apache.hadoop.mapred.TextInputFormat"
+    output_format = "org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat"
+
+    ser_de_info {
+      name                  = "comentarios_clima"
+      serialization_library = "org.apache.hadoop.hive.serde2.lazy.LazySimpleSerDe"
+      parameters = {
+        "field.delim"          = ";"
+        "serialization.format" = ";"
+        "line.delim"           = "\n"
+      }
+    }
+
+    columns {
+      name = "comment_id"
+      type = "int"
+    }
+
+    columns {
+      name = "comment_user_id"
+      type = "int"
+    }
+
+    columns {
+      name = "comment_username"
+      type = "string"
+    }
+
+    columns {
+      name = "comment_text"
+      type = "string"
+    }
+
+    columns {
+      name = "comment_created_at"
+      type = "string"
+    }
+
+    columns {
+      name = "estacao"
+      type = "string"
+    }
+
+    columns {
+      name = "data_clima"
+      type = "string"
+    }
+
+    columns {
+      name = "temperatura"
+      type = "double"
+    }
+
+    columns {
+      name = "precipitacao"
+      type = "double"
+    }
+
+    columns {
+      name = "umidade"
+      type = "double"
+    }
+  }
+
+  parameters = {
+    EXTERNAL                 = "TRUE"
+    "classification"         = "csv"
+    "typeOfData"             = "file"
+    "compressionType"        = "none"
+    "skip.header.line.count" = "1"
+  }
+}
+
+resource "aws_glue_catalog_table" "comentarios_clima_parquet" {
+  name          = "comentarios_clima_parquet"
+  database_name = aws_glue_catalog_database.venuste_db.name
+  table_type    = "EXTERNAL_TABLE"
+  description   = "Comentários enriquecidos com o clima em parquet particionado por estação"
+
+  partition_keys {
+    name = "estacao"
+    type = "string"
+  }
+
+  storage_descriptor {
+    location      = "s3://bucket-client-g3-venuste-v2/comentarios_clima_parquet/"
+    input_format  = "org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat"
+    output_format = "org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat"
+
+    ser_de_info {
+      name                  = "comentarios_clima_parquet"
+      serialization_library = "org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe"
+    }
+
+    columns {
+      name = "comment_id"
+      type = "bigint"
+    }
+
+    columns {
+      name = "comment_user_id"
+      type = "bigint"
+    }
+
+    columns {
+      name = "comment_username"
+      type = "string"
+    }
+
+    columns {
+      name = "comment_text"
+      type = "string"
+    }
+
+    columns {
+      name = "comment_created_at"
+      type = "timestamp"
+    }
+
+    columns {
+      name = "data_clima"
+      type = "timestamp"
+    }
+
+    columns {
+      name = "temperatura"
+      type = "double"
+    }
+
+    columns {
+      name = "precipitacao"
+      type = "double"
+    }
+
+    columns {
+      name = "umidade"
+      type = "double"
+    }
+  }
+
+  parameters = {
+    EXTERNAL                    = "TRUE"
+    "classification"            = "parquet"
+    "projection.enabled"        = "true"
+    "projection.estacao.type"   = "enum"
+    "projection.estacao.values" = join(",", var.estacoes_meteorologicas)
+    "storage.location.template" = "s3://bucket-client-g3-venuste-v2/comentarios_clima_parquet/estacao=$${estacao}/"
+  }
+}
+
+resource "aws_glue_catalog_table" "comentarios_termos" {
+  name          = "comentarios_termos"
+  database_name = aws_glue_catalog_database.venuste_db.name
+  table_type    = "EXTERNAL_TABLE"
+  description   = "Frequência dos termos do índice invertido dos comentários"
+
+  storage_descriptor {
+    location      = "s3://bucket-client-g3-venuste-v2/indice_comentarios/frequencia/"
+    input_format  = "org.apache.hadoop.mapred.TextInputFormat"
+    output_format = "org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat"
+
+    ser_de_info {
+      name                  = "comentarios_termos"
+      serialization_library = "org.apache.hadoop.hive.serde2.lazy.LazySimpleSerDe"
+      parameters = {
+        "field.delim"          = ";"
+        "serialization.format" = ";"
+        "line.delim"           = "\n"
+      }
+    }
+
+    columns {
+      name = "termo"
+      type = "string"
+    }
+
+    columns {
+      name = "documentos"
+      type = "int"
+    }
+
+    columns {
+      name = "ocorrencias"
+      type = "int"
+    }
+  }
+
+  parameters = {
+    EXTERNAL                 = "TRUE"
+    "classification"         = "csv"
+    "typeOfData"             = "file"
+    "compressionType"        = "none"
+    "skip.header.line.count" = "1"
+  }
+}
+
 resource "aws_glue_catalog_table" "comentarios_clientes" {
   name          = "comentarios_clientes"
   database_name = aws_glue_catalog_database.venuste_db.name
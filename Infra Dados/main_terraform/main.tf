@@ -44,6 +44,72 @@ variable "environment" {
   default     = "dev"
 }
 
+variable "formato_data_lake" {
+  description = "Formato das camadas trusted e client gerado pelas Lambdas (csv ou parquet)"
+  type        = string
+  default     = "csv"
+}
+
+variable "compressao_parquet" {
+  description = "Compressão dos arquivos parquet (snappy ou zstd)"
+  type        = string
+  default     = "snappy"
+}
+
+variable "pipeline_fundido" {
+  description = "A Lambda trusted também gera o client em memória; desativa o gatilho do bucket trusted"
+  type        = bool
+  default     = false
+}
+
+variable "agregacao_incremental" {
+  description = "Atualiza as médias mensais do client a partir de um estado no S3 (cada execução relê e regrava o estado e recalcula todo o histórico)"
+  type        = bool
+  default     = false
+}
+
+variable "caminho_leve" {
+  description = "A Lambda trusted processa arquivos pequenos só com o módulo csv, sem importar pandas"
+  type        = bool
+  default     = true
+}
+
+variable "transformacao_enxuta" {
+  description = "A Lambda trusted transforma o raw num único DataFrame, com medições em float32 (menos memória)"
+  type        = bool
+  default     = false
+}
+
+variable "coalescer_notificacoes" {
+  description = "As notificações dos buckets raw e trusted passam por filas SQS e chegam às Lambdas em lotes"
+  type        = bool
+  default     = true
+}
+
+variable "janela_coalescencia_segundos" {
+  description = "Tempo máximo que a fila acumula notificações antes de invocar a Lambda (0 a 300)"
+  type        = number
+  default     = 20
+}
+
+variable "tamanho_lote_notificacoes" {
+  description = "Máximo de notificações entregues em uma única invocação; o lote inteiro precisa caber no timeout das Lambdas"
+  type        = number
+  default     = 25
+}
+
+variable "timeout_lambdas_dados" {
+  description = "Timeout em segundos das Lambdas trusted e client, abaixo da visibilidade de 300 s das filas"
+  type        = number
+  default     = 240
+}
+
+variable "memoria_lambdas_dados" {
+  description = "Memória em MB das Lambdas trusted e client (a CPU da Lambda cresce junto com a memória)"
+  type        = number
+  default     = 1024
+}
+
 # variable "vpc_cidr" {
 #   description = "CIDR block para a VPC"
 #   type        = string
@@ -410,7 +476,9 @@ variable "environment" {
 
 data "archive_file" "lambda_zip" {
   type        = "zip"
-  source_file = "../lambda_python/tratamento_base.py"
+  # O pipeline fundido importa tratamento_para_client.py, então vão os dois módulos
+  source_dir  = "../lambda_python"
+  excludes    = ["__pycache__"]
   output_path = "lambda_tratamento_base.zip"
 }
 
@@ -420,8 +488,23 @@ resource "aws_lambda_function" "minha_funcao_lambda" {
   runtime       = "python3.9"
   role          = data.aws_iam_role.lab_role.arn
   filename      = data.archive_file.lambda_zip.output_path
+  timeout       = var.timeout_lambdas_dados
+  memory_size   = var.memoria_lambdas_dados
 
   source_code_hash = data.archive_file.lambda_zip.output_base64sha256
+
+  environment {
+    variables = {
+      FORMATO_SAIDA         = var.formato_data_lake
+      COMPRESSAO_PARQUET    = var.compressao_parquet
+      MODO_FUNDIDO          = tostring(var.pipeline_fundido)
+      MODO_INCREMENTAL      = tostring(var.agregacao_incremental)
+      CAMINHO_LEVE          = tostring(var.caminho_leve)
+      MODO_ENXUTO           = tostring(var.transformacao_enxuta)
+      ESTACOES              = join(",", var.estacoes_meteorologicas)
+      GRANULARIDADES_ROLLUP = join(",", var.granularidades_rollup)
+    }
+  }
 }
 
 # -----------------------------------------------------
@@ -435,18 +518,114 @@ resource "aws_lambda_permission" "allow_s3_invoke" {
   source_arn    = "arn:aws:s3:::bucket-raw-g3-venuste-v2"
 }
 
+# -----------------------------------------------------
+# FILAS DE NOTIFICAÇÃO (coalescência dos eventos)
+# -----------------------------------------------------
+# Uploads em rajada geram uma notificação por objeto. Com as filas, as
+# notificações se acumulam pela janela configurada e cada invocação recebe
+# o lote inteiro: objetos repetidos são processados uma vez e, no modo com
+# estado, o estado e o CSV client são gravados uma vez por lote.
+locals {
+  buckets_notificados = {
+    raw     = "bucket-raw-g3-venuste-v2"
+    trusted = "bucket-trusted-g3-venuste-v2"
+  }
+  # No pipeline fundido o bucket trusted não dispara nada, então não tem fila
+  filas_notificacoes = {
+    for nome, bucket in local.buckets_notificados : nome => bucket
+    if var.coalescer_notificacoes && !(nome == "trusted" && var.pipeline_fundido)
+  }
+
+  # Filtros do gatilho do bucket trusted: CSVs ou o marcador _SUCCESS do parquet.
+  # O S3 recusa regras que se sobrepõem, então o marcador tem sufixo próprio
+  # (.success) em vez de só o prefixo, que também casaria com o sufixo .csv
+  filtros_trusted = {
+    csv     = { prefixo = null, sufixo = ".csv" }
+    parquet = { prefixo = "weather_parquet/_SUCCESS/", sufixo = ".success" }
+  }
+}
+
+resource "aws_sqs_queue" "notificacoes_dlq" {
+  count                     = var.coalescer_notificacoes ? 1 : 0
+  name                      = "fila-notificacoes-dlq-grupo3"
+  message_retention_seconds = 1209600
+}
+
+resource "aws_sqs_queue" "notificacoes" {
+  for_each = local.filas_notificacoes
+  name     = "fila-notificacoes-${each.key}-grupo3"
+
+  # Maior que o timeout das Lambdas, para a mensagem não voltar à fila
+  # enquanto o lote ainda está sendo processado
+  visibility_timeout_seconds = 300
+
+  # Mensagens que falham repetidamente vão para a DLQ em vez de voltar sempre
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.notificacoes_dlq[0].arn
+    maxReceiveCount     = 5
+  })
+}
+
+resource "aws_sqs_queue_policy" "notificacoes" {
+  for_each  = local.filas_notificacoes
+  queue_url = aws_sqs_queue.notificacoes[each.key].id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [{
+      Effect    = "Allow"
+      Principal = { Service = "s3.amazonaws.com" }
+      Action    = "sqs:SendMessage"
+      Resource  = aws_sqs_queue.notificacoes[each.key].arn
+      Condition = { ArnEquals = { "aws:SourceArn" = "arn:aws:s3:::${each.value}" } }
+    }]
+  })
+}
+
+resource "aws_lambda_event_source_mapping" "notificacoes_raw" {
+  count            = var.coalescer_notificacoes ? 1 : 0
+  event_source_arn = aws_sqs_queue.notificacoes["raw"].arn
+  function_name    = aws_lambda_function.minha_funcao_lambda.arn
+
+  batch_size                         = var.tamanho_lote_notificacoes
+  maximum_batching_window_in_seconds = var.janela_coalescencia_segundos
+  # Só as mensagens dos objetos que falharam voltam para a fila
+  function_response_types = ["ReportBatchItemFailures"]
+}
+
+resource "aws_lambda_event_source_mapping" "notificacoes_trusted" {
+  count            = var.coalescer_notificacoes && !var.pipeline_fundido ? 1 : 0
+  event_source_arn = aws_sqs_queue.notificacoes["trusted"].arn
+  function_name    = aws_lambda_function.monthly_averages_lambda.arn
+
+  batch_size                         = var.tamanho_lote_notificacoes
+  maximum_batching_window_in_seconds = var.janela_coalescencia_segundos
+  function_response_types            = ["ReportBatchItemFailures"]
+}
+
 # -----------------------------------------------------
 # NOTIFICAÇÃO DO BUCKET (gatilho)
 # -----------------------------------------------------
 resource "aws_s3_bucket_notification" "raw_notification" {
   bucket = "bucket-raw-g3-venuste-v2"
 
-  lambda_function {
-    lambda_function_arn = aws_lambda_function.minha_funcao_lambda.arn
-    events              = ["s3:ObjectCreated:*"] 
+  dynamic "lambda_function" {
+    for_each = var.coalescer_notificacoes ? [] : [1]
+    content {
+      lambda_function_arn = aws_lambda_function.minha_funcao_lambda.arn
+      events              = ["s3:ObjectCreated:*"]
+    }
   }
 
-  depends_on = [aws_lambda_permission.allow_s3_invoke, aws_s3_bucket.buckets_data_lake]
+  dynamic "queue" {
+    for_each = var.coalescer_notificacoes ? [1] : []
+    content {
+      queue_arn = aws_sqs_queue.notificacoes["raw"].arn
+      events    = ["s3:ObjectCreated:*"]
+    }
+  }
+
+  depends_on = [aws_lambda_permission.allow_s3_invoke, aws_s3_bucket.buckets_data_lake, aws_sqs_queue_policy.notificacoes]
 }
 
 # -----------------------------------------------------
@@ -454,8 +633,30 @@ resource "aws_s3_bucket_notification" "raw_notification" {
 # -----------------------------------------------------
 data "archive_file" "lambda_monthly_avg_zip" {
   type        = "zip"
-  source_file = "../lambda_python/tratamento_para_client.py"
   output_path = "lambda_tratamento_para_client.zip"
+
+  source {
+    content  = file("../lambda_python/tratamento_para_client.py")
+    filename = "tratamento_para_client.py"
+  }
+
+  # Esquema das camadas compartilhado com a Lambda trusted
+  source {
+    content  = file("../lambda_python/esquema_weather.py")
+    filename = "esquema_weather.py"
+  }
+
+  # Backend de armazenamento (S3 na AWS)
+  source {
+    content  = file("../lambda_python/armazenamento.py")
+    filename = "armazenamento.py"
+  }
+
+  # Métricas, upload multipart e leitura dos eventos, comuns às Lambdas
+  source {
+    content  = file("../lambda_python/comum_lambdas.py")
+    filename = "comum_lambdas.py"
+  }
 }
 
 resource "aws_lambda_function" "monthly_averages_lambda" {
@@ -464,7 +665,19 @@ resource "aws_lambda_function" "monthly_averages_lambda" {
   runtime       = "python3.9"
   role          = data.aws_iam_role.lab_role.arn
   filename      = data.archive_file.lambda_monthly_avg_zip.output_path
+  timeout       = var.timeout_lambdas_dados
+  memory_size   = var.memoria_lambdas_dados
   source_code_hash = data.archive_file.lambda_monthly_avg_zip.output_base64sha256
+
+  environment {
+    variables = {
+      FORMATO_ENTRADA       = var.formato_data_lake
+      FORMATO_SAIDA         = var.formato_data_lake
+      COMPRESSAO_PARQUET    = var.compressao_parquet
+      MODO_INCREMENTAL      = tostring(var.agregacao_incremental)
+      GRANULARIDADES_ROLLUP = join(",", var.granularidades_rollup)
+    }
+  }
 }
 
 # -----------------------------------------------------
@@ -482,15 +695,128 @@ resource "aws_lambda_permission" "allow_s3_invoke_monthly_avg" {
 # NOTIFICAÇÃO DO BUCKET (gatilho)
 # -----------------------------------------------------
 resource "aws_s3_bucket_notification" "trusted_notification" {
+  # No pipeline fundido o client já é gerado pela Lambda trusted
+  count  = var.pipeline_fundido ? 0 : 1
   bucket = "bucket-trusted-g3-venuste-v2"
-  
-  lambda_function {
-    lambda_function_arn = aws_lambda_function.monthly_averages_lambda.arn
-    events              = ["s3:ObjectCreated:*"]
-    filter_suffix       = ".csv"  # Opcional: apenas arquivos CSV
+
+  # No modo parquet a Lambda trusted grava várias partições e por último
+  # o marcador _SUCCESS/<arquivo>.success; só ele dispara o cálculo das médias
+  dynamic "lambda_function" {
+    for_each = { for nome, filtro in local.filtros_trusted : nome => filtro if !var.coalescer_notificacoes }
+    content {
+      lambda_function_arn = aws_lambda_function.monthly_averages_lambda.arn
+      events              = ["s3:ObjectCreated:*"]
+      filter_prefix       = lambda_function.value.prefixo
+      filter_suffix       = lambda_function.value.sufixo
+    }
+  }
+
+  dynamic "queue" {
+    for_each = { for nome, filtro in local.filtros_trusted : nome => filtro if var.coalescer_notificacoes }
+    content {
+      queue_arn     = aws_sqs_queue.notificacoes["trusted"].arn
+      events        = ["s3:ObjectCreated:*"]
+      filter_prefix = queue.value.prefixo
+      filter_suffix = queue.value.sufixo
+    }
+  }
+
+  depends_on = [aws_lambda_permission.allow_s3_invoke_monthly_avg, aws_sqs_queue_policy.notificacoes]
+}
+
+# -----------------------------------------------------
+# FUNÇÃO LAMBDA - COMENTÁRIOS ENRIQUECIDOS COM O CLIMA
+# -----------------------------------------------------
+data "archive_file" "lambda_enriquecimento_zip" {
+  type        = "zip"
+  output_path = "lambda_enriquecimento_comentarios.zip"
+
+  source {
+    content  = file("../lambda_python/enriquecimento_comentarios.py")
+    filename = "enriquecimento_comentarios.py"
+  }
+
+  source {
+    content  = file("../lambda_python/indice_comentarios.py")
+    filename = "indice_comentarios.py"
+  }
+
+  # Reaproveita o acesso ao S3, as métricas e a gravação da Lambda client
+  source {
+    content  = file("../lambda_python/tratamento_para_client.py")
+    filename = "tratamento_para_client.py"
+  }
+
+  source {
+    content  = file("../lambda_python/esquema_weather.py")
+    filename = "esquema_weather.py"
   }
-  
-  depends_on = [aws_lambda_permission.allow_s3_invoke_monthly_avg]
+
+  # Backend de armazenamento (S3 na AWS)
+  source {
+    content  = file("../lambda_python/armazenamento.py")
+    filename = "armazenamento.py"
+  }
+
+  # Métricas, upload multipart e leitura dos eventos, comuns às Lambdas
+  source {
+    content  = file("../lambda_python/comum_lambdas.py")
+    filename = "comum_lambdas.py"
+  }
+}
+
+resource "aws_lambda_function" "enriquecimento_comentarios_lambda" {
+  function_name    = "funcao-enriquecimento-comentarios-grupo3"
+  handler          = "enriquecimento_comentarios.lambda_handler"
+  runtime          = "python3.9"
+  role             = data.aws_iam_role.lab_role.arn
+  filename         = data.archive_file.lambda_enriquecimento_zip.output_path
+  source_code_hash = data.archive_file.lambda_enriquecimento_zip.output_base64sha256
+  # Lê todos os comentários e o clima diário a cada execução
+  timeout          = 120
+
+  environment {
+    variables = {
+      FORMATO_ENTRADA       = var.formato_data_lake
+      FORMATO_SAIDA         = var.formato_data_lake
+      COMPRESSAO_PARQUET    = var.compressao_parquet
+      ESTACOES              = join(",", var.estacoes_meteorologicas)
+      TOLERANCIA_DIAS_CLIMA = "7"
+      INDEXAR_COMENTARIOS   = "true"
+    }
+  }
+}
+
+resource "aws_lambda_permission" "allow_s3_invoke_enriquecimento" {
+  statement_id  = "AllowExecutionFromS3Client"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.enriquecimento_comentarios_lambda.function_name
+  principal     = "s3.amazonaws.com"
+  source_arn    = "arn:aws:s3:::bucket-client-g3-venuste-v2"
+}
+
+# Novos comentários ou uma nova versão do rollup refazem o enriquecimento
+# e o índice de termos. O rollup dispara só pelo marcador _SUCCESS/<arquivo>.success,
+# gravado pela Lambda client depois de todas as partições, e não a cada
+# objeto; as saídas (comentarios_clima/, indice_comentarios/) não disparam a Lambda
+resource "aws_s3_bucket_notification" "client_notification" {
+  bucket = "bucket-client-g3-venuste-v2"
+
+  dynamic "lambda_function" {
+    for_each = {
+      comentarios    = { prefixo = "comentarios/", sufixo = null }
+      rollup         = { prefixo = "rollup/_SUCCESS/", sufixo = ".success" }
+      rollup_parquet = { prefixo = "rollup_parquet/_SUCCESS/", sufixo = ".success" }
+    }
+    content {
+      lambda_function_arn = aws_lambda_function.enriquecimento_comentarios_lambda.arn
+      events              = ["s3:ObjectCreated:*"]
+      filter_prefix       = lambda_function.value.prefixo
+      filter_suffix       = lambda_function.value.sufixo
+    }
+  }
+
+  depends_on = [aws_lambda_permission.allow_s3_invoke_enriquecimento, aws_s3_bucket.buckets_data_lake]
 }
 
 # -----------------------------------------------------